@@ -1,23 +1,25 @@
+from datetime import datetime
 import matplotlib.pyplot as plt
-from models import Session, Kline
+from models import Session, engine, init_db
+from kline_archive import load_history
 
 
-def plot_symbol_history(symbol: str):
+def plot_symbol_history(symbol: str, interval: str = None):
     """
     Извлекает данные свечей из БД для указанного символа и строит график изменения цены закрытия.
     """
     session = Session()
-    # Получаем данные отсортированные по времени открытия
-    klines = session.query(Kline).filter_by(symbol=symbol).order_by(Kline.open_time).all()
+    # История (архив + хвост в SQLite), отсортированная по времени открытия
+    history = load_history(session, [symbol], interval, columns=('open_time', 'close')).get(symbol)
     session.close()
 
-    if not klines:
+    if history is None or not len(history['close']):
         print("Нет данных для указанного символа.")
         return
 
     # Формируем списки для осей X (время) и Y (цена закрытия)
-    times = [k.open_time for k in klines]
-    closes = [k.close for k in klines]
+    times = [datetime.fromtimestamp(ms / 1000) for ms in history['open_time'].tolist()]
+    closes = history['close']
 
     plt.figure(figsize=(10, 6))
     plt.plot(times, closes, label=f'{symbol} Цена закрытия', marker='o', linestyle='-')
@@ -29,5 +31,7 @@ def plot_symbol_history(symbol: str):
     plt.tight_layout()
     plt.show()
 
-# Пример использования:
-plot_symbol_history("BTCUSDT")
\ No newline at end of file
+if __name__ == '__main__':
+    # Пример использования:
+    init_db(engine)
+    plot_symbol_history("BTCUSDT")
@@ -0,0 +1,232 @@
+# analytics.py
+import numpy as np
+
+from kline_archive import load_history
+from models import Session
+
+# Допустимый рост множителя (1 - alpha)^-k внутри блока EMA, чтобы не терять точность
+_EMA_BLOCK_GROWTH = 1e8
+
+
+def _nan_pad(values: np.ndarray, length: int) -> np.ndarray:
+    """Дополняет массив NaN слева до длины length."""
+    result = np.full(length, np.nan)
+    if len(values):
+        result[length - len(values):] = values
+    return result
+
+
+def simple_returns(close: np.ndarray) -> np.ndarray:
+    """Доходность от свечи к свече; первый элемент - NaN."""
+    returns = np.full(len(close), np.nan)
+    returns[1:] = close[1:] / close[:-1] - 1.0
+    return returns
+
+
+def log_returns(close: np.ndarray) -> np.ndarray:
+    returns = np.full(len(close), np.nan)
+    returns[1:] = np.diff(np.log(close))
+    return returns
+
+
+def sma(values: np.ndarray, window: int) -> np.ndarray:
+    """Простая скользящая средняя через накопленные суммы; первые window-1 значений - NaN."""
+    if len(values) < window:
+        return np.full(len(values), np.nan)
+    cumsum = np.cumsum(np.insert(values, 0, 0.0))
+    return _nan_pad((cumsum[window:] - cumsum[:-window]) / window, len(values))
+
+
+def rolling_std(values: np.ndarray, window: int) -> np.ndarray:
+    """Скользящее стандартное отклонение (выборочное) через суммы x и x^2."""
+    if len(values) < window or window < 2:
+        return np.full(len(values), np.nan)
+    # центрирование уменьшает потерю точности при вычитании больших сумм
+    centered = values - np.nanmean(values)
+    cumsum = np.cumsum(np.insert(centered, 0, 0.0))
+    cumsum_sq = np.cumsum(np.insert(centered * centered, 0, 0.0))
+    total = cumsum[window:] - cumsum[:-window]
+    total_sq = cumsum_sq[window:] - cumsum_sq[:-window]
+    variance = (total_sq - total * total / window) / (window - 1)
+    return _nan_pad(np.sqrt(np.maximum(variance, 0.0)), len(values))
+
+
+def ema(values: np.ndarray, alpha: float, initial: float = None) -> np.ndarray:
+    """
+    Экспоненциальная скользящая средняя y[t] = alpha * x[t] + (1 - alpha) * y[t-1], y[0] = x[0].
+    initial - значение y[-1] для продолжения ряда (по умолчанию ряд начинается с x[0]).
+    Рекурсия раскрывается в замкнутую форму через накопленные суммы и считается блоками,
+    длина которых ограничена так, чтобы множитель (1 - alpha)^-k оставался численно безопасным.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    result = np.empty(len(values))
+    if not len(values):
+        return result
+    decay = 1.0 - alpha
+    if decay <= 0.0:
+        result[:] = values
+        return result
+    block = max(1, int(np.log(_EMA_BLOCK_GROWTH) / -np.log(decay)))
+    powers = decay ** np.arange(block)
+    carry = values[0] if initial is None else initial
+    for offset in range(0, len(values), block):
+        chunk = values[offset:offset + block]
+        scale = powers[:len(chunk)]
+        result[offset:offset + len(chunk)] = scale * (decay * carry + alpha * np.cumsum(chunk / scale))
+        carry = result[offset + len(chunk) - 1]
+    return result
+
+
+def ema_span(values: np.ndarray, span: int) -> np.ndarray:
+    """EMA с периодом span (alpha = 2 / (span + 1))."""
+    return ema(values, 2.0 / (span + 1))
+
+
+def vwap(high: np.ndarray, low: np.ndarray, close: np.ndarray, volume: np.ndarray) -> np.ndarray:
+    """Накопленная средневзвешенная по объёму цена (по типичной цене (H + L + C) / 3)."""
+    typical = (high + low + close) / 3.0
+    cum_volume = np.cumsum(volume)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(cum_volume > 0, np.cumsum(typical * volume) / cum_volume, np.nan)
+
+
+def drawdown(close: np.ndarray) -> np.ndarray:
+    """Просадка от исторического максимума (0 - на максимуме, -0.3 - минус 30%)."""
+    return close / np.maximum.accumulate(close) - 1.0
+
+
+def true_range(high: np.ndarray, low: np.ndarray, close: np.ndarray, last_close: float = None) -> np.ndarray:
+    """True Range; last_close - закрытие свечи перед первой (по умолчанию берётся close[0])."""
+    prev_close = np.empty(len(close))
+    if len(close):
+        prev_close[0] = close[0] if last_close is None else last_close
+        prev_close[1:] = close[:-1]
+    return np.maximum(high - low, np.maximum(np.abs(high - prev_close), np.abs(low - prev_close)))
+
+
+def atr(high: np.ndarray, low: np.ndarray, close: np.ndarray, period: int = 14) -> np.ndarray:
+    """Average True Range со сглаживанием Уайлдера (alpha = 1 / period)."""
+    return ema(true_range(high, low, close), 1.0 / period)
+
+
+def compute_indicators(ohlcv: dict, window: int = 20, span: int = 20, atr_period: int = 14) -> dict:
+    """
+    Считает индикаторы по OHLCV-массивам одного символа (результат kline_archive.load_history).
+    Возвращает словарь массивов той же длины, что и входные данные.
+    """
+    close = ohlcv['close']
+    log_ret = log_returns(close)
+    volatility = _nan_pad(rolling_std(log_ret[1:], window), len(close))
+    return {
+        'open_time': ohlcv['open_time'],
+        'close': close,
+        'returns': simple_returns(close),
+        'log_returns': log_ret,
+        'volatility': volatility,
+        'vwap': vwap(ohlcv['high'], ohlcv['low'], close, ohlcv['volume']),
+        'sma': sma(close, window),
+        'ema': ema_span(close, span),
+        'drawdown': drawdown(close),
+        'atr': atr(ohlcv['high'], ohlcv['low'], close, atr_period),
+    }
+
+
+class IndicatorStream:
+    """
+    compute_indicators по последовательным частям одного ряда (например, порциям kline_archive.iter_history):
+    между частями переносятся последние window закрытий, значения EMA и ATR, накопленные суммы VWAP
+    и исторический максимум, поэтому результат совпадает с расчётом по всему ряду сразу.
+    Перенос хранится в state (словарь, сериализуемый в JSON) - по нему расчёт продолжается в другом запуске.
+    """
+
+    def __init__(self, window: int = 20, span: int = 20, atr_period: int = 14, state: dict = None):
+        self.window = window
+        self.span = span
+        self.atr_period = atr_period
+        self.state = dict(state or {'closes': [], 'ema': None, 'atr': None, 'pv': 0.0, 'volume': 0.0, 'peak': None})
+
+    def update(self, ohlcv: dict) -> dict:
+        """Индикаторы очередной части ряда (формат compute_indicators, длина - как у части)."""
+        state = self.state
+        close = np.asarray(ohlcv['close'], dtype=np.float64)
+        high, low, volume = (np.asarray(ohlcv[name], dtype=np.float64) for name in ('high', 'low', 'volume'))
+        context = len(state['closes'])
+        extended = np.concatenate([np.asarray(state['closes'], dtype=np.float64), close])
+        log_ret = log_returns(extended)
+        volatility = _nan_pad(rolling_std(log_ret[1:], self.window), len(extended))
+
+        last_close = state['closes'][-1] if context else None
+        typical = (high + low + close) / 3.0
+        cum_pv = state['pv'] + np.cumsum(typical * volume)
+        cum_volume = state['volume'] + np.cumsum(volume)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            vwap_values = np.where(cum_volume > 0, cum_pv / cum_volume, np.nan)
+        running = close if state['peak'] is None else np.r_[state['peak'], close]
+        peak = np.maximum.accumulate(running)[len(running) - len(close):]
+        ema_values = ema(close, 2.0 / (self.span + 1), state['ema'])
+        atr_values = ema(true_range(high, low, close, last_close), 1.0 / self.atr_period, state['atr'])
+
+        indicators = {
+            'open_time': ohlcv['open_time'],
+            'close': close,
+            'returns': simple_returns(extended)[context:],
+            'log_returns': log_ret[context:],
+            'volatility': volatility[context:],
+            'vwap': vwap_values,
+            'sma': sma(extended, self.window)[context:],
+            'ema': ema_values,
+            'drawdown': close / peak - 1.0,
+            'atr': atr_values,
+        }
+        if len(close):
+            self.state = {
+                'closes': extended[-self.window:].tolist(),
+                'ema': float(ema_values[-1]),
+                'atr': float(atr_values[-1]),
+                'pv': float(cum_pv[-1]),
+                'volume': float(cum_volume[-1]),
+                'peak': float(peak[-1]),
+            }
+        return indicators
+
+
+def compute_indicators_batch(symbols=None, interval: str = None, start: int = None, end: int = None,
+                             window: int = 20, span: int = 20, atr_period: int = 14) -> dict:
+    """
+    Загружает свечи всех запрошенных символов одним запросом и считает индикаторы для каждого.
+    interval обязателен: ряд из свечей разных интервалов для индикаторов бессмыслен.
+    """
+    if interval is None:
+        raise ValueError("Для расчёта индикаторов нужен интервал свечей")
+    session = Session()
+    try:
+        data = load_history(session, symbols=symbols, interval=interval, start=start, end=end)
+    finally:
+        session.close()
+    return {symbol: compute_indicators(ohlcv, window, span, atr_period) for symbol, ohlcv in data.items()}
+
+
+def _last_valid(values: np.ndarray):
+    valid = values[~np.isnan(values)]
+    return float(valid[-1]) if len(valid) else None
+
+
+def summarize_indicators(symbol: str, indicators: dict) -> dict:
+    """
+    Сводка по последним значениям индикаторов в виде плоского словаря,
+    пригодного для display_analysis и export_analysis.
+    """
+    close = indicators['close']
+    return {
+        'symbol': symbol,
+        'data_points': len(close),
+        'last_close': float(close[-1]) if len(close) else None,
+        'total_return': float(close[-1] / close[0] - 1.0) if len(close) else None,
+        'volatility': _last_valid(indicators['volatility']),
+        'vwap': _last_valid(indicators['vwap']),
+        'sma': _last_valid(indicators['sma']),
+        'ema': _last_valid(indicators['ema']),
+        'atr': _last_valid(indicators['atr']),
+        'drawdown': _last_valid(indicators['drawdown']),
+        'max_drawdown': float(np.min(indicators['drawdown'])) if len(close) else None,
+    }
@@ -0,0 +1,144 @@
+# async_binance_client.py
+import asyncio
+import threading
+import time
+
+import aiohttp
+
+from binance_api_client import BaseBinanceClient
+
+
+class AsyncBinanceClient(BaseBinanceClient):
+    """
+    Асинхронный клиент Binance с тем же набором методов, что и BinanceClient.
+    Все запросы идут через одну aiohttp-сессию (общий пул соединений), а семафор
+    ограничивает число одновременных запросов, поэтому можно спокойно делать
+    asyncio.gather для сотен вызовов.
+
+    Использование:
+        async with AsyncBinanceClient() as client:
+            prices = await asyncio.gather(*(client.get_ticker_price(s) for s in symbols))
+    """
+
+    def __init__(self, api_key=None, api_secret=None, base_url=None, pool_size=100, concurrency=50, **kwargs):
+        super().__init__(api_key, api_secret, base_url, **kwargs)
+        self.pool_size = pool_size
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _send_request(self, method, path, params=None, signed=False):
+        method = method.upper()
+        if method not in self.SUPPORTED_METHODS:
+            raise ValueError("Unsupported HTTP method")
+        url = self.base_url + path
+        headers = self._get_headers()
+        if params is None:
+            params = {}
+        session = self._get_session()
+        attempt = 0
+        while True:
+            params = self._prepare_params(params, signed)
+            await asyncio.sleep(self._throttle_delay())
+            try:
+                async with self._semaphore:
+                    started = time.perf_counter()
+                    # aiohttp принимает в параметрах запроса только строки
+                    async with session.request(method, url, headers=headers,
+                                               params={k: str(v) for k, v in params.items()}) as response:
+                        status = response.status
+                        response_headers = response.headers
+                        size = len(await response.read())
+                        data = await response.json(content_type=None)
+                    self._record_request(method, path, status, time.perf_counter() - started, size)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                self._record_request(method, path, type(e).__name__, time.perf_counter() - started)
+                # ClientConnectorError - соединение не установлено, запрос не отправлен
+                if not self._can_retry(method, attempt, sent=not isinstance(e, aiohttp.ClientConnectorError)):
+                    raise
+                await asyncio.sleep(self._retry_delay(attempt))
+                attempt += 1
+                continue
+            self._update_weight(response_headers)
+            if status in self.RETRY_STATUSES:
+                # Retry-After запоминается и без повтора: следующие запросы подождут
+                delay = self._retry_delay(attempt, response_headers)
+                # при длительном бане (418) повторять нет смысла: отдаём ошибку Binance вызывающему коду
+                if self._can_retry(method, attempt) and delay <= self.max_backoff:
+                    await asyncio.sleep(delay)
+                    attempt += 1
+                    continue
+            return data
+
+
+async def gather_ticker_prices(symbols, client=None):
+    """
+    Параллельно запрашивает цены для списка символов.
+    Возвращает словарь {символ: ответ Binance}; ошибки сети попадают в ответ как исключения.
+    """
+    own_client = client is None
+    client = client or AsyncBinanceClient()
+    try:
+        responses = await asyncio.gather(*(client.get_ticker_price(symbol) for symbol in symbols),
+                                         return_exceptions=True)
+    finally:
+        if own_client:
+            await client.close()
+    return dict(zip(symbols, responses))
+
+
+class AsyncClientRunner:
+    """
+    Постоянный цикл событий в фоновом потоке с одним долгоживущим AsyncBinanceClient: синхронный код
+    запускает в нём корутины через run, и пул соединений aiohttp переиспользуется между вызовами,
+    а не создаётся заново на каждый asyncio.run. Цикл и клиент создаются при первом вызове.
+    """
+
+    def __init__(self, **client_kwargs):
+        self._client_kwargs = client_kwargs
+        self._loop = None
+        self._thread = None
+        self.client = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name='async-binance', daemon=True)
+                self._thread.start()
+                self.client = AsyncBinanceClient(**self._client_kwargs)
+
+    def run(self, coroutine_factory, timeout: float = None):
+        """Выполняет coroutine_factory(client) в цикле фонового потока и возвращает результат."""
+        self._ensure_started()
+        return asyncio.run_coroutine_threadsafe(coroutine_factory(self.client), self._loop).result(timeout)
+
+    def close(self):
+        """Закрывает сессию aiohttp и останавливает цикл."""
+        with self._lock:
+            if self._loop is None:
+                return
+            asyncio.run_coroutine_threadsafe(self.client.close(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop.close()
+            self._loop, self._thread, self.client = None, None, None
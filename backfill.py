@@ -0,0 +1,185 @@
+# backfill.py
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import time
+
+from binance_api_client import BinanceClient, RequestWeightLimiter, request_weight_limiter
+from config import INTERVAL_MS
+from kline_backends import get_kline_backend
+from models import Session, KlineSyncState, KlineCoverage
+from resample import rewind_resample_marks
+from write_queue import WriteQueue, write_queue
+
+
+def to_ms(value) -> int:
+    """Приводит datetime или число (мс с эпохи) к целому числу миллисекунд."""
+    if isinstance(value, datetime):
+        return int(value.timestamp() * 1000)
+    return int(value)
+
+
+def plan_pages(start_ms: int, end_ms: int, interval: str, page_limit: int = BinanceClient.KLINES_MAX_LIMIT):
+    """
+    Разбивает полуинтервал [start_ms, end_ms) на страницы по page_limit свечей.
+    Возвращает список пар (начало, конец) в миллисекундах, конец не включается.
+    """
+    step = INTERVAL_MS[interval] * page_limit
+    pages = []
+    page_start = start_ms
+    while page_start < end_ms:
+        page_end = min(page_start + step, end_ms)
+        pages.append((page_start, page_end))
+        page_start = page_end
+    return pages
+
+
+def get_high_water(session, symbol: str, interval: str):
+    state = session.query(KlineSyncState).filter_by(symbol=symbol, interval=interval).first()
+    return state.high_water if state else None
+
+
+def set_high_water(session, symbol: str, interval: str, high_water: int):
+    state = session.query(KlineSyncState).filter_by(symbol=symbol, interval=interval).first()
+    if state is None:
+        state = KlineSyncState(symbol=symbol, interval=interval, high_water=high_water, updated_at=datetime.now())
+        session.add(state)
+    else:
+        state.high_water = max(state.high_water, high_water)
+        state.updated_at = datetime.now()
+
+
+def missing_ranges(session, symbol: str, interval: str, start_ms: int, end_ms: int) -> list:
+    """Участки [start_ms, end_ms), ещё не покрытые загрузкой (KlineCoverage), по возрастанию."""
+    covered = session.query(KlineCoverage.start, KlineCoverage.end).filter(
+        KlineCoverage.symbol == symbol,
+        KlineCoverage.interval == interval,
+        KlineCoverage.end > start_ms,
+        KlineCoverage.start < end_ms,
+    ).order_by(KlineCoverage.start).all()
+    gaps, cursor = [], start_ms
+    for lo, hi in covered:
+        if lo > cursor:
+            gaps.append((cursor, lo))
+        cursor = max(cursor, hi)
+    if cursor < end_ms:
+        gaps.append((cursor, end_ms))
+    return gaps
+
+
+def add_coverage(session, symbol: str, interval: str, start_ms: int, end_ms: int):
+    """Отмечает [start_ms, end_ms) загруженным, сливая его с пересекающимися и смежными участками."""
+    if end_ms <= start_ms:
+        return
+    overlapping = session.query(KlineCoverage).filter(
+        KlineCoverage.symbol == symbol,
+        KlineCoverage.interval == interval,
+        KlineCoverage.end >= start_ms,
+        KlineCoverage.start <= end_ms,
+    ).all()
+    for row in overlapping:
+        start_ms, end_ms = min(start_ms, row.start), max(end_ms, row.end)
+        session.delete(row)
+    session.add(KlineCoverage(symbol=symbol, interval=interval, start=start_ms, end=end_ms))
+
+
+def closed_until(rows, page_end: int, now_ms: int) -> int:
+    """Конец покрытия страницы: open_time первой ещё не закрытой свечи или page_end, если все закрыты."""
+    open_times = [int(row[0]) for row in rows if int(row[6]) >= now_ms]
+    return min(open_times + [page_end])
+
+
+class KlineBackfill:
+    """
+    Загрузчик истории свечей постранично в диапазоне [start, end).
+    Страницы запрашиваются параллельно в пуле потоков с общим для процесса ограничением веса запросов
+    (не больше concurrency * 2 страниц в работе одновременно), а сохраняются строго по порядку: после каждой страницы её участок отмечается в KlineCoverage,
+    поэтому повторная или прерванная загрузка запрашивает только непокрытые участки диапазона.
+    Покрытие заканчивается на последней закрытой свече: ещё не закрытая свеча будет запрошена
+    снова, а свечи с биржи перезаписывают сохранённые (update=True).
+    Страницы записываются через очередь записи WriteQueue - общего писателя процесса.
+    """
+
+    def __init__(self, client=None, concurrency: int = 4, limiter: RequestWeightLimiter = None,
+                 page_limit: int = BinanceClient.KLINES_MAX_LIMIT, writer: WriteQueue = None):
+        self.client = client or BinanceClient(pool_size=concurrency)
+        self.writer = writer or write_queue
+        self.concurrency = concurrency
+        self.limiter = limiter or request_weight_limiter
+        self.page_limit = min(page_limit, BinanceClient.KLINES_MAX_LIMIT)
+
+    def _fetch_page(self, symbol: str, interval: str, page):
+        page_start, page_end = page
+        self.limiter.acquire(BinanceClient.KLINES_WEIGHT)
+        data = self.client.get_klines(symbol, interval, startTime=page_start, endTime=page_end - 1,
+                                      limit=self.page_limit)
+        if not isinstance(data, list):
+            raise RuntimeError(f"Ошибка Binance API для {symbol} {interval}: {data}")
+        return data
+
+    def _store_page(self, session, symbol: str, interval: str, page, rows) -> dict:
+        """Сохраняет страницу и отмечает её покрытой; выполняется в потоке очереди записи."""
+        page_start, page_end = page
+        result = get_kline_backend().upsert_klines(symbol, interval, rows, update=True, session=session)
+        covered_end = closed_until(rows, page_end, int(time.time() * 1000))
+        add_coverage(session, symbol, interval, page_start, covered_end)
+        if covered_end > page_start:
+            set_high_water(session, symbol, interval, covered_end)
+        if result['inserted']:
+            # новые свечи внутри уже построенного участка: старшие интервалы там нужно пересобрать
+            rewind_resample_marks(session, symbol, interval, page_start)
+        return result
+
+    def run(self, symbol: str, interval: str, start, end=None, resume: bool = True):
+        """
+        Загружает свечи symbol/interval за [start, end). Если end не задан, берётся текущий момент.
+        Возвращает словарь со статистикой загрузки.
+        """
+        start_ms = to_ms(start)
+        # начало выравнивается на свечу: иначе между прогонами с разными start оставались бы щели меньше свечи
+        start_ms -= start_ms % INTERVAL_MS[interval]
+        end_ms = to_ms(end) if end is not None else int(time.time() * 1000)
+        if resume:
+            session = Session()
+            try:
+                ranges = missing_ranges(session, symbol, interval, start_ms, end_ms)
+            finally:
+                session.close()
+        else:
+            ranges = [(start_ms, end_ms)]
+        pages = [page for lo, hi in ranges for page in plan_pages(lo, hi, interval, self.page_limit)]
+        stats = {'symbol': symbol, 'interval': interval, 'pages': 0, 'candles': 0,
+                 'new': 0, 'errors': 0, 'seconds': 0.0}
+        started = time.perf_counter()
+        executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        pending, queued = deque(), iter(pages)
+        try:
+            # скользящее окно заданий: следующая страница запрашивается, когда сохранена самая ранняя,
+            # поэтому в памяти не больше window страниц, а сохранение идёт в порядке страниц
+            window = self.concurrency * 2
+            while True:
+                while len(pending) < window:
+                    page = next(queued, None)
+                    if page is None:
+                        break
+                    pending.append((page, executor.submit(self._fetch_page, symbol, interval, page)))
+                if not pending:
+                    break
+                page, future = pending.popleft()
+                rows = future.result()
+                # страница и её покрытие фиксируются одним заданием: покрытия без свечей не бывает
+                result = self.writer.call(self._store_page, symbol, interval, page, rows)
+                stats['pages'] += 1
+                stats['candles'] += len(rows)
+                stats['new'] += result['inserted']
+                stats['errors'] += len(result['errors'])
+        finally:
+            # при ошибке или прерывании не ждём уже ненужные страницы
+            executor.shutdown(wait=True, cancel_futures=True)
+        stats['seconds'] = time.perf_counter() - started
+        stats['candles_per_sec'] = stats['candles'] / stats['seconds'] if stats['seconds'] else 0.0
+        return stats
+
+    def run_many(self, symbols, interval: str, start, end=None, resume: bool = True):
+        """Загружает историю для нескольких символов; ограничение веса общее для всех загрузок процесса."""
+        return [self.run(symbol, interval, start, end, resume=resume) for symbol in symbols]
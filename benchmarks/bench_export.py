@@ -0,0 +1,90 @@
+# benchmarks/bench_export.py
+"""
+Потоковая выгрузка истории (kline_export.export_series) на рядах разной длины: скорость (строк/с)
+и пик памяти Python (tracemalloc) для CSV, CSV в gzip и Parquet, со свечами и с индикаторами.
+Для сравнения - выгрузка целиком: load_history + compute_indicators + csv.writer.
+При потоковой выгрузке пик памяти определяется размером порции, а не длиной ряда.
+База создаётся во временном каталоге.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_export --rows 100000 500000
+"""
+import argparse
+import csv
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _measure(func):
+    """(секунды, пик памяти в МиБ): время - отдельным прогоном без tracemalloc, он замедляет выделения."""
+    started = time.perf_counter()
+    func()
+    seconds = time.perf_counter() - started
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds, peak / 2 ** 20
+
+
+def export_whole(symbol: str, path: str):
+    from analytics import compute_indicators
+    from kline_archive import load_history, ARCHIVE_COLUMNS
+    from kline_export import INDICATOR_COLUMNS
+    from models import Session
+    session = Session()
+    try:
+        data = load_history(session, [symbol], '1m', columns=ARCHIVE_COLUMNS)[symbol]
+    finally:
+        session.close()
+    indicators = compute_indicators(data)
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerows(zip(*(data[name].tolist() for name in ARCHIVE_COLUMNS),
+                             *(indicators[name].tolist() for name in INDICATOR_COLUMNS)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, nargs='+', default=[100_000, 500_000], help="длины рядов")
+    parser.add_argument('--chunk-size', type=int, default=50_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)  # portfolio.db и архив свечей создаются во временном каталоге
+        sys.path.insert(0, REPO_ROOT)
+        from benchmarks.bench_kline_backends import make_batch
+        from kline_backends import get_kline_backend
+        from kline_export import export_series, FORMATS, _pyarrow
+        from models import engine, init_db
+        init_db(engine)
+        try:
+            _pyarrow()
+            formats = list(FORMATS)
+        except RuntimeError as e:
+            print(f"parquet: пропущено ({e})")
+            formats = [fmt for fmt in FORMATS if fmt != 'parquet']
+
+        for rows in args.rows:
+            symbol = f"EXPORT{rows}USDT"
+            batch = make_batch(rows)
+            batch['close'] = abs(batch['close']) + 1  # случайное блуждание make_batch может уйти ниже нуля
+            get_kline_backend().upsert_batch(symbol, '1m', batch)
+            for fmt in formats:
+                for indicators in (False, True):
+                    seconds, peak = _measure(lambda: export_series(symbol, '1m', tmp, fmt, indicators=indicators,
+                                                                   chunk_size=args.chunk_size))
+                    label = f"{fmt}{' +индикаторы' if indicators else ''}"
+                    print(f"{rows:>9,} строк {label:>20}: {rows / seconds:10,.0f} строк/с, пик памяти {peak:8.1f} МиБ")
+            seconds, peak = _measure(lambda: export_whole(symbol, os.path.join(tmp, 'whole.csv')))
+            print(f"{rows:>9,} строк {'целиком csv':>20}: {rows / seconds:10,.0f} строк/с, пик памяти {peak:8.1f} МиБ")
+        os.chdir(REPO_ROOT)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+# benchmarks/bench_kline_backends.py
+"""
+Сравнение хранилищ свечей (kline_backends) на одинаковой нагрузке: загрузка истории пачками
+через upsert_batch, повторная загрузка тех же пачек (все свечи уже есть), полный скан колонок
+load_ohlcv и агрегаты aggregate. SQLite и DuckDB создаются во временном каталоге;
+PostgreSQL/TimescaleDB проверяется только при указании --postgres-dsn (таблица klines
+в этой базе будет очищена). Недоступные хранилища пропускаются.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_kline_backends --symbols 10 --rows 100000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+from sqlalchemy.orm import sessionmaker
+
+from kline_backends import SQLiteKlineBackend, DuckDBKlineBackend, PostgresKlineBackend
+from models import create_db_engine, init_db
+
+
+def make_batch(count: int, start_ms: int = 1_600_000_000_000, step_ms: int = 60_000) -> dict:
+    rng = np.random.default_rng(7)
+    open_time = start_ms + np.arange(count, dtype=np.int64) * step_ms
+    close = 100 + np.cumsum(rng.normal(0, 0.5, count))
+    return {
+        'open_time': open_time,
+        'open': close - 0.1,
+        'high': close + 0.5,
+        'low': close - 0.5,
+        'close': close,
+        'volume': rng.uniform(1, 100, count),
+        'close_time': open_time + step_ms - 1,
+    }
+
+
+def run(backend, symbols: int, rows: int, page: int) -> dict:
+    batch = make_batch(rows)
+    pages = [{name: values[i:i + page] for name, values in batch.items()} for i in range(0, rows, page)]
+    names = [f"SYM{index}USDT" for index in range(symbols)]
+
+    timings = {}
+    for label in ('ingest', 'reingest'):
+        started = time.perf_counter()
+        inserted = sum(backend.upsert_batch(name, '1m', part)['inserted'] for name in names for part in pages)
+        timings[label] = time.perf_counter() - started
+        timings[f'{label}_inserted'] = inserted
+
+    started = time.perf_counter()
+    data = backend.load_ohlcv(names, '1m')
+    timings['scan'] = time.perf_counter() - started
+    timings['scanned'] = sum(len(series['open_time']) for series in data.values())
+
+    started = time.perf_counter()
+    backend.aggregate(names, '1m')
+    timings['aggregate'] = time.perf_counter() - started
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--symbols', type=int, default=10)
+    parser.add_argument('--rows', type=int, default=100_000, help="свечей на символ")
+    parser.add_argument('--page', type=int, default=1000, help="свечей в одной пачке (страница API Binance)")
+    parser.add_argument('--postgres-dsn', default=None)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        def sqlite_backend():
+            engine = create_db_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+            init_db(engine)
+            return SQLiteKlineBackend(sessionmaker(bind=engine))
+
+        def postgres_backend():
+            if not args.postgres_dsn:
+                raise RuntimeError("не указан --postgres-dsn")
+            backend = PostgresKlineBackend(args.postgres_dsn)
+            with backend._connection, backend._connection.cursor() as cursor:
+                cursor.execute("TRUNCATE klines")
+            return backend
+
+        factories = (
+            ('sqlite', sqlite_backend),
+            ('duckdb', lambda: DuckDBKlineBackend(os.path.join(tmp, 'bench.duckdb'))),
+            ('postgres', postgres_backend),
+        )
+        total = args.symbols * args.rows
+        for name, factory in factories:
+            try:
+                backend = factory()
+            except Exception as e:
+                print(f"{name:>9}: пропущено ({e})")
+                continue
+            try:
+                result = run(backend, args.symbols, args.rows, args.page)
+            finally:
+                backend.close()
+            print(f"{name:>9}: загрузка {total / result['ingest']:10,.0f} свечей/с "
+                  f"(новых {result['ingest_inserted']:,}), повтор {total / result['reingest']:10,.0f} свечей/с "
+                  f"(новых {result['reingest_inserted']}), скан {result['scan'] * 1000:8.1f} мс "
+                  f"({result['scanned']:,} свечей), агрегаты {result['aggregate'] * 1000:7.1f} мс")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+# benchmarks/bench_kline_parse.py
+"""
+Сравнение разбора страниц свечей: построчно через KlineData.from_list с копированием полей
+в словарь (как раньше перед вставкой) и пакетно через parse_klines_batch в кортежи для executemany.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_kline_parse --rows 1000000
+"""
+import argparse
+import time
+
+from benchmarks.bench_kline_upsert import make_rows
+from kline_store import batch_to_tuples
+from schemas import KlineData, parse_klines_batch
+
+
+def parse_row_by_row(symbol: str, interval: str, rows):
+    records = []
+    for entry in rows:
+        kline_data = KlineData.from_list(entry)
+        records.append({
+            'symbol': symbol,
+            'interval': interval,
+            'open_time': entry[0],
+            'open': kline_data.open,
+            'high': kline_data.high,
+            'low': kline_data.low,
+            'close': kline_data.close,
+            'volume': kline_data.volume,
+            'close_time': entry[6],
+        })
+    return records
+
+
+def parse_batch(symbol: str, interval: str, rows, page_size: int = 1000):
+    # Разбор постранично, как страницы приходят от /api/v3/klines
+    records = []
+    for offset in range(0, len(rows), page_size):
+        records.extend(batch_to_tuples(symbol, interval, parse_klines_batch(rows[offset:offset + page_size])))
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    args = parser.parse_args()
+    rows = make_rows(args.rows)
+    results = {}
+    for name, func in (('row_by_row', parse_row_by_row), ('batch', parse_batch)):
+        started = time.perf_counter()
+        func('BTCUSDT', '1m', rows)
+        results[name] = time.perf_counter() - started
+        print(f"{name:>12}: {results[name]:8.3f} с ({args.rows / results[name]:,.0f} свечей/с)")
+    print(f"Ускорение: {results['row_by_row'] / results['batch']:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+# benchmarks/bench_kline_upsert.py
+"""
+Сравнение построчного сохранения свечей (запрос существования + session.add на каждую свечу)
+с пакетным upsert_klines на временной базе SQLite.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_kline_upsert --rows 100000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from models import Base, Kline
+from kline_store import upsert_klines
+from schemas import KlineData
+
+
+def make_rows(count: int, start_ms: int = 1_600_000_000_000, step_ms: int = 60_000):
+    return [[start_ms + i * step_ms, "100.0", "101.0", "99.0", "100.5", "12.5", start_ms + (i + 1) * step_ms - 1]
+            for i in range(count)]
+
+
+def store_row_by_row(session, symbol: str, interval: str, rows):
+    """Прежний способ: отдельный запрос существования и ORM-объект на каждую свечу."""
+    new_count = 0
+    for entry in rows:
+        kline_data = KlineData.from_list(entry)
+        exists = session.query(Kline).filter_by(symbol=symbol, interval=interval, open_time=entry[0]).first()
+        if not exists:
+            session.add(Kline(symbol=symbol, interval=interval, open_time=entry[0], open=kline_data.open,
+                              high=kline_data.high, low=kline_data.low, close=kline_data.close,
+                              volume=kline_data.volume, close_time=entry[6]))
+            new_count += 1
+    session.commit()
+    return new_count
+
+
+def run(rows_count: int):
+    rows = make_rows(rows_count)
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in ('row_by_row', 'bulk_upsert'):
+            engine = create_engine(f"sqlite:///{os.path.join(tmp, name + '.db')}")
+            Base.metadata.create_all(engine)
+            session = sessionmaker(bind=engine)()
+            started = time.perf_counter()
+            if name == 'row_by_row':
+                store_row_by_row(session, 'BTCUSDT', '1m', rows)
+            else:
+                upsert_klines(session, 'BTCUSDT', '1m', rows)
+                session.commit()
+            results[name] = time.perf_counter() - started
+            session.close()
+            engine.dispose()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100_000)
+    args = parser.parse_args()
+    results = run(args.rows)
+    for name, seconds in results.items():
+        print(f"{name:>12}: {seconds:8.3f} с ({args.rows / seconds:,.0f} свечей/с)")
+    print(f"Ускорение: {results['row_by_row'] / results['bulk_upsert']:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+# benchmarks/bench_startup.py
+"""
+Время холодного импорта main.py по данным python -X importtime.
+Импорт запускается в отдельном процессе во временном каталоге (файлы базы и кэша там и создаются),
+печатаются самые тяжёлые модули. Скрипт завершается с кодом 1, если импорт дольше бюджета
+или при запуске загружаются модули, которые должны подключаться лениво (графики, aiohttp, websockets, pydantic).
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_startup --budget-ms 900
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Модули, которые не должны загружаться до первого использования соответствующего пункта меню
+LAZY_MODULES = ('matplotlib', 'mplcursors', 'aiohttp', 'websockets', 'pydantic')
+
+
+def import_times(module: str = 'main') -> dict:
+    """Один холодный импорт module: {имя модуля: суммарное время импорта в мкс}."""
+    env = dict(os.environ, PYTHONPATH=REPO_ROOT, MPLBACKEND='Agg')
+    with tempfile.TemporaryDirectory() as tmp:
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                                cwd=tmp, env=env, capture_output=True, text=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--budget-ms', type=float, default=900.0)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15)
+    args = parser.parse_args()
+
+    runs = [import_times() for _ in range(args.runs)]
+    total_ms = statistics.median(run['main'] for run in runs) / 1000
+    slowest = sorted(runs[-1].items(), key=lambda item: item[1], reverse=True)[:args.top]
+    for name, microseconds in slowest:
+        print(f"{microseconds / 1000:9.1f} мс  {name}")
+    print(f"Импорт main (медиана из {args.runs}): {total_ms:.1f} мс, бюджет {args.budget_ms:.0f} мс")
+
+    failed = False
+    eager = sorted({name for run in runs for name in run if name.split('.')[0] in LAZY_MODULES})
+    if eager:
+        print(f"Загружены при старте модули, которые должны импортироваться лениво: {', '.join(eager)}")
+        failed = True
+    if total_ms > args.budget_ms:
+        print("Время запуска превышает бюджет.")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
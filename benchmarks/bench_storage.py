@@ -0,0 +1,128 @@
+# benchmarks/bench_storage.py
+"""
+Смешанная нагрузка на SQLite: несколько производителей пишут свечи небольшими пачками,
+одновременно читатели выполняют выборки по диапазону времени. Сравниваются профили
+safe (журнал отката, запись с коммитом в каждом потоке), tuned (WAL, та же схема записи)
+и tuned + WriteQueue (один писатель, общие коммиты). Печатается пропускная способность записи,
+задержка чтения (p50/p95/p99) и число ошибок «database is locked».
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_storage --producers 4 --writes 200 --readers 4
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+
+from sqlalchemy import func
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from benchmarks.bench_kline_upsert import make_rows
+from kline_store import upsert_klines
+from models import Kline, create_db_engine, init_db
+from write_queue import WriteQueue
+
+
+def _write_direct(factory, symbol, rows, errors):
+    session = factory()
+    try:
+        upsert_klines(session, symbol, '1m', rows)
+        session.commit()
+    except OperationalError:
+        session.rollback()
+        errors.append(symbol)
+    finally:
+        session.close()
+
+
+def _read(factory, symbols, latencies, stop):
+    while not stop.is_set():
+        symbol = random.choice(symbols)
+        started = time.perf_counter()
+        session = factory()
+        try:
+            session.query(func.count(Kline.id), func.avg(Kline.close)).filter(
+                Kline.symbol == symbol, Kline.interval == '1m', Kline.open_time >= 0).one()
+        except OperationalError:
+            pass
+        finally:
+            session.close()
+        latencies.append(time.perf_counter() - started)
+
+
+def run(profile: str, use_queue: bool, producers: int, writes: int, rows_per_write: int, readers: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_db_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}", profile=profile,
+                                  pool_size=producers + readers)
+        init_db(engine)
+        factory = sessionmaker(bind=engine)
+        queue = WriteQueue(factory) if use_queue else None
+        symbols = [f"SYM{index}USDT" for index in range(producers)]
+        pages = {symbol: [make_rows(rows_per_write, start_ms=page * rows_per_write * 60_000)
+                          for page in range(writes)] for symbol in symbols}
+        errors, latencies, stop = [], [], threading.Event()
+
+        def produce(symbol):
+            if queue is None:
+                for rows in pages[symbol]:
+                    _write_direct(factory, symbol, rows, errors)
+            else:
+                futures = [queue.submit(upsert_klines, symbol, '1m', rows) for rows in pages[symbol]]
+                for future in futures:
+                    future.result()
+
+        reader_threads = [threading.Thread(target=_read, args=(factory, symbols, latencies, stop))
+                          for _ in range(readers)]
+        producer_threads = [threading.Thread(target=produce, args=(symbol,)) for symbol in symbols]
+        for thread in reader_threads:
+            thread.start()
+        started = time.perf_counter()
+        for thread in producer_threads:
+            thread.start()
+        for thread in producer_threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        stop.set()
+        for thread in reader_threads:
+            thread.join()
+        if queue is not None:
+            queue.close()
+        engine.dispose()
+
+    latencies.sort()
+    quantile = lambda q: latencies[min(int(q * len(latencies)), len(latencies) - 1)] * 1000 if latencies else 0.0
+    # неудачные (заблокированные) записи в пропускную способность не входят
+    written = producers * writes - len(errors)
+    return {
+        'rows_per_sec': written * rows_per_write / elapsed,
+        'writes_per_sec': written / elapsed,
+        'read_p50_ms': quantile(0.5),
+        'read_p95_ms': quantile(0.95),
+        'read_p99_ms': quantile(0.99),
+        'reads': len(latencies),
+        'locked_errors': len(errors),
+        'commits': queue.stats['commits'] if queue is not None else written,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--producers', type=int, default=4)
+    parser.add_argument('--writes', type=int, default=200)
+    parser.add_argument('--rows-per-write', type=int, default=20)
+    parser.add_argument('--readers', type=int, default=4)
+    args = parser.parse_args()
+    for name, profile, use_queue in (('safe', 'safe', False), ('tuned', 'tuned', False),
+                                     ('tuned+queue', 'tuned', True)):
+        result = run(profile, use_queue, args.producers, args.writes, args.rows_per_write, args.readers)
+        print(f"{name:>12}: запись {result['writes_per_sec']:8.0f} пачек/с ({result['rows_per_sec']:,.0f} свечей/с), "
+              f"коммитов {result['commits']}, чтение p50 {result['read_p50_ms']:.2f} мс, "
+              f"p95 {result['read_p95_ms']:.2f} мс, p99 {result['read_p99_ms']:.2f} мс "
+              f"({result['reads']} запросов), locked: {result['locked_errors']}")
+
+
+if __name__ == '__main__':
+    main()
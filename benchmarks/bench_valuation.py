@@ -0,0 +1,49 @@
+# benchmarks/bench_valuation.py
+"""
+Сравнение оценки портфеля: вложенные циклы по позициям и валютам (как раньше в view_portfolio)
+и один векторный шаг valuation.value_holdings с готовым вектором курсов.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_valuation --holdings 5000
+"""
+import argparse
+import random
+import time
+
+from config import conversion_rates
+from valuation import value_holdings
+
+
+def value_with_loops(symbols, amounts, prices):
+    totals = {curr: 0.0 for curr in conversion_rates}
+    values = []
+    for symbol, amount in zip(symbols, amounts):
+        value_usd = amount * prices[symbol]
+        row = {}
+        for curr, rate in conversion_rates.items():
+            row[curr] = value_usd * rate
+            totals[curr] += row[curr]
+        values.append(row)
+    return values, totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--holdings', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+    symbols = [f"SYM{i}USDT" for i in range(args.holdings)]
+    amounts = [random.uniform(0.1, 100) for _ in symbols]
+    prices = {symbol: random.uniform(0.01, 50_000) for symbol in symbols}
+    results = {}
+    for name, func in (('loops', value_with_loops), ('vectorized', value_holdings)):
+        started = time.perf_counter()
+        for _ in range(args.repeat):
+            func(symbols, amounts, prices)
+        results[name] = (time.perf_counter() - started) / args.repeat
+        print(f"{name:>12}: {results[name] * 1000:8.3f} мс на {args.holdings} позиций x {len(conversion_rates)} валют")
+    print(f"Ускорение: {results['loops'] / results['vectorized']:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
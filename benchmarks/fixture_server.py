@@ -0,0 +1,261 @@
+# benchmarks/fixture_server.py
+"""
+Локальный сервер с ответами Binance REST API для воспроизводимых замеров.
+Отдаёт /api/v3/klines, /api/v3/ticker/price и /api/v3/exchangeInfo: записанные ответы из каталога
+фикстур, а для отсутствующих в записи символов и диапазонов - детерминированно сгенерированные.
+Задержка ответа и лимит веса запросов (X-MBX-USED-WEIGHT-1M, 429 с Retry-After) настраиваются.
+
+Запись фикстур с настоящего API (нужен доступ к api.binance.com):
+    python -m benchmarks.fixture_server record --symbols BTCUSDT ETHUSDT --interval 1m --limit 1000
+Запуск сервера отдельно (например, для ручной проверки main.py с BINANCE_BASE_URL):
+    python -m benchmarks.fixture_server serve --port 8765 --latency 0.02
+"""
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+
+from config import INTERVAL_MS
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+# Вес запросов как у Binance
+WEIGHTS = {'/api/v3/klines': 2, '/api/v3/ticker/price': 2, '/api/v3/exchangeInfo': 20}
+TICKER_MANY_WEIGHT = 4
+
+# Пары для курсов фиатных валют (update_all_fiat_rates_from_binance) и их примерные цены
+FIAT_PAIRS = {'USDTRUB': 92.0, 'EURUSDT': 1.08, 'GBPUSDT': 1.27, 'USDTJPY': 150.0}
+
+
+def synthetic_symbols(count: int) -> list:
+    return [f"SYM{index:04d}USDT" for index in range(count)] + list(FIAT_PAIRS)
+
+
+def _base_price(symbol: str) -> float:
+    if symbol in FIAT_PAIRS:
+        return FIAT_PAIRS[symbol]
+    seed = int(hashlib.sha1(symbol.encode()).hexdigest()[:8], 16)
+    return 1 + seed % 50_000
+
+
+def _symbol_info(symbol: str) -> dict:
+    base, quote = (symbol[:-4], 'USDT') if symbol.endswith('USDT') else ('USDT', symbol[4:])
+    return {'symbol': symbol, 'status': 'TRADING', 'baseAsset': base, 'quoteAsset': quote,
+            'filters': [{'filterType': 'PRICE_FILTER', 'tickSize': '0.01000000'}]}
+
+
+def synthetic_klines(symbol: str, interval: str, start_ms: int, count: int) -> list:
+    """Свечи в формате /api/v3/klines: гладкий детерминированный ряд, зависящий только от символа и времени."""
+    step = INTERVAL_MS[interval]
+    open_time = (start_ms + step - 1) // step * step + np.arange(count, dtype=np.int64) * step
+    base = _base_price(symbol)
+    phase = open_time / 86_400_000 * 2 * np.pi
+    close = base * (1 + 0.05 * np.sin(phase) + 0.01 * np.sin(phase * 37))
+    open_ = np.r_[close[:1], close[:-1]] if count else close
+    high = np.maximum(open_, close) * 1.001
+    low = np.minimum(open_, close) * 0.999
+    volume = 10 + 5 * (1 + np.cos(phase * 11))
+    return [[int(t), f"{o:.8f}", f"{h:.8f}", f"{lo:.8f}", f"{c:.8f}", f"{v:.4f}", int(t) + step - 1,
+             f"{c * v:.4f}", 100, f"{v / 2:.4f}", f"{c * v / 2:.4f}", "0"]
+            for t, o, h, lo, c, v in zip(open_time.tolist(), open_.tolist(), high.tolist(), low.tolist(),
+                                         close.tolist(), volume.tolist())]
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # очередь listen по умолчанию (5) переполняется параллельными запросами, и клиент ждёт повтора SYN секунду
+    request_queue_size = 128
+
+
+class FixtureServer:
+    """
+    Сервер фикстур в фоновом потоке на 127.0.0.1. latency - задержка каждого ответа (секунды),
+    weight_limit - вес запросов на окно window секунд, после которого сервер отвечает 429.
+    """
+
+    def __init__(self, fixtures_dir: str = FIXTURES_DIR, latency: float = 0.0, weight_limit: int = 1200,
+                 window: float = 60.0, universe: int = 1000, port: int = 0):
+        self.latency = latency
+        self.weight_limit = weight_limit
+        self.window = window
+        self.stats = {'requests': 0, 'throttled': 0, 'bytes': 0}
+        self._window_start = time.monotonic()
+        self._used_weight = 0
+        self._lock = threading.Lock()
+        self._recorded_klines = {}
+        self.exchange_info = self._load(fixtures_dir, 'exchangeInfo.json')
+        tickers = self._load(fixtures_dir, 'ticker_price.json')
+        if self.exchange_info is None:
+            self.exchange_info = {'timezone': 'UTC', 'serverTime': 0, 'rateLimits': [],
+                                  'symbols': [_symbol_info(symbol) for symbol in synthetic_symbols(universe)]}
+        self.symbols = [entry['symbol'] for entry in self.exchange_info['symbols']]
+        self.prices = {ticker['symbol']: ticker['price'] for ticker in tickers or []}
+        for symbol in self.symbols:
+            self.prices.setdefault(symbol, f"{_base_price(symbol):.8f}")
+        if os.path.isdir(fixtures_dir):
+            for name in os.listdir(fixtures_dir):
+                if name.startswith('klines_') and name.endswith('.json'):
+                    symbol, interval = name[len('klines_'):-len('.json')].rsplit('_', 1)
+                    self._recorded_klines[(symbol, interval)] = self._load(fixtures_dir, name)
+        self._server = _HTTPServer(('127.0.0.1', port), self._handler())
+        self._thread = None
+
+    @staticmethod
+    def _load(fixtures_dir: str, name: str):
+        path = os.path.join(fixtures_dir, name)
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> 'FixtureServer':
+        self._thread = threading.Thread(target=self._server.serve_forever, name='fixture-server', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _spend(self, weight: int):
+        """Учитывает вес запроса. Возвращает (использованный вес в окне, секунд до конца окна или None)."""
+        with self._lock:
+            now = time.monotonic()
+            if now - self._window_start >= self.window:
+                self._window_start, self._used_weight = now, 0
+            if self._used_weight + weight > self.weight_limit:
+                self.stats['throttled'] += 1
+                return self._used_weight, self.window - (now - self._window_start)
+            self._used_weight += weight
+            self.stats['requests'] += 1
+            return self._used_weight, None
+
+    def klines(self, symbol: str, interval: str, start: int = None, end: int = None, limit: int = 500) -> list:
+        limit = min(limit, 1000)
+        step = INTERVAL_MS[interval]
+        recorded = self._recorded_klines.get((symbol, interval))
+        if recorded:
+            rows = [row for row in recorded if (start is None or row[0] >= start) and (end is None or row[0] <= end)]
+            return rows[:limit] if start is not None else rows[-limit:]
+        if start is None:
+            last = (end if end is not None else int(time.time() * 1000)) // step * step
+            start = last - (limit - 1) * step
+        count = limit if end is None else max(min(limit, (end - start) // step + 1), 0)
+        return synthetic_klines(symbol, interval, start, count)
+
+    def respond(self, path: str, query: dict):
+        """(HTTP-статус, тело ответа) для запроса path с параметрами query."""
+        if path == '/api/v3/klines':
+            symbol, interval = query.get('symbol'), query.get('interval')
+            if symbol not in self.prices or interval not in INTERVAL_MS:
+                return 400, {'code': -1121, 'msg': 'Invalid symbol.'}
+            return 200, self.klines(symbol, interval, int(query['startTime']) if 'startTime' in query else None,
+                                    int(query['endTime']) if 'endTime' in query else None,
+                                    int(query.get('limit', 500)))
+        if path == '/api/v3/ticker/price':
+            if 'symbol' in query:
+                symbol = query['symbol']
+                if symbol not in self.prices:
+                    return 400, {'code': -1121, 'msg': 'Invalid symbol.'}
+                return 200, {'symbol': symbol, 'price': self.prices[symbol]}
+            symbols = json.loads(query['symbols']) if 'symbols' in query else self.symbols
+            if any(symbol not in self.prices for symbol in symbols):
+                return 400, {'code': -1121, 'msg': 'Invalid symbol.'}
+            return 200, [{'symbol': symbol, 'price': self.prices[symbol]} for symbol in symbols]
+        if path == '/api/v3/exchangeInfo':
+            return 200, self.exchange_info
+        return 404, {'code': -1000, 'msg': 'Unknown path.'}
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                query = {key: values[-1] for key, values in parse_qs(parsed.query).items()}
+                weight = WEIGHTS.get(parsed.path, 1)
+                if parsed.path == '/api/v3/ticker/price' and 'symbol' not in query:
+                    weight = TICKER_MANY_WEIGHT
+                if server.latency:
+                    time.sleep(server.latency)
+                used, retry_after = server._spend(weight)
+                if retry_after is not None:
+                    status, body = 429, {'code': -1003, 'msg': 'Too many requests.'}
+                else:
+                    status, body = server.respond(parsed.path, query)
+                payload = json.dumps(body, separators=(',', ':')).encode()
+                server.stats['bytes'] += len(payload)
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.send_header('X-MBX-USED-WEIGHT-1M', str(used))
+                if retry_after is not None:
+                    self.send_header('Retry-After', str(max(int(retry_after + 0.999), 1)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+        return Handler
+
+
+def record(symbols, interval: str, limit: int, fixtures_dir: str = FIXTURES_DIR):
+    """Сохраняет настоящие ответы Binance в каталог фикстур."""
+    from binance_api_client import BinanceClient
+    client = BinanceClient(base_url='https://api.binance.com')
+    os.makedirs(fixtures_dir, exist_ok=True)
+    payloads = {'exchangeInfo.json': client.get_exchange_info(), 'ticker_price.json': client.get_ticker_prices()}
+    for symbol in symbols:
+        payloads[f'klines_{symbol}_{interval}.json'] = client.get_klines(symbol, interval, limit=limit)
+    for name, payload in payloads.items():
+        with open(os.path.join(fixtures_dir, name), 'w', encoding='utf-8') as f:
+            json.dump(payload, f, separators=(',', ':'))
+        print(f"Записано: {name}")
+    client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    record_parser = commands.add_parser('record')
+    record_parser.add_argument('--symbols', nargs='+', default=['BTCUSDT', 'ETHUSDT'])
+    record_parser.add_argument('--interval', default='1m')
+    record_parser.add_argument('--limit', type=int, default=1000)
+    serve_parser = commands.add_parser('serve')
+    serve_parser.add_argument('--port', type=int, default=8765)
+    serve_parser.add_argument('--latency', type=float, default=0.0)
+    serve_parser.add_argument('--weight-limit', type=int, default=1200)
+    args = parser.parse_args()
+    if args.command == 'record':
+        record(args.symbols, args.interval, args.limit)
+        return
+    server = FixtureServer(latency=args.latency, weight_limit=args.weight_limit, port=args.port)
+    print(f"Сервер фикстур: {server.url} (BINANCE_BASE_URL={server.url})")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,248 @@
+# benchmarks/suite.py
+"""
+Воспроизводимый набор замеров без обращения к api.binance.com: все клиенты Binance направляются
+на локальный сервер фикстур (benchmarks.fixture_server), база и кэши создаются во временном каталоге.
+
+Сценарии:
+    ingest          - загрузка свечей KlineBackfill в таблицу klines, свечей/с
+    analyze         - analyze_klines на 10 тыс. и 1 млн свечей
+    view_portfolio  - view_portfolio с 1/50/500 активами (кэш ответов сбрасывается перед каждым замером)
+    plot_prep       - подготовка данных графика (load_plot_series: весь ряд и окно в сутки)
+    startup         - холодный импорт main (python -X importtime)
+
+Результаты сохраняются в JSON (по умолчанию benchmarks/results/<коммит>.json) и могут сравниваться
+с прошлым прогоном: метрики *_per_sec лучше больше, остальные (мс) - меньше.
+
+Запуск из корня репозитория:
+    python -m benchmarks.suite --latency 0.005
+    python -m benchmarks.suite --quick --compare benchmarks/results/<прошлый коммит>.json
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(REPO_ROOT, 'benchmarks', 'results')
+SCENARIOS = ('ingest', 'analyze', 'view_portfolio', 'plot_prep', 'startup')
+
+# Фиксированный конец загружаемой истории: одинаковые данные в каждом прогоне
+HISTORY_END_MS = 1_700_006_400_000
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _median_ms(func, repeats: int) -> float:
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def _git_commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO_ROOT, capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=REPO_ROOT,
+                                    capture_output=True, text=True).stdout.strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, False
+
+
+def _seed_klines(symbol: str, rows: int):
+    """Кладёт rows минутных свечей symbol в хранилище напрямую, минуя сервер."""
+    from benchmarks.bench_kline_backends import make_batch
+    from kline_backends import get_kline_backend
+    get_kline_backend().upsert_batch(symbol, '1m', make_batch(rows, start_ms=HISTORY_END_MS - rows * 60_000))
+
+
+def bench_ingest(server, symbols: int, candles: int, concurrency: int) -> dict:
+    from backfill import KlineBackfill
+    from binance_api_client import BinanceClient
+    names = server.symbols[:symbols]
+    backfill = KlineBackfill(client=BinanceClient(pool_size=concurrency), concurrency=concurrency)
+    started = time.perf_counter()
+    stats = backfill.run_many(names, '1m', HISTORY_END_MS - candles * 60_000, HISTORY_END_MS, resume=False)
+    seconds = time.perf_counter() - started
+    backfill.client.close()
+    total = sum(item['candles'] for item in stats)
+    return {'candles': total, 'seconds': seconds, 'candles_per_sec': total / seconds}
+
+
+def bench_analyze(sizes, repeats: int) -> dict:
+    from main import analyze_klines
+    results = {}
+    for rows in sizes:
+        symbol = f"ANALYZE{rows}USDT"
+        _seed_klines(symbol, rows)
+        results[f'{rows}_rows_ms'] = _median_ms(lambda: analyze_klines(symbol, '1m'), repeats)
+    return results
+
+
+def bench_view_portfolio(server, sizes, repeats: int) -> dict:
+    import main
+    from rich.console import Console
+    from models import Session, Portfolio, Asset
+    main.console = Console(file=io.StringIO(), width=200)
+    symbols = [symbol for symbol in server.symbols if symbol.endswith('USDT')]
+    results = {}
+    for size in sizes:
+        name = f"bench{size}"
+        session = Session()
+        portfolio = Portfolio(name=name)
+        session.add(portfolio)
+        session.flush()
+        session.add_all(Asset(symbol=symbol, name=symbol, amount=1.5, portfolio_id=portfolio.id)
+                        for symbol in symbols[:size])
+        session.commit()
+        session.close()
+        manager = main.PortfolioManager()
+        manager.current_portfolio = manager._load_portfolio(name)
+
+        def view():
+            main.api_cache.clear()  # каждый замер включает запросы цен и курсов к серверу
+            main.view_portfolio(manager)
+
+        view()  # прогрев: ленивые импорты и первое соединение не должны попадать в замер
+        results[f'{size}_assets_ms'] = _median_ms(view, repeats)
+    return results
+
+
+def bench_plot_prep(rows: int, max_points: int, repeats: int) -> dict:
+    from downsample import load_plot_series
+    symbol = f"ANALYZE{rows}USDT"
+    return {
+        f'{rows}_rows_full_ms': _median_ms(lambda: load_plot_series(symbol, '1m', max_points=max_points), repeats),
+        f'{rows}_rows_day_ms': _median_ms(
+            lambda: load_plot_series(symbol, '1m', HISTORY_END_MS - 86_400_000, HISTORY_END_MS, max_points), repeats),
+    }
+
+
+def bench_startup(runs: int) -> dict:
+    from benchmarks.bench_startup import import_times
+    return {'import_main_ms': statistics.median(import_times()['main'] for _ in range(runs)) / 1000}
+
+
+def run_suite(args) -> dict:
+    port = _free_port()
+    # клиенты читают адрес API при импорте config, поэтому он задаётся до импорта модулей приложения
+    os.environ['BINANCE_BASE_URL'] = f"http://127.0.0.1:{port}"
+    sys.path.insert(0, REPO_ROOT)
+    from benchmarks.fixture_server import FixtureServer
+    from models import engine, init_db
+    from write_queue import write_queue
+
+    large = 100_000 if args.quick else 1_000_000
+    results = {}
+    try:
+        with FixtureServer(latency=args.latency, weight_limit=args.weight_limit, port=port) as server:
+            init_db(engine)
+            scenarios = args.only or SCENARIOS
+            if 'ingest' in scenarios:
+                results['ingest'] = bench_ingest(server, args.symbols, 20_000 if args.quick else args.candles,
+                                                 args.concurrency)
+            if 'analyze' in scenarios or 'plot_prep' in scenarios:
+                results['analyze'] = bench_analyze((10_000, large), args.repeats)
+            if 'view_portfolio' in scenarios:
+                results['view_portfolio'] = bench_view_portfolio(server, (1, 50, 500), args.repeats)
+            if 'plot_prep' in scenarios:
+                results['plot_prep'] = bench_plot_prep(large, 2000, args.repeats)
+            if 'startup' in scenarios:
+                results['startup'] = bench_startup(args.repeats)
+            results['server'] = dict(server.stats)
+    finally:
+        # фоновый цикл асинхронного клиента (курсы валют в view_portfolio) есть, только если main импортирован
+        if 'main' in sys.modules:
+            sys.modules['main'].close_async_client()
+        write_queue.close()
+        engine.dispose()
+    return results
+
+
+def flatten(results: dict) -> dict:
+    return {f"{scenario}.{name}": value for scenario, metrics in results.items() for name, value in metrics.items()
+            if isinstance(value, (int, float)) and scenario != 'server'}
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> list:
+    """Печатает изменения метрик относительно baseline; возвращает ухудшившиеся больше чем на threshold."""
+    old, new = flatten(baseline['results']), flatten(current['results'])
+    regressions = []
+    print(f"Сравнение с {(baseline.get('commit') or '?')[:10]}:")
+    for name in sorted(set(old) & set(new)):
+        if not old[name]:
+            continue
+        change = (new[name] - old[name]) / old[name]
+        worse = -change if name.endswith('_per_sec') else change
+        mark = ''
+        if worse > threshold:
+            mark = '  <- ухудшение'
+            regressions.append(name)
+        print(f"  {name:40} {old[name]:14,.2f} -> {new[name]:14,.2f} ({change:+.1%}){mark}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--only', nargs='*', choices=SCENARIOS, help="запустить только эти сценарии")
+    parser.add_argument('--quick', action='store_true', help="уменьшенные объёмы (100 тыс. свечей вместо 1 млн)")
+    parser.add_argument('--latency', type=float, default=0.005, help="задержка ответа сервера фикстур, секунды")
+    parser.add_argument('--weight-limit', type=int, default=6000, help="лимит веса запросов сервера в минуту")
+    parser.add_argument('--symbols', type=int, default=4)
+    parser.add_argument('--candles', type=int, default=50_000, help="свечей на символ для ingest")
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--output', help="файл результатов (по умолчанию benchmarks/results/<коммит>.json)")
+    parser.add_argument('--compare', metavar='BASELINE', help="JSON прошлого прогона для сравнения")
+    parser.add_argument('--threshold', type=float, default=0.10, help="допустимое ухудшение при сравнении")
+    args = parser.parse_args()
+
+    commit, dirty = _git_commit()
+    started = time.time()
+    with tempfile.TemporaryDirectory() as tmp:
+        cwd = os.getcwd()
+        os.chdir(tmp)  # portfolio.db, кэш ответов и архив свечей создаются во временном каталоге
+        try:
+            results = run_suite(args)
+        finally:
+            os.chdir(cwd)
+    report = {
+        'commit': commit,
+        'dirty': dirty,
+        'created_at': started,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'params': {name: value for name, value in vars(args).items() if name not in ('output', 'compare')},
+        'results': results,
+    }
+    for name, value in flatten(results).items():
+        print(f"{name:40} {value:14,.2f}")
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{(commit or 'local')[:10]}{'-dirty' if dirty else ''}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Результаты записаны в {output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            regressions = compare(json.load(f), report, args.threshold)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,15 +2,95 @@
 import time
 import hmac
 import hashlib
+import json
+import random
+import threading
+from collections import deque
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
 from urllib.parse import urlencode
 
-class BinanceClient:
-    BASE_URL = "https://api.binance.com"
+from config import BINANCE_WEIGHT_LIMIT, BINANCE_BASE_URL
+from metrics import metrics
 
-    def __init__(self, api_key=None, api_secret=None):
+
+class RequestWeightLimiter:
+    """
+    Ограничитель суммарного веса запросов к Binance в скользящем окне.
+    Потокобезопасен: один экземпляр можно разделять между потоками загрузки.
+    """
+
+    def __init__(self, max_weight=1200, window=60.0):
+        self.max_weight = max_weight
+        self.window = window
+        self._events = deque()  # (момент запроса, вес)
+        self._used = 0
+        self._lock = threading.Lock()
+
+    def _expire(self, now):
+        while self._events and now - self._events[0][0] >= self.window:
+            _, weight = self._events.popleft()
+            self._used -= weight
+
+    def acquire(self, weight=1):
+        """Блокирует поток, пока в окне не освободится нужный вес."""
+        weight = min(weight, self.max_weight)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._expire(now)
+                if self._used + weight <= self.max_weight:
+                    self._events.append((now, weight))
+                    self._used += weight
+                    return
+                wait = self.window - (now - self._events[0][0])
+            time.sleep(max(wait, 0.01))
+
+    @property
+    def used_weight(self):
+        with self._lock:
+            self._expire(time.monotonic())
+            return self._used
+
+
+# Общий ограничитель процесса: лимит веса Binance считается на IP, а не на отдельный загрузчик
+request_weight_limiter = RequestWeightLimiter(max_weight=BINANCE_WEIGHT_LIMIT)
+
+
+class BaseBinanceClient:
+    """
+    Общая часть синхронного и асинхронного клиентов Binance: подпись запросов,
+    учёт использованного веса, расчёт задержек и построение параметров методов API.
+    Наследники реализуют _send_request (обычный или async).
+    """
+    BASE_URL = BINANCE_BASE_URL
+    KLINES_MAX_LIMIT = 1000  # максимум свечей в одном ответе /api/v3/klines
+    KLINES_WEIGHT = 2  # вес запроса /api/v3/klines
+    RETRY_STATUSES = (418, 429, 500, 502, 503, 504)
+    # Повторяются только идемпотентные запросы: повтор подписанного POST/DELETE после ошибки
+    # или таймаута может выполнить заявку дважды. Остальные - лишь если запрос не был отправлен.
+    RETRY_METHODS = ('GET',)
+    SUPPORTED_METHODS = ('GET', 'POST', 'PUT', 'DELETE')
+    TICKER_BATCH_LIMIT = 100  # больше символов выгоднее получить одним запросом всех цен
+
+    def __init__(self, api_key=None, api_secret=None, base_url=None, max_retries=3,
+                 backoff=0.5, max_backoff=30.0, weight_limit=BINANCE_WEIGHT_LIMIT, throttle_ratio=0.9,
+                 timeout=10.0):
         self.api_key = api_key
         self.api_secret = api_secret
+        self.base_url = base_url or self.BASE_URL
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.weight_limit = weight_limit
+        self.throttle_ratio = throttle_ratio
+        self.timeout = timeout
+        # Использованный вес по заголовку X-MBX-USED-WEIGHT-1M и минута, к которой он относится
+        self.used_weight = 0
+        self._weight_minute = None
+        self._blocked_until = 0.0  # time.time(), до которого Binance просит не слать запросы
+        self._lock = threading.Lock()
 
     def _get_headers(self):
         headers = {}
@@ -26,25 +106,56 @@ class BinanceClient:
         params['signature'] = signature
         return params
 
-    def _send_request(self, method, path, params=None, signed=False):
-        url = self.BASE_URL + path
-        headers = self._get_headers()
-        if params is None:
-            params = {}
+    def _prepare_params(self, params, signed):
+        """Добавляет timestamp и подпись; вызывается перед каждой попыткой запроса."""
         if signed:
+            params.pop('signature', None)
             params['timestamp'] = int(time.time() * 1000)
             params = self._sign_params(params)
-        if method.upper() == 'GET':
-            response = requests.get(url, headers=headers, params=params)
-        elif method.upper() == 'POST':
-            response = requests.post(url, headers=headers, params=params)
-        elif method.upper() == 'PUT':
-            response = requests.put(url, headers=headers, params=params)
-        elif method.upper() == 'DELETE':
-            response = requests.delete(url, headers=headers, params=params)
-        else:
-            raise ValueError("Unsupported HTTP method")
-        return response.json()
+        return params
+
+    def _update_weight(self, headers):
+        used = headers.get('X-MBX-USED-WEIGHT-1M') or headers.get('X-MBX-USED-WEIGHT')
+        if used is None:
+            return
+        with self._lock:
+            self.used_weight = int(used)
+            self._weight_minute = int(time.time() // 60)
+        metrics.set('binance_used_weight', self.used_weight)
+
+    def _record_request(self, method, path, status, elapsed, size=0):
+        """Метрики одной попытки запроса: длительность по пути и статусу, объём ответа."""
+        metrics.observe('binance_request_seconds', elapsed, method=method, path=path, status=str(status))
+        metrics.inc('binance_response_bytes', size, path=path)
+
+    def _throttle_delay(self):
+        """
+        Сколько секунд подождать перед запросом: Binance прислал Retry-After или использованный вес
+        в текущей минуте подошёл к лимиту (счётчик Binance сбрасывается в начале минуты).
+        """
+        with self._lock:
+            now = time.time()
+            wait = self._blocked_until - now
+            if self._weight_minute == int(now // 60) and self.used_weight >= self.weight_limit * self.throttle_ratio:
+                wait = max(wait, 60 - now % 60)
+        return max(wait, 0.0)
+
+    def _retry_delay(self, attempt, headers=None):
+        """Экспоненциальная задержка с джиттером; Retry-After от сервера имеет приоритет."""
+        delay = min(self.max_backoff, self.backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+        if headers is not None and headers.get('Retry-After'):
+            retry_after = float(headers['Retry-After'])
+            with self._lock:
+                self._blocked_until = max(self._blocked_until, time.time() + retry_after)
+            delay = max(delay, retry_after)
+        return delay
+
+    def _can_retry(self, method, attempt, sent=True):
+        """Можно ли повторить попытку: есть ли ещё попытки и безопасен ли повтор для метода."""
+        return attempt < self.max_retries and (method in self.RETRY_METHODS or not sent)
+
+    def _send_request(self, method, path, params=None, signed=False):
+        raise NotImplementedError
 
     def get_klines(self, symbol, interval, startTime=None, endTime=None, limit=500):
         """
@@ -55,8 +166,108 @@ class BinanceClient:
             'interval': interval,
             'limit': limit
         }
-        if startTime:
+        if startTime is not None:
             params['startTime'] = startTime
-        if endTime:
+        if endTime is not None:
             params['endTime'] = endTime
         return self._send_request('GET', '/api/v3/klines', params)
+
+    def get_ticker_price(self, symbol):
+        """Текущая цена торговой пары: {'symbol': ..., 'price': ...}."""
+        return self._send_request('GET', '/api/v3/ticker/price', params={'symbol': symbol})
+
+    def get_ticker_prices(self, symbols=None):
+        """
+        Цены нескольких пар одним запросом (параметр symbols=["A","B"]) или всех пар биржи,
+        если symbols не задан. Возвращает список {'symbol': ..., 'price': ...}.
+        """
+        params = {}
+        if symbols is not None:
+            params['symbols'] = json.dumps(list(symbols), separators=(',', ':'))
+        return self._send_request('GET', '/api/v3/ticker/price', params=params)
+
+    def get_exchange_info(self):
+        """Правила торговли и список всех торговых пар биржи."""
+        return self._send_request('GET', '/api/v3/exchangeInfo')
+
+
+class BinanceClient(BaseBinanceClient):
+    def __init__(self, api_key=None, api_secret=None, base_url=None, pool_size=10, **kwargs):
+        super().__init__(api_key, api_secret, base_url, **kwargs)
+        # Одна сессия с пулом keep-alive соединений на весь клиент
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def close(self):
+        self.session.close()
+
+    def get_prices(self, symbols):
+        """
+        Цены списка символов за один-два запроса: сначала пакетный запрос по списку,
+        а если Binance отклонил его (например, из-за несуществующего символа) - все цены биржи.
+        Возвращает словарь {символ: цена}; символов без цены в словаре нет.
+        """
+        symbols = sorted(set(symbols))
+        if not symbols:
+            return {}
+        data = None
+        if len(symbols) <= self.TICKER_BATCH_LIMIT:
+            data = self.get_ticker_prices(symbols)
+        if not isinstance(data, list):
+            data = self.get_ticker_prices()
+        if not isinstance(data, list):
+            return {}
+        wanted = set(symbols)
+        prices = {}
+        for ticker in data:
+            if ticker.get('symbol') in wanted:
+                try:
+                    prices[ticker['symbol']] = float(ticker['price'])
+                except (KeyError, TypeError, ValueError):
+                    pass
+        return prices
+
+    def _send_request(self, method, path, params=None, signed=False):
+        method = method.upper()
+        if method not in self.SUPPORTED_METHODS:
+            raise ValueError("Unsupported HTTP method")
+        url = self.base_url + path
+        headers = self._get_headers()
+        if params is None:
+            params = {}
+        attempt = 0
+        while True:
+            params = self._prepare_params(params, signed)
+            time.sleep(self._throttle_delay())
+            started = time.perf_counter()
+            try:
+                response = self.session.request(method, url, headers=headers, params=params, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self._record_request(method, path, type(e).__name__, time.perf_counter() - started)
+                if not self._can_retry(method, attempt, sent=not self._not_sent(e)):
+                    raise
+                time.sleep(self._retry_delay(attempt))
+                attempt += 1
+                continue
+            self._record_request(method, path, response.status_code, time.perf_counter() - started,
+                                 len(response.content))
+            self._update_weight(response.headers)
+            if response.status_code in self.RETRY_STATUSES:
+                # Retry-After запоминается и без повтора: следующие запросы подождут
+                delay = self._retry_delay(attempt, response.headers)
+                # при длительном бане (418) повторять нет смысла: отдаём ошибку Binance вызывающему коду
+                if self._can_retry(method, attempt) and delay <= self.max_backoff:
+                    time.sleep(delay)
+                    attempt += 1
+                    continue
+            return response.json()
+
+    @staticmethod
+    def _not_sent(error):
+        """Запрос не ушёл на сервер: соединение не удалось установить."""
+        if isinstance(error, requests.ConnectTimeout):
+            return True
+        reason = getattr(error.args[0], 'reason', None) if error.args else None
+        return isinstance(reason, NewConnectionError)
@@ -0,0 +1,164 @@
+# cache.py
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlencode
+
+from binance_api_client import BinanceClient
+
+# Время жизни ответов по эндпоинтам Binance, секунды (None - не кэшировать)
+ENDPOINT_TTL = {
+    # exchangeInfo (несколько МБ) не кэшируется: пары хранит symbol_index в базе со своим TTL
+    '/api/v3/exchangeInfo': None,
+    '/api/v3/ticker/price': 2,
+    '/api/v3/klines': None,
+}
+
+
+class TTLCache:
+    """
+    Кэш в памяти процесса с временем жизни записей и вытеснением давно не использованных (LRU).
+    Если задан persist_path, записи дублируются в SQLite-файл и загружаются из него при старте,
+    так что новый процесс стартует с «тёплым» кэшем. В файл изменения пишутся пачками - одной
+    транзакцией раз в flush_interval секунд или по flush_every изменениям и при close(),
+    а не коммитом на каждый set (он на горячем пути цен).
+    Счётчики попаданий и промахов ведутся по пространствам имён (обычно - по эндпоинтам).
+    """
+
+    def __init__(self, max_entries: int = 1024, persist_path: str = None, flush_every: int = 256,
+                 flush_interval: float = 5.0):
+        self.max_entries = max_entries
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self._entries = OrderedDict()  # ключ -> (момент истечения, значение)
+        self._pending = {}  # ещё не записанные в файл изменения: ключ -> (момент истечения, значение) или None
+        self._flushed_at = time.monotonic()
+        self._lock = threading.RLock()
+        self.stats = {}  # пространство имён -> {'hits': n, 'misses': n}
+        self._db = None
+        if persist_path:
+            self._db = sqlite3.connect(persist_path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, expires_at REAL, value TEXT)")
+            self._load()
+
+    def _load(self):
+        now = time.time()
+        self._db.execute("DELETE FROM cache WHERE expires_at <= ?", (now,))
+        self._db.commit()
+        rows = self._db.execute("SELECT key, expires_at, value FROM cache ORDER BY expires_at").fetchall()
+        for key, expires_at, value in rows[-self.max_entries:]:
+            self._entries[key] = (expires_at, json.loads(value))
+
+    def _count(self, namespace: str, field: str):
+        counters = self.stats.setdefault(namespace, {'hits': 0, 'misses': 0})
+        counters[field] += 1
+
+    def get(self, key: str, namespace: str = 'default'):
+        """Возвращает (True, значение) при попадании и (False, None) при промахе."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.time():
+                self._entries.move_to_end(key)
+                self._count(namespace, 'hits')
+                return True, entry[1]
+            if entry is not None:
+                self._delete(key)
+            self._count(namespace, 'misses')
+            return False, None
+
+    def set(self, key: str, value, ttl: float):
+        with self._lock:
+            expires_at = time.time() + ttl
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            if self._db is not None:
+                self._pending[key] = (expires_at, value)
+            while len(self._entries) > self.max_entries:
+                self._delete(next(iter(self._entries)))
+            if self._pending and (len(self._pending) >= self.flush_every
+                                  or time.monotonic() - self._flushed_at >= self.flush_interval):
+                self.flush()
+
+    def _delete(self, key: str):
+        self._entries.pop(key, None)
+        if self._db is not None:
+            self._pending[key] = None
+
+    def flush(self):
+        """Записывает накопленные изменения в файл одной транзакцией."""
+        with self._lock:
+            if self._db is None or not self._pending:
+                return
+            self._db.executemany("DELETE FROM cache WHERE key = ?",
+                                 [(key,) for key, entry in self._pending.items() if entry is None])
+            self._db.executemany("INSERT OR REPLACE INTO cache (key, expires_at, value) VALUES (?, ?, ?)",
+                                 [(key, entry[0], json.dumps(entry[1]))
+                                  for key, entry in self._pending.items() if entry is not None])
+            self._db.commit()
+            self._pending.clear()
+            self._flushed_at = time.monotonic()
+
+    def close(self):
+        """Дописывает изменения в файл и закрывает его; дальше кэш работает только в памяти."""
+        with self._lock:
+            if self._db is not None:
+                self.flush()
+                self._db.close()
+                self._db = None
+
+    def get_or_load(self, key: str, ttl: float, loader, namespace: str = 'default', force: bool = False,
+                    cacheable=None):
+        """
+        Значение из кэша или результат loader(), который сохраняется на ttl секунд.
+        cacheable(значение) -> bool: если задан и вернул False, результат не кэшируется (например, неудачный).
+        """
+        if not force:
+            hit, value = self.get(key, namespace)
+            if hit:
+                return value
+        else:
+            with self._lock:
+                self._count(namespace, 'misses')
+        value = loader()
+        if cacheable is None or cacheable(value):
+            self.set(key, value, ttl)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._pending.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM cache")
+                self._db.commit()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class CachedBinanceClient(BinanceClient):
+    """
+    BinanceClient, у которого неподписанные GET-запросы проходят через TTLCache.
+    Время жизни берётся из ENDPOINT_TTL по пути запроса; пути без TTL не кэшируются.
+    """
+
+    def __init__(self, cache: TTLCache = None, endpoint_ttl: dict = None, **kwargs):
+        super().__init__(**kwargs)
+        self.cache = cache or TTLCache()
+        self.endpoint_ttl = dict(ENDPOINT_TTL, **(endpoint_ttl or {}))
+
+    def _send_request(self, method, path, params=None, signed=False):
+        ttl = self.endpoint_ttl.get(path)
+        if signed or method.upper() != 'GET' or not ttl:
+            return super()._send_request(method, path, params, signed)
+        key = path + '?' + urlencode(sorted((params or {}).items()))
+        hit, value = self.cache.get(key, namespace=path)
+        if hit:
+            return value
+        value = super()._send_request(method, path, params, signed)
+        # ошибки Binance (словарь с полем code) не кэшируем
+        if not (isinstance(value, dict) and 'code' in value):
+            self.cache.set(key, value, ttl)
+        return value
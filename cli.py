@@ -0,0 +1,348 @@
+# cli.py
+"""
+Неинтерактивный интерфейс: подкоманды для загрузки свечей, анализа, экспорта и оценки портфелей,
+а также планировщик, который запускает эти же подкоманды по расписанию.
+
+Примеры:
+    python cli.py ingest --symbols BTCUSDT ETHUSDT --interval 1m --start 7d --resample
+    python cli.py analyze --symbols BTCUSDT --interval 1h --start 2024-01-01
+    python cli.py export --interval 1d --output analysis_report.csv
+    python cli.py export-klines --interval 1m --format parquet --indicators --output-dir exports
+    python cli.py value-portfolio --portfolios main --history 1h --start 365d --output value.csv
+    python cli.py import-holdings clients.csv --replace
+    python cli.py export-holdings holdings.json
+    python cli.py schedule --jobs jobs.json --workers 4
+    python cli.py --metrics metrics.jsonl ingest --symbols BTCUSDT --start 1d
+"""
+import argparse
+import csv
+import json
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from rich.table import Table
+
+from backfill import KlineBackfill
+from config import INTERVAL_MS, DERIVED_INTERVALS, SCHEDULER_LOG_FILE, EXPORT_DIR, EXPORT_WORKERS
+from kline_archive import aggregate_history
+from kline_export import export_klines, FORMATS
+from main import console, binance_client, api_cache, close_async_client, export_analysis, \
+    update_all_fiat_rates_from_binance
+from metrics import metrics
+from models import Session, engine, init_db
+from portfolio_bulk import value_all_portfolios, read_holdings, import_holdings, export_holdings
+from portfolio_history import compute_portfolio_history
+from resample import resample_all
+from valuation import format_money
+from write_queue import write_queue
+
+_DURATION_UNITS = {'s': 1_000, 'm': 60_000, 'h': 3_600_000, 'd': 86_400_000, 'w': 7 * 86_400_000}
+_DURATION_RE = re.compile(r'^(\d+)([smhdw])$')
+
+
+def parse_duration(value: str) -> int:
+    """Длительность вида 30s, 5m, 1h, 7d, 2w в миллисекундах."""
+    match = _DURATION_RE.match(value.strip())
+    if not match:
+        raise argparse.ArgumentTypeError(f"Неверная длительность: {value}")
+    return int(match.group(1)) * _DURATION_UNITS[match.group(2)]
+
+
+def parse_time(value: str) -> int:
+    """
+    Момент времени в мс: число (мс с эпохи), длительность назад от текущего момента (7d, 12h)
+    или дата ISO 8601 (без часового пояса считается UTC).
+    """
+    value = value.strip()
+    if value.isdigit():
+        return int(value)
+    if _DURATION_RE.match(value):
+        return int(time.time() * 1000) - parse_duration(value)
+    try:
+        moment = datetime.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Неверное время: {value}")
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int(moment.timestamp() * 1000)
+
+
+def _symbols(values):
+    return [symbol.strip().upper() for value in values or [] for symbol in value.split(',') if symbol.strip()]
+
+
+def cmd_ingest(args) -> dict:
+    """Догружает свечи символов через REST (с high-water mark) и при --resample строит старшие интервалы."""
+    if not _symbols(args.symbols):
+        console.print("[red]Не заданы символы (--symbols).[/red]")
+        return {'rows': 0}
+    backfill = KlineBackfill(client=binance_client, concurrency=args.concurrency)
+    start = args.start if args.start is not None else int(time.time() * 1000) - INTERVAL_MS[args.interval] * 1000
+    stats = backfill.run_many(_symbols(args.symbols), args.interval, start, args.end)
+    rows = sum(item['new'] for item in stats)
+    for item in stats:
+        console.print(f"[green]{item['symbol']} {item['interval']}: страниц {item['pages']}, свечей {item['candles']}, "
+                      f"новых {item['new']}, ошибок {item['errors']}, {item['seconds']:.2f} с[/green]")
+    if args.resample:
+        resampled = write_queue.call(resample_all, _symbols(args.symbols), base_interval=args.interval,
+                                     intervals=[i for i in DERIVED_INTERVALS if INTERVAL_MS[i] > INTERVAL_MS[args.interval]])
+        rows += sum(item['inserted'] for item in resampled.values())
+        console.print(f"[green]Построено свечей старших интервалов: "
+                      f"{sum(item['inserted'] for item in resampled.values())}[/green]")
+    return {'rows': rows, 'symbols': len(stats)}
+
+
+def _analysis(args):
+    session = Session()
+    try:
+        symbols = _symbols(args.symbols) or None
+        return aggregate_history(session, symbols=symbols, interval=args.interval, start=args.start, end=args.end)
+    finally:
+        session.close()
+
+
+def cmd_analyze(args) -> dict:
+    results = _analysis(args)
+    if not results:
+        console.print("[red]Нет данных для анализа.[/red]")
+        return {'rows': 0}
+    table = Table(title="Анализ исторических данных")
+    for key in results[0]:
+        table.add_column(key, justify="right")
+    for row in results:
+        table.add_row(*[str(value) for value in row.values()])
+    console.print(table)
+    return {'rows': len(results)}
+
+
+def cmd_export(args) -> dict:
+    results = _analysis(args)
+    export_analysis(results, args.output)
+    return {'rows': len(results)}
+
+
+def cmd_export_klines(args) -> dict:
+    """Потоковая выгрузка свечей (и индикаторов) по файлу на символ, с продолжением от прошлой выгрузки."""
+    results = export_klines(_symbols(args.symbols) or None, args.interval, args.output_dir, args.format,
+                            args.start, args.end, indicators=args.indicators, resume=not args.full,
+                            workers=args.workers)
+    for result in results:
+        if result['file']:
+            console.print(f"[green]{result['symbol']}: {result['rows']} строк -> {result['file']}[/green]")
+        else:
+            console.print(f"[yellow]{result['symbol']}: новых свечей нет.[/yellow]")
+    return {'rows': sum(result['rows'] for result in results)}
+
+
+def cmd_value_portfolio(args) -> dict:
+    """Текущая стоимость портфелей (все валюты) и при --history - ряд стоимости во времени в CSV."""
+    session = Session()
+    try:
+        update_all_fiat_rates_from_binance()
+        result = value_all_portfolios(session, binance_client.get_prices, args.portfolios)
+        portfolios = {portfolio['id']: portfolio['name'] for portfolio in result['portfolios']}
+        currencies = result['currencies']
+
+        table = Table(title=f"Стоимость портфелей (различных символов: {result['symbols']})")
+        table.add_column("Портфель", style="cyan")
+        for curr in currencies:
+            table.add_column(curr, justify="right")
+        for portfolio in result['portfolios']:
+            table.add_row(portfolio['name'], *[format_money(portfolio['totals'][curr], curr) for curr in currencies])
+            if portfolio['missing']:
+                console.print(f"[yellow]{portfolio['name']}: нет цены для {', '.join(portfolio['missing'])}[/yellow]")
+        console.print(table)
+
+        rows = len(portfolios)
+        if args.history:
+            history = compute_portfolio_history(session, list(portfolios), args.history, args.start, args.end)
+            with open(args.output, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.writer(f)
+                writer.writerow(['portfolio', 'open_time', 'value_usd'])
+                for portfolio_id, series in history.items():
+                    writer.writerows(zip([portfolios[portfolio_id]] * len(series['times']),
+                                         series['times'].tolist(), series['value'].tolist()))
+                    rows += len(series['times'])
+            console.print(f"[green]История стоимости записана в {args.output}.[/green]")
+        return {'rows': rows}
+    finally:
+        session.close()
+
+
+def cmd_import_holdings(args) -> dict:
+    """Позиции портфелей из CSV/JSON одной транзакцией; при ошибках в файле ничего не записывается."""
+    holdings, errors = read_holdings(args.file)
+    for number, error in errors:
+        console.print(f"[red]Запись #{number}: {error}[/red]")
+    if errors:
+        raise ValueError(f"{args.file}: некорректных записей {len(errors)}")
+    stats = write_queue.call(import_holdings, holdings, replace=args.replace)
+    console.print(f"[green]{args.file}: позиций {len(holdings)}, создано портфелей {stats['portfolios_created']}, "
+                  f"добавлено {stats['inserted']}, обновлено {stats['updated']}, удалено {stats['removed']}.[/green]")
+    return {'rows': len(holdings)}
+
+
+def cmd_export_holdings(args) -> dict:
+    session = Session()
+    try:
+        count = export_holdings(session, args.file, args.portfolios)
+    finally:
+        session.close()
+    console.print(f"[green]Позиций: {count}, записано в {args.file}.[/green]")
+    return {'rows': count}
+
+
+class Scheduler:
+    """
+    Запускает подкоманды CLI по расписанию в пуле потоков.
+    Задание: {"name": ..., "every": "5m", "args": ["ingest", "--symbols", "BTCUSDT", ...]}.
+    Задание не запускается повторно, пока не завершился его предыдущий запуск.
+    Итог каждого запуска (время, длительность, число строк, ошибка) дописывается строкой JSON в log_path.
+    """
+
+    def __init__(self, jobs, workers: int = 4, log_path: str = SCHEDULER_LOG_FILE, tick: float = 1.0):
+        self.jobs = [dict(job, every_ms=parse_duration(job['every'])) for job in jobs]
+        self.workers = workers
+        self.log_path = log_path
+        self.tick = tick
+        self._log_lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def _log(self, record: dict):
+        with self._log_lock, open(self.log_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def run_job(self, job: dict) -> dict:
+        started_at = datetime.now(timezone.utc).isoformat(timespec='seconds')
+        started = time.perf_counter()
+        record = {'job': job['name'], 'command': job['args'][0], 'started_at': started_at}
+        try:
+            args = build_parser().parse_args(job['args'])
+            result = args.func(args) or {}
+            record.update(status='ok', rows=result.get('rows', 0))
+        except Exception as e:
+            record.update(status='error', rows=0, error=f"{type(e).__name__}: {e}")
+        except SystemExit as e:
+            record.update(status='error', rows=0, error=f"неверные аргументы ({e.code})")
+        record['seconds'] = round(time.perf_counter() - started, 3)
+        self._log(record)
+        return record
+
+    def run(self, max_seconds: float = None):
+        """Основной цикл; завершается по stop(), Ctrl+C или через max_seconds."""
+        deadline = None if max_seconds is None else time.monotonic() + max_seconds
+        next_run = {job['name']: time.monotonic() for job in self.jobs}
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            try:
+                while not self._stop.is_set() and (deadline is None or time.monotonic() < deadline):
+                    now = time.monotonic()
+                    for job in self.jobs:
+                        future = running.get(job['name'])
+                        if now >= next_run[job['name']] and (future is None or future.done()):
+                            running[job['name']] = executor.submit(self.run_job, job)
+                            next_run[job['name']] = now + job['every_ms'] / 1000
+                    self._stop.wait(self.tick)
+            except KeyboardInterrupt:
+                console.print("\n[bold red]Планировщик остановлен пользователем.[/bold red]")
+
+    def stop(self):
+        self._stop.set()
+
+
+def cmd_schedule(args) -> dict:
+    with open(args.jobs, encoding='utf-8') as f:
+        jobs = json.load(f)
+    console.print(f"[bold blue]Планировщик: заданий {len(jobs)}, потоков {args.workers}, журнал {args.log}[/bold blue]")
+    Scheduler(jobs, workers=args.workers, log_path=args.log).run(args.max_seconds)
+    return {'rows': 0}
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--metrics', metavar='FILE', help="дописать метрики запуска в JSONL-файл (.prom - Prometheus)")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    def add_range(command, interval_default=None):
+        command.add_argument('--symbols', nargs='*', help="символы через пробел или запятую")
+        command.add_argument('--interval', default=interval_default, choices=sorted(INTERVAL_MS, key=INTERVAL_MS.get))
+        command.add_argument('--start', type=parse_time, help="мс, ISO-дата или давность (7d)")
+        command.add_argument('--end', type=parse_time)
+
+    ingest = commands.add_parser('ingest', help="загрузить свечи с Binance")
+    add_range(ingest, '1m')
+    ingest.add_argument('--concurrency', type=int, default=4)
+    ingest.add_argument('--resample', action='store_true', help="построить старшие интервалы из загруженных")
+    ingest.set_defaults(func=cmd_ingest)
+
+    analyze = commands.add_parser('analyze', help="статистика по сохранённым свечам")
+    # статистика считается по одному интервалу: средние и объёмы по смеси интервалов бессмысленны
+    add_range(analyze, '1m')
+    analyze.set_defaults(func=cmd_analyze)
+
+    export = commands.add_parser('export', help="экспорт статистики в CSV")
+    add_range(export, '1m')
+    export.add_argument('--output', default='analysis_report.csv')
+    export.set_defaults(func=cmd_export)
+
+    export_klines_parser = commands.add_parser('export-klines', help="выгрузка истории свечей в CSV/gzip/Parquet")
+    add_range(export_klines_parser, '1m')
+    export_klines_parser.add_argument('--format', default='csv', choices=sorted(FORMATS))
+    export_klines_parser.add_argument('--output-dir', default=EXPORT_DIR)
+    export_klines_parser.add_argument('--indicators', action='store_true', help="добавить колонки индикаторов")
+    export_klines_parser.add_argument('--full', action='store_true',
+                                      help="не продолжать с отметки прошлой выгрузки и не сдвигать её")
+    export_klines_parser.add_argument('--workers', type=int, default=EXPORT_WORKERS, help="символов параллельно")
+    export_klines_parser.set_defaults(func=cmd_export_klines)
+
+    value = commands.add_parser('value-portfolio', help="стоимость портфелей")
+    value.add_argument('--portfolios', nargs='*', help="названия портфелей (по умолчанию все)")
+    value.add_argument('--history', choices=sorted(INTERVAL_MS, key=INTERVAL_MS.get),
+                       help="интервал ряда стоимости во времени")
+    value.add_argument('--start', type=parse_time)
+    value.add_argument('--end', type=parse_time)
+    value.add_argument('--output', default='portfolio_value.csv')
+    value.set_defaults(func=cmd_value_portfolio)
+
+    import_parser = commands.add_parser('import-holdings', help="импорт позиций портфелей из CSV/JSON")
+    import_parser.add_argument('file', help="CSV (portfolio,symbol,amount[,name]) или JSON")
+    import_parser.add_argument('--replace', action='store_true',
+                               help="удалить из затронутых портфелей активы, которых нет в файле")
+    import_parser.set_defaults(func=cmd_import_holdings)
+
+    export_parser = commands.add_parser('export-holdings', help="экспорт позиций портфелей в CSV/JSON")
+    export_parser.add_argument('file')
+    export_parser.add_argument('--portfolios', nargs='*', help="названия портфелей (по умолчанию все)")
+    export_parser.set_defaults(func=cmd_export_holdings)
+
+    schedule = commands.add_parser('schedule', help="запуск заданий по расписанию")
+    schedule.add_argument('--jobs', required=True, help="JSON-файл со списком заданий")
+    schedule.add_argument('--workers', type=int, default=4)
+    schedule.add_argument('--log', default=SCHEDULER_LOG_FILE)
+    schedule.add_argument('--max-seconds', type=float, help="остановиться через указанное время")
+    schedule.set_defaults(func=cmd_schedule)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    init_db(engine)
+    try:
+        args.func(args)
+    finally:
+        binance_client.close()
+        close_async_client()
+        api_cache.close()
+        if args.metrics:
+            if args.metrics.endswith('.prom'):
+                metrics.write_prometheus(args.metrics)
+            else:
+                metrics.export_jsonl(args.metrics)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
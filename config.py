@@ -1,4 +1,6 @@
 # config.py
+import os
+
 conversion_rates = {
     "USD": 1.0,
     "RUB": 60.0,
@@ -14,3 +16,90 @@ currency_symbols = {
     "GBP": "£",
     "JPY": "¥",
 }
+
+# Длительность интервалов свечей Binance в миллисекундах
+INTERVAL_MS = {
+    "1m": 60_000,
+    "3m": 3 * 60_000,
+    "5m": 5 * 60_000,
+    "15m": 15 * 60_000,
+    "30m": 30 * 60_000,
+    "1h": 3_600_000,
+    "2h": 2 * 3_600_000,
+    "4h": 4 * 3_600_000,
+    "6h": 6 * 3_600_000,
+    "8h": 8 * 3_600_000,
+    "12h": 12 * 3_600_000,
+    "1d": 86_400_000,
+    "3d": 3 * 86_400_000,
+    "1w": 7 * 86_400_000,
+}
+
+# Сдвиг начала свечи относительно эпохи: недельные свечи Binance начинаются в понедельник 00:00 UTC
+INTERVAL_OFFSET_MS = {
+    "1w": 4 * 86_400_000,
+}
+
+# Базовый интервал, из которого локально строятся старшие интервалы
+BASE_INTERVAL = "1m"
+DERIVED_INTERVALS = ("5m", "15m", "1h", "4h", "1d", "1w")
+
+# Лимит веса запросов Binance в минуту (для одного IP)
+BINANCE_WEIGHT_LIMIT = 1200
+
+# Адрес REST API Binance; переменная окружения позволяет направить клиентов на тестовый или локальный сервер
+BINANCE_BASE_URL = os.environ.get("BINANCE_BASE_URL", "https://api.binance.com")
+
+# Кэш ответов Binance: файл для сохранения между запусками (None - только в памяти) и размер
+API_CACHE_FILE = "api_cache.db"
+API_CACHE_MAX_ENTRIES = 1024
+# Время жизни курсов фиатных валют в кэше, секунды
+FIAT_RATES_TTL = 60
+# Цена из WebSocket-потока считается актуальной не дольше, секунды
+LIVE_PRICE_MAX_AGE = 10
+# Каталог колоночного архива закрытых свечей
+KLINE_ARCHIVE_DIR = "kline_archive"
+
+# Журнал запусков заданий планировщика (по строке JSON на запуск)
+SCHEDULER_LOG_FILE = "jobs.jsonl"
+
+# База данных и профили настройки SQLite (PRAGMA применяются к каждому новому соединению)
+DATABASE_URL = "sqlite:///portfolio.db"
+STORAGE_PROFILES = {
+    # WAL: читатели не блокируются писателем; synchronous=NORMAL в WAL-режиме безопасен при сбое процесса
+    "tuned": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "mmap_size": 256 * 1024 * 1024,
+        "cache_size": -64 * 1024,  # отрицательное значение - размер в КиБ
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,
+    },
+    # Поведение SQLite по умолчанию (журнал отката, полная синхронизация)
+    "safe": {
+        "journal_mode": "DELETE",
+        "synchronous": "FULL",
+        "busy_timeout": 5000,
+    },
+}
+STORAGE_PROFILE = "tuned"
+# Размер пула соединений для читателей
+DB_POOL_SIZE = 8
+
+# Хранилище свечей: "sqlite" (таблица klines в DATABASE_URL), "duckdb" или "postgres" (в т.ч. TimescaleDB)
+KLINE_BACKEND = "sqlite"
+DUCKDB_PATH = "klines.duckdb"
+POSTGRES_DSN = "postgresql://localhost/portfolio"
+
+# Индекс торговых пар exchangeInfo: как часто сверяться с биржей (секунды) и строк на странице списка
+SYMBOL_INDEX_TTL = 3600
+SYMBOL_PAGE_SIZE = 40
+
+# Метрики производительности (metrics.py): включены ли и куда выгружать
+METRICS_ENABLED = True
+METRICS_JSONL_FILE = "metrics.jsonl"
+METRICS_PROM_FILE = "metrics.prom"
+
+# Потоковая выгрузка истории свечей и индикаторов (kline_export.py): каталог файлов и число параллельных символов
+EXPORT_DIR = "exports"
+EXPORT_WORKERS = 4
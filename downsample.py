@@ -0,0 +1,109 @@
+# downsample.py
+import numpy as np
+
+from config import BASE_INTERVAL, DERIVED_INTERVALS, INTERVAL_MS
+from kline_archive import load_history, aggregate_history
+from models import Session
+
+# Сколько точек рисовать на графике по умолчанию
+DEFAULT_MAX_POINTS = 2000
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Индексы точек, выбранных алгоритмом Largest-Triangle-Three-Buckets.
+    Сохраняет визуальную форму линии (пики и провалы) при сокращении до threshold точек;
+    первая и последняя точки всегда остаются.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    # Границы корзин для всех точек, кроме первой и последней
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    prev = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # Третья вершина треугольника - среднее следующей корзины (или последняя точка)
+        next_lo, next_hi = hi, edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[next_lo:next_hi].mean() if next_hi > next_lo else x[-1]
+        avg_y = y[next_lo:next_hi].mean() if next_hi > next_lo else y[-1]
+        area = np.abs((x[prev] - avg_x) * (y[lo:hi] - y[prev]) - (x[prev] - x[lo:hi]) * (avg_y - y[prev]))
+        prev = lo + int(np.argmax(area))
+        selected[i + 1] = prev
+    return selected
+
+
+def ohlc_buckets(data: dict, bucket_ms: int, offset_ms: int = 0) -> dict:
+    """
+    Агрегирует свечи в корзины длиной bucket_ms: open - первой свечи, close - последней,
+    high/low - экстремумы, volume - сумма. Корзины выровнены по эпохе, сдвинутой на offset_ms.
+    """
+    open_time = data['open_time']
+    if not len(open_time):
+        return {name: values[:0] for name, values in data.items()}
+    keys = (open_time - offset_ms) // bucket_ms
+    starts = np.r_[0, np.flatnonzero(keys[1:] != keys[:-1]) + 1]
+    ends = np.r_[starts[1:], len(open_time)] - 1
+    result = {'open_time': keys[starts] * bucket_ms + offset_ms}
+    if 'open' in data:
+        result['open'] = data['open'][starts]
+    if 'high' in data:
+        result['high'] = np.maximum.reduceat(data['high'], starts)
+    if 'low' in data:
+        result['low'] = np.minimum.reduceat(data['low'], starts)
+    if 'close' in data:
+        result['close'] = data['close'][ends]
+    if 'volume' in data:
+        result['volume'] = np.add.reduceat(data['volume'], starts)
+    return result
+
+
+def plot_resolutions(interval: str, window_ms: int, max_points: int = DEFAULT_MAX_POINTS) -> list:
+    """
+    Интервалы, которыми можно нарисовать окно window_ms: от самого крупного из interval и
+    DERIVED_INTERVALS, у которого в окне ещё не меньше max_points свечей, до самого interval.
+    """
+    candidates = sorted({interval} | {name for name in DERIVED_INTERVALS if INTERVAL_MS[name] > INTERVAL_MS[interval]},
+                        key=INTERVAL_MS.get, reverse=True)
+    for index, name in enumerate(candidates):
+        if window_ms // INTERVAL_MS[name] >= max_points:
+            return candidates[index:]
+    return candidates[-1:]
+
+
+def load_plot_series(symbol: str, interval: str = BASE_INTERVAL, start: int = None, end: int = None,
+                     max_points: int = DEFAULT_MAX_POINTS):
+    """
+    Ряд (open_time в мс, close) свечей interval для графика за [start, end), не длиннее max_points точек.
+    Окно читается сразу с разрешением, близким к max_points (построенные старшие интервалы, см. resample),
+    а не целиком по свечам interval: пока старший интервал не построен, берётся следующий помельче.
+    Остаток сокращается LTTB. Чем уже окно, тем ближе результат к исходным свечам.
+    """
+    empty = np.empty(0, np.int64), np.empty(0, np.float64)
+    session = Session()
+    try:
+        if start is None or end is None:
+            extent = aggregate_history(session, [symbol], interval, start, end)
+            if not extent:
+                return empty
+            start = extent[0]['first_open_time'] if start is None else start
+            end = extent[0]['last_open_time'] + 1 if end is None else end
+        resolutions = plot_resolutions(interval, end - start, max_points)
+        for name in resolutions:
+            history = load_history(session, [symbol], name, start, end, columns=('open_time', 'close')).get(symbol)
+            expected = min((end - start) // INTERVAL_MS[name], max_points)
+            # старший интервал построен не для всего окна - берём помельче
+            if name == resolutions[-1] or (history is not None and len(history['open_time']) >= expected // 2):
+                break
+    finally:
+        session.close()
+    if history is None:
+        return empty
+    times, closes = history['open_time'], history['close']
+    keep = lttb(times, closes, max_points)
+    return np.asarray(times[keep]), np.asarray(closes[keep])
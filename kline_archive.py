@@ -0,0 +1,323 @@
+# kline_archive.py
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+
+from config import KLINE_ARCHIVE_DIR
+from kline_backends import get_kline_backend
+from kline_store import OHLCV_COLUMNS, STREAM_CHUNK_SIZE, aggregate_row
+from write_queue import write_queue
+
+ARCHIVE_COLUMNS = OHLCV_COLUMNS + ('close_time',)
+_COLUMN_DTYPES = {name: (np.int64 if name in ('open_time', 'close_time') else np.float64) for name in ARCHIVE_COLUMNS}
+
+
+def _empty_columns(columns=ARCHIVE_COLUMNS) -> dict:
+    return {name: np.empty(0, _COLUMN_DTYPES[name]) for name in columns}
+
+
+def _month_key(open_time_ms) -> np.ndarray:
+    return np.asarray(open_time_ms).astype('datetime64[ms]').astype('datetime64[M]')
+
+
+class KlineArchive:
+    """
+    Колоночный архив закрытых свечей на диске.
+    Для каждой пары (символ, интервал) свечи лежат посегментно (один сегмент - календарный месяц UTC),
+    каждая колонка сегмента - отдельный .npy-файл. Файлы читаются через np.load(mmap_mode='r'),
+    поэтому чтение диапазона внутри сегмента не копирует данные. index.json хранит границы
+    сегментов по open_time - по нему выбираются нужные файлы без чтения остальных.
+    Файлы не сжимаются: сжатие несовместимо с отображением в память.
+    """
+
+    def __init__(self, root: str = KLINE_ARCHIVE_DIR):
+        self.root = root
+
+    def _series_dir(self, symbol: str, interval: str) -> str:
+        return os.path.join(self.root, symbol, interval)
+
+    def load_index(self, symbol: str, interval: str) -> dict:
+        path = os.path.join(self._series_dir(symbol, interval), 'index.json')
+        if not os.path.exists(path):
+            return {'segments': [], 'archived_until': None}
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+
+    def _save_index(self, symbol: str, interval: str, index: dict):
+        path = os.path.join(self._series_dir(symbol, interval), 'index.json')
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f, indent=1)
+        os.replace(tmp_path, path)
+
+    def symbols(self):
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(name for name in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, name)))
+
+    def intervals(self, symbol: str):
+        path = os.path.join(self.root, symbol)
+        if not os.path.isdir(path):
+            return []
+        return sorted(name for name in os.listdir(path) if os.path.isdir(os.path.join(path, name)))
+
+    def _read_segment(self, symbol: str, interval: str, name: str, columns=ARCHIVE_COLUMNS) -> dict:
+        segment_dir = os.path.join(self._series_dir(symbol, interval), name)
+        return {column: np.load(os.path.join(segment_dir, column + '.npy'), mmap_mode='r') for column in columns}
+
+    def _write_segment(self, symbol: str, interval: str, name: str, data: dict):
+        series_dir = self._series_dir(symbol, interval)
+        segment_dir = os.path.join(series_dir, name)
+        new_dir, old_dir = segment_dir + '.new', segment_dir + '.old'
+        shutil.rmtree(new_dir, ignore_errors=True)
+        os.makedirs(new_dir)
+        for column in ARCHIVE_COLUMNS:
+            np.save(os.path.join(new_dir, column + '.npy'), np.ascontiguousarray(data[column], _COLUMN_DTYPES[column]))
+        if os.path.exists(segment_dir):
+            os.replace(segment_dir, old_dir)
+        os.replace(new_dir, segment_dir)
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+    def append(self, symbol: str, interval: str, data: dict) -> int:
+        """
+        Дописывает в архив свечи (колонки ARCHIVE_COLUMNS, упорядочены по open_time),
+        которые новее уже заархивированных. Возвращает число добавленных свечей.
+        """
+        index = self.load_index(symbol, interval)
+        open_time = np.asarray(data['open_time'])
+        if index['archived_until'] is not None:
+            keep = open_time >= index['archived_until']
+            data = {column: np.asarray(data[column])[keep] for column in ARCHIVE_COLUMNS}
+            open_time = data['open_time']
+        if not len(open_time):
+            return 0
+        os.makedirs(self._series_dir(symbol, interval), exist_ok=True)
+        segments = {segment['name']: segment for segment in index['segments']}
+        months = _month_key(open_time)
+        boundaries = np.flatnonzero(months[1:] != months[:-1]) + 1
+        for chunk_start, chunk_end in zip(np.r_[0, boundaries], np.r_[boundaries, len(open_time)]):
+            name = str(months[chunk_start])
+            chunk = {column: data[column][chunk_start:chunk_end] for column in ARCHIVE_COLUMNS}
+            if name in segments:
+                existing = self._read_segment(symbol, interval, name)
+                chunk = {column: np.concatenate([existing[column], chunk[column]]) for column in ARCHIVE_COLUMNS}
+            self._write_segment(symbol, interval, name, chunk)
+            segments[name] = {'name': name, 'start': int(chunk['open_time'][0]),
+                              'end': int(chunk['open_time'][-1]) + 1, 'rows': len(chunk['open_time'])}
+        index['segments'] = sorted(segments.values(), key=lambda segment: segment['start'])
+        index['archived_until'] = index['segments'][-1]['end']
+        self._save_index(symbol, interval, index)
+        return len(open_time)
+
+    def read_range(self, symbol: str, interval: str, start: int = None, end: int = None,
+                   columns=ARCHIVE_COLUMNS) -> dict:
+        """
+        Колонки архива за [start, end). Если диапазон лежит в одном сегменте, возвращаются
+        срезы отображённых в память файлов без копирования.
+        """
+        parts = []
+        for segment in self.load_index(symbol, interval)['segments']:
+            if (end is not None and segment['start'] >= end) or (start is not None and segment['end'] <= start):
+                continue
+            data = self._read_segment(symbol, interval, segment['name'], set(columns) | {'open_time'})
+            open_time = data['open_time']
+            lo = 0 if start is None else int(np.searchsorted(open_time, start, 'left'))
+            hi = len(open_time) if end is None else int(np.searchsorted(open_time, end, 'left'))
+            if hi > lo:
+                parts.append({column: data[column][lo:hi] for column in columns})
+        if not parts:
+            return _empty_columns(columns)
+        if len(parts) == 1:
+            return parts[0]
+        return {column: np.concatenate([part[column] for part in parts]) for column in columns}
+
+    def iter_range(self, symbol: str, interval: str, start: int = None, end: int = None,
+                   columns=ARCHIVE_COLUMNS, chunk_size: int = STREAM_CHUNK_SIZE):
+        """
+        Колонки архива за [start, end) порциями не длиннее chunk_size: сегменты открываются по одному,
+        порции - срезы отображённых в память файлов, поэтому память не растёт с длиной диапазона.
+        """
+        for segment in self.load_index(symbol, interval)['segments']:
+            if (end is not None and segment['start'] >= end) or (start is not None and segment['end'] <= start):
+                continue
+            data = self._read_segment(symbol, interval, segment['name'], set(columns) | {'open_time'})
+            open_time = data['open_time']
+            lo = 0 if start is None else int(np.searchsorted(open_time, start, 'left'))
+            hi = len(open_time) if end is None else int(np.searchsorted(open_time, end, 'left'))
+            for offset in range(lo, hi, chunk_size):
+                yield {column: data[column][offset:min(offset + chunk_size, hi)] for column in columns}
+
+
+def compact_klines(session, symbol: str, interval: str, before: int = None, archive: KlineArchive = None,
+                   backend=None) -> int:
+    """
+    Переносит закрытые свечи symbol/interval с open_time < before (по умолчанию - всё закрытое
+    к текущему моменту) из хранилища свечей (backend, по умолчанию KLINE_BACKEND из config) в архив
+    и удаляет их из хранилища. Возвращает количество перенесённых свечей.
+    """
+    archive = archive or KlineArchive()
+    backend = backend or get_kline_backend()
+    now_ms = int(time.time() * 1000)
+    before = now_ms if before is None else before
+    data = backend.load_ohlcv([symbol], interval, end=before, columns=ARCHIVE_COLUMNS, session=session).get(symbol)
+    # чтение завершается до удаления через очередь записи: при журнале DELETE открытая транзакция
+    # чтения не дала бы очереди зафиксировать удаление
+    session.commit()
+    if data is None:
+        return 0
+    closed = data['close_time'] < now_ms
+    data = {column: values[closed] for column, values in data.items()}
+    archived = archive.append(symbol, interval, data)
+    archived_until = archive.load_index(symbol, interval)['archived_until']
+    if archived_until is not None:
+        write_queue.call(_delete_archived, backend, symbol, interval, archived_until)
+    return archived
+
+
+def _delete_archived(session, backend, symbol: str, interval: str, archived_until: int):
+    backend.delete_range(symbol, interval, end=archived_until, session=session)
+
+
+def _hot_queries(session, symbols, interval, start, archive: KlineArchive, backend) -> list:
+    """
+    Запросы к «горячему» хвосту без свечей, которые уже есть в архиве (повторно загруженных после
+    архивации): символы без архива читаются одним запросом, ряды с архивом - каждый со своего
+    archived_until. Без interval ряды символа с архивом перебираются по интервалам хранилища.
+    Возвращает список (символы, интервал, начало) для запросов к хранилищу свечей.
+    """
+    archived = set(archive.symbols())
+    if symbols is None:
+        if not archived:
+            return [(None, interval, start)]
+        symbols = backend.symbols(interval, session=session)
+    plain, queries = [], []
+    for symbol in symbols:
+        if symbol not in archived:
+            plain.append(symbol)
+            continue
+        for series_interval in [interval] if interval is not None else backend.intervals(symbol, session=session):
+            archived_until = archive.load_index(symbol, series_interval)['archived_until']
+            if archived_until is not None:
+                series_start = archived_until if start is None else max(start, archived_until)
+                queries.append(([symbol], series_interval, series_start))
+            elif interval is not None:
+                plain.append(symbol)
+            else:
+                queries.append(([symbol], series_interval, start))
+    if plain:
+        queries.insert(0, (plain, interval, start))
+    return queries
+
+
+def load_history(session, symbols=None, interval: str = None, start: int = None, end: int = None,
+                 columns=OHLCV_COLUMNS, archive: KlineArchive = None, backend=None) -> dict:
+    """
+    Читает историю свечей прозрачно из архива и «горячего» хвоста в хранилище свечей (backend,
+    по умолчанию KLINE_BACKEND из config). Формат результата совпадает с kline_store.load_ohlcv:
+    {символ: {колонка: np.ndarray}}. Если interval не задан, данные всех интервалов символа
+    объединяются и сортируются по времени.
+    """
+    archive = archive or KlineArchive()
+    backend = backend or get_kline_backend()
+    hot = {}
+    for query_symbols, query_interval, query_start in _hot_queries(session, symbols, interval, start, archive,
+                                                                   backend):
+        if query_start is not None and end is not None and query_start >= end:
+            continue
+        for symbol, data in backend.load_ohlcv(query_symbols, query_interval, query_start, end, columns=columns,
+                                               session=session).items():
+            hot.setdefault(symbol, []).append(data)
+    wanted = set(hot) | set(archive.symbols())
+    if symbols is not None:
+        wanted &= set(symbols)
+
+    result = {}
+    for symbol in sorted(wanted):
+        parts = []
+        intervals = [interval] if interval is not None else archive.intervals(symbol)
+        for series_interval in intervals:
+            part = archive.read_range(symbol, series_interval, start, end, columns)
+            if len(part['open_time']):
+                parts.append(part)
+        parts.extend(hot.get(symbol, []))
+        if not parts:
+            continue
+        if len(parts) == 1:
+            result[symbol] = parts[0]
+            continue
+        merged = {column: np.concatenate([part[column] for part in parts]) for column in columns}
+        if interval is None:
+            order = np.argsort(merged['open_time'], kind='stable')
+            merged = {column: values[order] for column, values in merged.items()}
+        result[symbol] = merged
+    return result
+
+
+def iter_history(session, symbol: str, interval: str, start: int = None, end: int = None, columns=OHLCV_COLUMNS,
+                 chunk_size: int = STREAM_CHUNK_SIZE, archive: KlineArchive = None, backend=None):
+    """
+    Потоковый вариант load_history для одного ряда: порции не длиннее chunk_size строк в порядке
+    open_time - сначала из архива, затем «горячий» хвост из хранилища свечей (курсор с yield_per).
+    """
+    archive = archive or KlineArchive()
+    backend = backend or get_kline_backend()
+    archived_until = archive.load_index(symbol, interval)['archived_until']
+    if archived_until is not None:
+        archive_end = archived_until if end is None else min(end, archived_until)
+        yield from archive.iter_range(symbol, interval, start, archive_end, columns, chunk_size)
+        # свечи, повторно загруженные в хранилище после архивации, уже есть в архиве
+        start = archived_until if start is None else max(start, archived_until)
+    if start is None or end is None or start < end:
+        yield from backend.iter_ohlcv(symbol, interval, start, end, columns, chunk_size, session=session)
+
+
+def _merge_aggregates(parts: list) -> dict:
+    """Объединяет показатели aggregate_klines по непересекающимся частям истории одного символа."""
+    parts = sorted(parts, key=lambda part: part['first_open_time'])
+    count = sum(part['data_points'] for part in parts)
+    merged = dict(parts[0])
+    merged.update({
+        'data_points': count,
+        'avg_close': sum(part['avg_close'] * part['data_points'] for part in parts) / count,
+        'max_close': max(part['max_close'] for part in parts),
+        'min_close': min(part['min_close'] for part in parts),
+        'total_volume': sum(part['total_volume'] for part in parts),
+    })
+    last = max(parts, key=lambda part: part['last_open_time'])
+    merged['last_close'] = last['last_close']
+    merged['last_open_time'] = last['last_open_time']
+    return merged
+
+
+def aggregate_history(session, symbols=None, interval: str = None, start: int = None, end: int = None,
+                      archive: KlineArchive = None, backend=None):
+    """
+    Те же показатели, что и kline_store.aggregate_klines, но с учётом архива:
+    «горячий» хвост агрегируется запросом в хранилище свечей (без свечей, уже лежащих в архиве),
+    архивные сегменты - в NumPy, результаты объединяются.
+    """
+    archive = archive or KlineArchive()
+    backend = backend or get_kline_backend()
+    parts = {}
+    for query_symbols, query_interval, query_start in _hot_queries(session, symbols, interval, start, archive,
+                                                                   backend):
+        if query_start is not None and end is not None and query_start >= end:
+            continue
+        for row in backend.aggregate(query_symbols, query_interval, query_start, end, session=session):
+            parts.setdefault(row['symbol'], []).append(dict(row, interval=interval or 'all'))
+    archived_symbols = archive.symbols() if symbols is None else [s for s in symbols if s in archive.symbols()]
+    for symbol in archived_symbols:
+        intervals = [interval] if interval is not None else archive.intervals(symbol)
+        for series_interval in intervals:
+            data = archive.read_range(symbol, series_interval, start, end, ('open_time', 'close', 'volume'))
+            close = data['close']
+            if not len(close):
+                continue
+            parts.setdefault(symbol, []).append(aggregate_row(
+                (symbol, len(close), float(np.mean(close)), float(np.max(close)), float(np.min(close)),
+                 float(close[0]), float(close[-1]), float(np.sum(data['volume'])),
+                 int(data['open_time'][0]), int(data['open_time'][-1])), interval))
+    return [_merge_aggregates(parts[symbol]) for symbol in sorted(parts)]
@@ -0,0 +1,403 @@
+# kline_backends.py
+import csv
+import io
+import threading
+
+import numpy as np
+
+from config import KLINE_BACKEND, DUCKDB_PATH, POSTGRES_DSN
+from kline_store import (upsert_batch, aggregate_klines, load_ohlcv, iter_ohlcv, kline_symbols, kline_intervals,
+                         delete_klines, aggregate_row,
+                         parse_valid_klines, OHLCV_COLUMNS, TIME_COLUMNS, STREAM_CHUNK_SIZE, _KEY_COLUMNS, _VALUE_COLUMNS)
+from models import Session
+
+_COLUMNS = _KEY_COLUMNS + _VALUE_COLUMNS
+
+
+class KlineBackend:
+    """
+    Хранилище свечей с единым API для путей записи и чтения.
+    upsert_batch/upsert_klines - запись, load_ohlcv - колонки NumPy (формат kline_store.load_ohlcv),
+    iter_ohlcv - те же колонки одного ряда порциями, aggregate - статистика (формат kline_store.aggregate_klines).
+    Параметр session нужен только SQLite: запись идёт в транзакции вызывающего кода
+    (вместе с high-water mark); остальные хранилища фиксируют запись сами.
+    """
+    name = None
+
+    def upsert_batch(self, symbol: str, interval: str, batch: dict, update: bool = False, session=None) -> dict:
+        raise NotImplementedError
+
+    def upsert_klines(self, symbol: str, interval: str, raw_rows, update: bool = False, session=None) -> dict:
+        """Разбирает свечи в формате Binance API и сохраняет их; некорректные строки попадают в errors."""
+        batch, errors = parse_valid_klines(raw_rows)
+        result = self.upsert_batch(symbol, interval, batch, update, session)
+        result['errors'] = errors
+        return result
+
+    def load_ohlcv(self, symbols=None, interval: str = None, start: int = None, end: int = None,
+                   columns=OHLCV_COLUMNS, session=None) -> dict:
+        raise NotImplementedError
+
+    def iter_ohlcv(self, symbol: str, interval: str, start: int = None, end: int = None, columns=OHLCV_COLUMNS,
+                   chunk_size: int = STREAM_CHUNK_SIZE, session=None):
+        """Колонки одного ряда порциями по chunk_size строк: память не зависит от длины диапазона."""
+        raise NotImplementedError
+
+    def aggregate(self, symbols=None, interval: str = None, start: int = None, end: int = None, session=None) -> list:
+        raise NotImplementedError
+
+    def symbols(self, interval: str = None, session=None) -> list:
+        """Символы, для которых в хранилище есть свечи (interval - только этого интервала)."""
+        raise NotImplementedError
+
+    def intervals(self, symbol: str, session=None) -> list:
+        """Интервалы, для которых в хранилище есть свечи символа."""
+        raise NotImplementedError
+
+    def delete_range(self, symbol: str, interval: str, start: int = None, end: int = None, session=None) -> int:
+        """Удаляет свечи symbol/interval с open_time в [start, end); возвращает число удалённых строк."""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class SQLiteKlineBackend(KlineBackend):
+    """Таблица klines в SQLite через SQLAlchemy (функции kline_store)."""
+    name = 'sqlite'
+
+    def __init__(self, session_factory=None):
+        self.session_factory = session_factory or Session
+
+    def _call(self, func, session, commit: bool, *args, **kwargs):
+        if session is not None:
+            return func(session, *args, **kwargs)
+        session = self.session_factory()
+        try:
+            result = func(session, *args, **kwargs)
+            if commit:
+                session.commit()
+            return result
+        finally:
+            session.close()
+
+    def upsert_batch(self, symbol, interval, batch, update=False, session=None):
+        return self._call(upsert_batch, session, True, symbol, interval, batch, update)
+
+    def load_ohlcv(self, symbols=None, interval=None, start=None, end=None, columns=OHLCV_COLUMNS, session=None):
+        return self._call(load_ohlcv, session, False, symbols, interval, start, end, columns)
+
+    def iter_ohlcv(self, symbol, interval, start=None, end=None, columns=OHLCV_COLUMNS,
+                   chunk_size=STREAM_CHUNK_SIZE, session=None):
+        if session is not None:
+            yield from iter_ohlcv(session, symbol, interval, start, end, columns, chunk_size)
+            return
+        session = self.session_factory()
+        try:
+            yield from iter_ohlcv(session, symbol, interval, start, end, columns, chunk_size)
+        finally:
+            session.close()
+
+    def aggregate(self, symbols=None, interval=None, start=None, end=None, session=None):
+        return self._call(aggregate_klines, session, False, symbols, interval, start, end)
+
+    def symbols(self, interval=None, session=None):
+        return self._call(kline_symbols, session, False, interval)
+
+    def intervals(self, symbol, session=None):
+        return self._call(kline_intervals, session, False, symbol)
+
+    def delete_range(self, symbol, interval, start=None, end=None, session=None):
+        return self._call(delete_klines, session, True, symbol, interval, start, end)
+
+
+def _where(symbols, interval, start, end, placeholder: str):
+    """Условие WHERE и параметры для фильтров по символам, интервалу и окну open_time."""
+    conditions, params = [], []
+    if symbols is not None:
+        symbols = list(symbols)
+        if not symbols:
+            return "WHERE FALSE", []
+        conditions.append(f"symbol IN ({', '.join([placeholder] * len(symbols))})")
+        params.extend(symbols)
+    if interval is not None:
+        conditions.append(f"interval = {placeholder}")
+        params.append(interval)
+    if start is not None:
+        conditions.append(f"open_time >= {placeholder}")
+        params.append(int(start))
+    if end is not None:
+        conditions.append(f"open_time < {placeholder}")
+        params.append(int(end))
+    return ("WHERE " + " AND ".join(conditions)) if conditions else "", params
+
+
+def _split_by_symbol(symbol_column, data: dict) -> dict:
+    """Режет упорядоченные по символу колонки на {символ: {колонка: массив}}."""
+    result = {}
+    if not len(symbol_column):
+        return result
+    boundaries = np.flatnonzero(symbol_column[1:] != symbol_column[:-1]) + 1
+    for lo, hi in zip(np.r_[0, boundaries], np.r_[boundaries, len(symbol_column)]):
+        result[str(symbol_column[lo])] = {name: np.ascontiguousarray(values[lo:hi]) for name, values in data.items()}
+    return result
+
+
+def _typed(columns, arrays) -> dict:
+    return {name: np.asarray(values, dtype=np.int64 if name in TIME_COLUMNS else np.float64)
+            for name, values in zip(columns, arrays)}
+
+
+_CREATE_TABLE_SQL = (
+    "CREATE TABLE IF NOT EXISTS klines (symbol VARCHAR NOT NULL, interval VARCHAR NOT NULL, "
+    "open_time BIGINT NOT NULL, open DOUBLE PRECISION NOT NULL, high DOUBLE PRECISION NOT NULL, "
+    "low DOUBLE PRECISION NOT NULL, close DOUBLE PRECISION NOT NULL, volume DOUBLE PRECISION NOT NULL, "
+    "close_time BIGINT NOT NULL, PRIMARY KEY (symbol, interval, open_time))"
+)
+
+
+def _conflict_sql(update: bool) -> str:
+    if not update:
+        return f"ON CONFLICT ({', '.join(_KEY_COLUMNS)}) DO NOTHING"
+    return (f"ON CONFLICT ({', '.join(_KEY_COLUMNS)}) DO UPDATE SET "
+            + ", ".join(f"{name} = excluded.{name}" for name in _VALUE_COLUMNS))
+
+
+def _aggregate_sql(where: str, first_close: str, last_close: str) -> str:
+    return (f"SELECT symbol, count(*), avg(close), max(close), min(close), {first_close}, {last_close}, "
+            f"sum(volume), min(open_time), max(open_time) FROM klines {where} GROUP BY symbol ORDER BY symbol")
+
+
+class DuckDBKlineBackend(KlineBackend):
+    """
+    Встроенная колоночная СУБД DuckDB: быстрые сканы и агрегаты по многолетней истории.
+    Пакет записывается одним INSERT ... SELECT из словаря массивов NumPy без построчных параметров,
+    выборка возвращается сразу колонками NumPy (fetchnumpy).
+    """
+    name = 'duckdb'
+
+    def __init__(self, path: str = DUCKDB_PATH):
+        try:
+            import duckdb
+        except ImportError:
+            raise RuntimeError("Для хранилища duckdb установите пакет duckdb (pip install duckdb)")
+        self._connection = duckdb.connect(path)
+        self._connection.execute(_CREATE_TABLE_SQL)
+        self._lock = threading.Lock()
+
+    def upsert_batch(self, symbol, interval, batch, update=False, session=None):
+        count = len(batch['open_time'])
+        if not count:
+            return {'inserted': 0, 'skipped': 0}
+        frame = {name: batch[name] for name in ('open_time',) + _VALUE_COLUMNS}
+        with self._lock:
+            cursor = self._connection.cursor()
+            try:
+                cursor.register('kline_batch', frame)
+                if update:
+                    before = cursor.execute(
+                        "SELECT count(*) FROM klines WHERE symbol = ? AND interval = ? AND open_time BETWEEN ? AND ?",
+                        [symbol, interval, int(batch['open_time'][0]), int(batch['open_time'][-1])]).fetchone()[0]
+                # символ и интервал передаются параметрами: строковые колонки в кадре заметно замедляют register
+                written = cursor.execute(f"INSERT INTO klines ({', '.join(_COLUMNS)}) "
+                                         f"SELECT ?, ?, {', '.join(('open_time',) + _VALUE_COLUMNS)} "
+                                         f"FROM kline_batch {_conflict_sql(update)}", [symbol, interval]
+                                         ).fetchone()[0]
+                cursor.unregister('kline_batch')
+            finally:
+                cursor.close()
+        inserted = count - before if update else written
+        return {'inserted': inserted, 'skipped': count - inserted}
+
+    def load_ohlcv(self, symbols=None, interval=None, start=None, end=None, columns=OHLCV_COLUMNS, session=None):
+        where, params = _where(symbols, interval, start, end, '?')
+        with self._lock:
+            cursor = self._connection.cursor()
+            try:
+                data = cursor.execute(f"SELECT symbol, {', '.join(columns)} FROM klines {where} "
+                                      f"ORDER BY symbol, open_time", params).fetchnumpy()
+            finally:
+                cursor.close()
+        return _split_by_symbol(data['symbol'], _typed(columns, (data[name] for name in columns)))
+
+    def iter_ohlcv(self, symbol, interval, start=None, end=None, columns=OHLCV_COLUMNS,
+                   chunk_size=STREAM_CHUNK_SIZE, session=None):
+        where, params = _where([symbol], interval, start, end, '?')
+        # курсор DuckDB - отдельное соединение с той же базой: блокировка нужна только на его создание,
+        # и долгое чтение не задерживает запись и другие выборки
+        with self._lock:
+            cursor = self._connection.cursor()
+        try:
+            cursor.execute(f"SELECT {', '.join(columns)} FROM klines {where} ORDER BY open_time", params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield _typed(columns, zip(*rows))
+        finally:
+            cursor.close()
+
+    def aggregate(self, symbols=None, interval=None, start=None, end=None, session=None):
+        where, params = _where(symbols, interval, start, end, '?')
+        with self._lock:
+            cursor = self._connection.cursor()
+            try:
+                rows = cursor.execute(_aggregate_sql(where, "arg_min(close, open_time)", "arg_max(close, open_time)"),
+                                      params).fetchall()
+            finally:
+                cursor.close()
+        return [aggregate_row(row, interval) for row in rows]
+
+    def symbols(self, interval=None, session=None):
+        where, params = _where(None, interval, None, None, '?')
+        with self._lock:
+            cursor = self._connection.cursor()
+            try:
+                rows = cursor.execute(f"SELECT DISTINCT symbol FROM klines {where} ORDER BY symbol", params).fetchall()
+            finally:
+                cursor.close()
+        return [symbol for (symbol,) in rows]
+
+    def intervals(self, symbol, session=None):
+        with self._lock:
+            cursor = self._connection.cursor()
+            try:
+                rows = cursor.execute("SELECT DISTINCT interval FROM klines WHERE symbol = ? ORDER BY interval",
+                                      [symbol]).fetchall()
+            finally:
+                cursor.close()
+        return [interval for (interval,) in rows]
+
+    def delete_range(self, symbol, interval, start=None, end=None, session=None):
+        where, params = _where([symbol], interval, start, end, '?')
+        with self._lock:
+            cursor = self._connection.cursor()
+            try:
+                return cursor.execute(f"DELETE FROM klines {where}", params).fetchone()[0]
+            finally:
+                cursor.close()
+
+    def close(self):
+        self._connection.close()
+
+
+class PostgresKlineBackend(KlineBackend):
+    """
+    PostgreSQL (или TimescaleDB, если расширение установлено - таблица становится гипертаблицей по open_time).
+    Пакет загружается через COPY во временную таблицу и переносится одним INSERT ... ON CONFLICT.
+    """
+    name = 'postgres'
+
+    # Размер чанка гипертаблицы TimescaleDB: неделя в мс
+    CHUNK_INTERVAL_MS = 7 * 86_400_000
+
+    def __init__(self, dsn: str = POSTGRES_DSN):
+        try:
+            import psycopg2
+        except ImportError:
+            raise RuntimeError("Для хранилища postgres установите пакет psycopg2 (pip install psycopg2-binary)")
+        self._dsn = dsn
+        self._connection = psycopg2.connect(dsn)
+        self._lock = threading.Lock()
+        with self._connection, self._connection.cursor() as cursor:
+            cursor.execute(_CREATE_TABLE_SQL)
+            cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'timescaledb'")
+            if cursor.fetchone():
+                cursor.execute("SELECT create_hypertable('klines', 'open_time', chunk_time_interval => %s, "
+                               "if_not_exists => TRUE)", (self.CHUNK_INTERVAL_MS,))
+
+    def upsert_batch(self, symbol, interval, batch, update=False, session=None):
+        count = len(batch['open_time'])
+        if not count:
+            return {'inserted': 0, 'skipped': 0}
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, delimiter='\t', lineterminator='\n')
+        writer.writerows(zip([symbol] * count, [interval] * count,
+                             *(batch[name].tolist() for name in ('open_time',) + _VALUE_COLUMNS)))
+        buffer.seek(0)
+        with self._lock, self._connection, self._connection.cursor() as cursor:
+            cursor.execute("CREATE TEMP TABLE IF NOT EXISTS klines_stage (LIKE klines) ON COMMIT DELETE ROWS")
+            cursor.copy_expert(f"COPY klines_stage ({', '.join(_COLUMNS)}) FROM STDIN", buffer)
+            # xmax = 0 только у вставленных строк: так обновлённые не считаются новыми
+            cursor.execute(f"INSERT INTO klines ({', '.join(_COLUMNS)}) SELECT {', '.join(_COLUMNS)} FROM klines_stage "
+                           f"{_conflict_sql(update)} RETURNING (xmax = 0)")
+            inserted = sum(1 for (is_new,) in cursor.fetchall() if is_new)
+        return {'inserted': inserted, 'skipped': count - inserted}
+
+    def load_ohlcv(self, symbols=None, interval=None, start=None, end=None, columns=OHLCV_COLUMNS, session=None):
+        where, params = _where(symbols, interval, start, end, '%s')
+        with self._lock, self._connection, self._connection.cursor() as cursor:
+            cursor.execute(f"SELECT symbol, {', '.join(columns)} FROM klines {where} ORDER BY symbol, open_time", params)
+            rows = cursor.fetchall()
+        if not rows:
+            return {}
+        transposed = list(zip(*rows))
+        return _split_by_symbol(np.array(transposed[0], dtype=object), _typed(columns, transposed[1:]))
+
+    def iter_ohlcv(self, symbol, interval, start=None, end=None, columns=OHLCV_COLUMNS,
+                   chunk_size=STREAM_CHUNK_SIZE, session=None):
+        import psycopg2
+        where, params = _where([symbol], interval, start, end, '%s')
+        # именованный (серверный) курсор живёт до конца транзакции, поэтому у потокового чтения
+        # своё соединение: общие запросы коммитят транзакцию общего соединения
+        connection = psycopg2.connect(self._dsn)
+        try:
+            with connection, connection.cursor(name='kline_stream') as cursor:
+                cursor.itersize = chunk_size
+                cursor.execute(f"SELECT {', '.join(columns)} FROM klines {where} ORDER BY open_time", params)
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    yield _typed(columns, zip(*rows))
+        finally:
+            connection.close()
+
+    def aggregate(self, symbols=None, interval=None, start=None, end=None, session=None):
+        where, params = _where(symbols, interval, start, end, '%s')
+        with self._lock, self._connection, self._connection.cursor() as cursor:
+            cursor.execute(_aggregate_sql(where, "(array_agg(close ORDER BY open_time))[1]",
+                                          "(array_agg(close ORDER BY open_time DESC))[1]"), params)
+            rows = cursor.fetchall()
+        return [aggregate_row(row, interval) for row in rows]
+
+    def symbols(self, interval=None, session=None):
+        where, params = _where(None, interval, None, None, '%s')
+        with self._lock, self._connection, self._connection.cursor() as cursor:
+            cursor.execute(f"SELECT DISTINCT symbol FROM klines {where} ORDER BY symbol", params)
+            return [symbol for (symbol,) in cursor.fetchall()]
+
+    def intervals(self, symbol, session=None):
+        with self._lock, self._connection, self._connection.cursor() as cursor:
+            cursor.execute("SELECT DISTINCT interval FROM klines WHERE symbol = %s ORDER BY interval", (symbol,))
+            return [interval for (interval,) in cursor.fetchall()]
+
+    def delete_range(self, symbol, interval, start=None, end=None, session=None):
+        where, params = _where([symbol], interval, start, end, '%s')
+        with self._lock, self._connection, self._connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM klines {where}", params)
+            return cursor.rowcount
+
+    def close(self):
+        self._connection.close()
+
+
+BACKENDS = {
+    'sqlite': SQLiteKlineBackend,
+    'duckdb': DuckDBKlineBackend,
+    'postgres': PostgresKlineBackend,
+}
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def get_kline_backend(name: str = None) -> KlineBackend:
+    """Общий для процесса экземпляр хранилища свечей; по умолчанию - KLINE_BACKEND из config."""
+    name = name or KLINE_BACKEND
+    with _backends_lock:
+        if name not in _backends:
+            if name not in BACKENDS:
+                raise ValueError(f"Неизвестное хранилище свечей: {name}")
+            _backends[name] = BACKENDS[name]()
+        return _backends[name]
@@ -0,0 +1,242 @@
+# kline_export.py
+import csv
+import gzip
+import json
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from datetime import datetime, timezone
+from functools import partial
+from itertools import repeat
+
+import numpy as np
+
+from analytics import IndicatorStream
+from config import EXPORT_DIR, EXPORT_WORKERS
+from kline_archive import KlineArchive, iter_history, ARCHIVE_COLUMNS
+from kline_backends import get_kline_backend
+from kline_store import STREAM_CHUNK_SIZE, TIME_COLUMNS
+from metrics import metrics
+from models import Session
+from resample import bucket_start
+
+# Формат выгрузки -> расширение файла
+FORMATS = {'csv': '.csv', 'csv.gz': '.csv.gz', 'parquet': '.parquet'}
+INDICATOR_COLUMNS = ('returns', 'log_returns', 'volatility', 'vwap', 'sma', 'ema', 'drawdown', 'atr')
+# Файл отметок выгрузки в каталоге выгрузки
+WATERMARK_FILE = 'export_state.json'
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError("Для выгрузки в Parquet установите пакет pyarrow (pip install pyarrow)")
+    return pyarrow
+
+
+class _CSVWriter:
+    """CSV (или CSV в gzip) с заголовком; NaN индикаторов записываются пустыми ячейками."""
+
+    def __init__(self, path: str, columns, compress: bool):
+        if compress:
+            # уровень 6 (как у zlib по умолчанию) заметно быстрее 9 при почти том же размере
+            self._file = gzip.open(path, 'wt', newline='', encoding='utf-8', compresslevel=6)
+        else:
+            self._file = open(path, 'w', newline='', encoding='utf-8')
+        self.columns = columns
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(columns)
+
+    def write(self, symbol: str, data: dict):
+        values = [data[name].tolist() if name in ARCHIVE_COLUMNS else
+                  np.where(np.isnan(data[name]), None, data[name]).tolist() for name in self.columns[1:]]
+        self._writer.writerows(zip(repeat(symbol, len(data['open_time'])), *values))
+
+    def close(self):
+        self._file.close()
+
+
+class _ParquetWriter:
+    """Parquet (сжатие zstd): каждая порция - отдельная группа строк, NaN индикаторов - null."""
+
+    def __init__(self, path: str, columns):
+        pa = _pyarrow()
+        self._pa = pa
+        self.columns = columns
+        fields = [('symbol', pa.dictionary(pa.int32(), pa.string()))]
+        fields += [(name, pa.int64() if name in TIME_COLUMNS else pa.float64()) for name in columns[1:]]
+        self._schema = pa.schema(fields)
+        self._writer = pa.parquet.ParquetWriter(path, self._schema, compression='zstd')
+
+    def write(self, symbol: str, data: dict):
+        pa = self._pa
+        count = len(data['open_time'])
+        arrays = [pa.DictionaryArray.from_arrays(np.zeros(count, np.int32), [symbol])]
+        arrays += [pa.array(np.asarray(data[name]), from_pandas=name not in ARCHIVE_COLUMNS)
+                   for name in self.columns[1:]]
+        self._writer.write_table(pa.Table.from_arrays(arrays, schema=self._schema))
+
+    def close(self):
+        self._writer.close()
+
+
+def _open_writer(path: str, columns, fmt: str):
+    if fmt == 'parquet':
+        return _ParquetWriter(path, columns)
+    return _CSVWriter(path, columns, compress=fmt == 'csv.gz')
+
+
+def _stamp(ms: int) -> str:
+    return datetime.fromtimestamp(ms / 1000, timezone.utc).strftime('%Y%m%dT%H%M')
+
+
+class ExportWatermarks:
+    """
+    Отметки выгрузки по рядам в JSON-файле каталога выгрузки: до какого open_time ряд уже выгружен,
+    сколько строк и (для индикаторов) состояние IndicatorStream, чтобы следующая выгрузка
+    продолжила расчёт без перечитывания истории. Файл заменяется атомарно после каждого ряда.
+    """
+
+    def __init__(self, directory: str):
+        self.path = os.path.join(directory, WATERMARK_FILE)
+        self._lock = threading.Lock()
+        self.marks = {}
+        if os.path.exists(self.path):
+            with open(self.path, encoding='utf-8') as f:
+                self.marks = json.load(f)
+
+    def get(self, key: str) -> dict:
+        with self._lock:
+            return self.marks.get(key)
+
+    def set(self, key: str, mark: dict):
+        with self._lock:
+            self.marks[key] = mark
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.marks, f, indent=1)
+            os.replace(tmp_path, self.path)
+
+
+def export_series(symbol: str, interval: str, directory: str = EXPORT_DIR, fmt: str = 'csv', start: int = None,
+                  end: int = None, indicators: bool = False, mark: dict = None, chunk_size: int = STREAM_CHUNK_SIZE,
+                  archive: KlineArchive = None, backend=None) -> dict:
+    """
+    Выгружает свечи symbol/interval за [start, end) (и при indicators - индикаторы compute_indicators)
+    в файл <символ>_<интервал>[_indicators]_<первая свеча>_<последняя свеча>.<формат> каталога directory.
+    История читается порциями iter_history, поэтому память не зависит от длины диапазона.
+    mark - отметка прошлой выгрузки ряда (ExportWatermarks): выгрузка продолжается с неё.
+    Файл пишется под временным именем и появляется только целиком.
+    Возвращает итог с новой отметкой в 'mark' (None, если новых свечей не было).
+    """
+    if mark is not None:
+        start = mark['until'] if start is None else max(start, mark['until'])
+    stream = IndicatorStream(state=mark and mark.get('state')) if indicators else None
+    columns = ('symbol',) + ARCHIVE_COLUMNS + (INDICATOR_COLUMNS if indicators else ())
+    prefix = f"{symbol}_{interval}" + ('_indicators' if indicators else '')
+    part_path = os.path.join(directory, f".{prefix}{FORMATS[fmt]}.part")
+
+    result = {'symbol': symbol, 'interval': interval, 'rows': 0, 'file': None, 'first': None, 'last': None,
+              'mark': None}
+    writer = None
+    session = Session()
+    try:
+        for chunk in iter_history(session, symbol, interval, start, end, ARCHIVE_COLUMNS, chunk_size, archive, backend):
+            if not len(chunk['open_time']):
+                continue
+            if stream is not None:
+                computed = stream.update(chunk)
+                chunk = dict(chunk, **{name: computed[name] for name in INDICATOR_COLUMNS})
+            if writer is None:
+                writer = _open_writer(part_path, columns, fmt)
+                result['first'] = int(chunk['open_time'][0])
+            writer.write(symbol, chunk)
+            result['rows'] += len(chunk['open_time'])
+            result['last'] = int(chunk['open_time'][-1])
+    except BaseException:
+        if writer is not None:
+            writer.close()
+            os.remove(part_path)
+        raise
+    finally:
+        session.close()
+    if writer is None:
+        return result
+
+    writer.close()
+    result['file'] = os.path.join(directory, f"{prefix}_{_stamp(result['first'])}_{_stamp(result['last'])}"
+                                             f"{FORMATS[fmt]}")
+    os.replace(part_path, result['file'])
+    result['mark'] = {'until': result['last'] + 1, 'rows': (mark or {}).get('rows', 0) + result['rows'],
+                      'file': os.path.basename(result['file']), 'state': stream.state if stream else None,
+                      'updated_at': int(time.time() * 1000)}
+    return result
+
+
+def _export_in_process(backend_name: str, archive_root: str, *args):
+    """export_series в процессе пула: хранилище и архив открываются заново по имени и каталогу."""
+    return export_series(*args, archive=KlineArchive(archive_root), backend=get_kline_backend(backend_name))
+
+
+def export_klines(symbols=None, interval: str = '1m', directory: str = EXPORT_DIR, fmt: str = 'csv',
+                  start: int = None, end: int = None, indicators: bool = False, resume: bool = True,
+                  workers: int = EXPORT_WORKERS, chunk_size: int = STREAM_CHUNK_SIZE,
+                  archive: KlineArchive = None, backend=None) -> list:
+    """
+    Выгружает историю многих символов (по умолчанию - всех, у которых есть свечи interval), по файлу
+    на символ, параллельно в процессах (не больше workers и числа ядер): разбор строк базы и форматирование
+    CSV упираются в GIL, и потоки их не ускоряют. DuckDB не открывает файл базы из нескольких процессов,
+    поэтому с ним (и на одном ядре) символы выгружаются в потоках. Если end не задан, выгружаются только закрытые свечи.
+    resume - продолжать с отметок прошлой выгрузки в этом каталоге и сдвигать их (инкрементальные
+    ежедневные выгрузки); без resume отметки не читаются и не меняются - разовая выгрузка диапазона.
+    Возвращает список итогов export_series по символам.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Неизвестный формат выгрузки: {fmt}")
+    if fmt == 'parquet':
+        _pyarrow()
+    archive = archive or KlineArchive()
+    backend = backend or get_kline_backend()
+    if end is None:
+        end = bucket_start(int(time.time() * 1000), interval)
+    if symbols is None:
+        archived = {symbol for symbol in archive.symbols() if interval in archive.intervals(symbol)}
+        symbols = sorted(set(backend.symbols(interval)) | archived)
+    os.makedirs(directory, exist_ok=True)
+    watermarks = ExportWatermarks(directory) if resume else None
+    kind = 'indicators' if indicators else 'klines'
+    keys = {symbol: f"{symbol}/{interval}/{kind}/{fmt}" for symbol in symbols}
+
+    # работа упирается в процессор: процессов больше, чем ядер (или символов), заводить незачем
+    processes = min(workers, len(symbols), os.cpu_count() or 1)
+    if backend.name == 'duckdb' or processes <= 1:
+        executor = ThreadPoolExecutor(max_workers=max(workers, 1))
+        task, context = export_series, {'archive': archive, 'backend': backend}
+    else:
+        # spawn: дочерний процесс не наследует соединения с базой и блокировки потоков родителя
+        executor = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn'))
+        task, context = partial(_export_in_process, backend.name, archive.root), {}
+    with executor, metrics.span('export_klines', format=fmt, kind=kind):
+        futures = [executor.submit(task, symbol, interval, directory, fmt, start, end, indicators,
+                                   watermarks.get(keys[symbol]) if watermarks else None, chunk_size, **context)
+                   for symbol in symbols]
+        # отметка сохраняется сразу после готовности файла символа; ошибка одного символа
+        # не отменяет отметки остальных и поднимается после их сохранения
+        results, error = {}, None
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                error = error or e
+                continue
+            if watermarks is not None and result['mark'] is not None:
+                watermarks.set(keys[result['symbol']], result['mark'])
+            metrics.inc('export_rows', result['rows'], format=fmt)
+            results[result['symbol']] = result
+    if error is not None:
+        raise error
+    return [results[symbol] for symbol in symbols]
@@ -0,0 +1,237 @@
+# kline_store.py
+import bisect
+from itertools import chain, groupby, repeat
+
+import numpy as np
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import aliased
+
+from models import Kline
+from schemas import parse_klines_rows
+
+# Размер пачки строк для одного executemany
+UPSERT_CHUNK_SIZE = 5000
+
+_KEY_COLUMNS = ('symbol', 'interval', 'open_time')
+_VALUE_COLUMNS = ('open', 'high', 'low', 'close', 'volume', 'close_time')
+_INSERT_SQL = (
+    f"INSERT INTO klines ({', '.join(_KEY_COLUMNS + _VALUE_COLUMNS)}) "
+    f"VALUES ({', '.join('?' * (len(_KEY_COLUMNS) + len(_VALUE_COLUMNS)))}) "
+    f"ON CONFLICT ({', '.join(_KEY_COLUMNS)}) "
+)
+_DO_NOTHING_SQL = _INSERT_SQL + "DO NOTHING"
+# Обновление существующих свечей: новые строки затем вставляет _DO_NOTHING_SQL
+_UPDATE_SQL = (
+    f"UPDATE klines SET {', '.join(f'{name} = ?' for name in _VALUE_COLUMNS)} "
+    f"WHERE {' AND '.join(f'{name} = ?' for name in _KEY_COLUMNS)}"
+)
+
+
+def _increasing_rows(open_time: np.ndarray) -> np.ndarray:
+    """Индексы самой длинной строго возрастающей подпоследовательности open_time (O(n log n))."""
+    tails, tail_rows, previous = [], [], [-1] * len(open_time)
+    for index, value in enumerate(open_time.tolist()):
+        position = bisect.bisect_left(tails, value)
+        if position < len(tails) and tails[position] == value:
+            continue  # из повторов open_time остаётся первый
+        if position:
+            previous[index] = tail_rows[position - 1]
+        if position == len(tails):
+            tails.append(value)
+            tail_rows.append(index)
+        else:
+            tails[position] = value
+            tail_rows[position] = index
+    keep, index = [], tail_rows[-1] if tail_rows else -1
+    while index >= 0:
+        keep.append(index)
+        index = previous[index]
+    return np.array(keep[::-1], dtype=np.intp)
+
+
+def parse_valid_klines(raw_rows):
+    """
+    Пакетно разбирает свечи, отбрасывая некорректные строки: каждая строка проверяется один раз.
+    Из нарушающих порядок open_time отбрасываются лишние - остаётся самая длинная возрастающая
+    последовательность, поэтому одна свеча с неверным временем не тянет за собой следующие.
+    Возвращает (колонки parse_klines_batch, список (индекс исходной строки, ошибка)).
+    """
+    batch, errors, positions = parse_klines_rows(raw_rows)
+    if np.all(np.diff(batch['open_time']) > 0):
+        return batch, errors
+    keep = _increasing_rows(batch['open_time'])
+    dropped = np.setdiff1d(np.arange(len(positions)), keep)
+    errors = sorted(errors + [(int(positions[index]), "open_time не по порядку") for index in dropped])
+    return {column: values[keep] for column, values in batch.items()}, errors
+
+
+def batch_to_tuples(symbol: str, interval: str, batch: dict):
+    """Кортежи значений в порядке колонок INSERT - готовые параметры для executemany."""
+    count = len(batch['open_time'])
+    return list(zip(repeat(symbol, count), repeat(interval, count),
+                    *(batch[name].tolist() for name in ('open_time',) + _VALUE_COLUMNS)))
+
+
+def upsert_klines(session, symbol: str, interval: str, raw_rows, update: bool = False,
+                  chunk_size: int = UPSERT_CHUNK_SIZE):
+    """
+    Массово сохраняет свечи в формате Binance API через INSERT ... ON CONFLICT пачками по chunk_size.
+    При update=False существующие свечи пропускаются, при update=True перезаписываются.
+    Коммит остаётся за вызывающим кодом.
+    Возвращает словарь: inserted - новые строки, skipped - уже существовавшие (или обновлённые),
+    errors - список пар (индекс строки, ошибка) для строк, которые не удалось разобрать.
+    """
+    batch, errors = parse_valid_klines(raw_rows)
+    result = upsert_batch(session, symbol, interval, batch, update, chunk_size)
+    result['errors'] = errors
+    return result
+
+
+def upsert_batch(session, symbol: str, interval: str, batch: dict, update: bool = False,
+                 chunk_size: int = UPSERT_CHUNK_SIZE):
+    """
+    То же, что upsert_klines, но для уже разобранных колонок (формат parse_klines_batch),
+    упорядоченных по open_time. Возвращает словарь с inserted и skipped.
+    """
+    records = batch_to_tuples(symbol, interval, batch)
+    connection = session.connection()
+    inserted = 0
+    for offset in range(0, len(records), chunk_size):
+        chunk = records[offset:offset + chunk_size]
+        if update:
+            # сначала обновляются существующие, затем вставляются новые: каждая строка пишется один раз,
+            # а rowcount вставки без конфликтов - число новых свечей
+            connection.exec_driver_sql(_UPDATE_SQL, [record[3:] + record[:3] for record in chunk])
+        inserted += connection.exec_driver_sql(_DO_NOTHING_SQL, chunk).rowcount
+
+    return {'inserted': inserted, 'skipped': len(records) - inserted}
+
+
+def _kline_filters(model, symbols=None, interval=None, start=None, end=None):
+    filters = []
+    if symbols is not None:
+        filters.append(model.symbol.in_(list(symbols)))
+    if interval is not None:
+        filters.append(model.interval == interval)
+    if start is not None:
+        filters.append(model.open_time >= start)
+    if end is not None:
+        filters.append(model.open_time < end)
+    return filters
+
+
+# Ключи строки статистики aggregate_klines: этот порядок общий для всех хранилищ свечей и архива,
+# он же - порядок колонок при экспорте анализа в CSV
+AGGREGATE_KEYS = ('symbol', 'data_points', 'avg_close', 'max_close', 'min_close', 'interval', 'first_close',
+                  'last_close', 'total_volume', 'first_open_time', 'last_open_time')
+_AGGREGATE_VALUES = tuple(key for key in AGGREGATE_KEYS if key != 'interval')
+
+
+def aggregate_row(values, interval=None) -> dict:
+    """Строка статистики из значений в порядке AGGREGATE_KEYS без interval; ключи - в порядке AGGREGATE_KEYS."""
+    row = dict(zip(_AGGREGATE_VALUES, values), interval=interval or 'all')
+    return {key: row[key] for key in AGGREGATE_KEYS}
+
+
+def aggregate_klines(session, symbols=None, interval=None, start=None, end=None):
+    """
+    Считает статистику цен закрытия одним агрегирующим SELECT с группировкой по символу.
+    symbols - список символов (None - все), interval - интервал свечей (None - все),
+    start/end - окно времени open_time в мс, [start, end).
+    Возвращает список словарей в порядке символов.
+    """
+    edge = aliased(Kline)
+    edge_filters = [edge.symbol == Kline.symbol] + _kline_filters(edge, interval=interval, start=start, end=end)
+
+    def edge_close(order):
+        return (select(edge.close).where(*edge_filters).order_by(order).limit(1)
+                .correlate(Kline).scalar_subquery())
+
+    rows = session.query(
+        Kline.symbol,
+        func.count(Kline.id),
+        func.avg(Kline.close),
+        func.max(Kline.close),
+        func.min(Kline.close),
+        edge_close(edge.open_time.asc()),
+        edge_close(edge.open_time.desc()),
+        func.sum(Kline.volume),
+        func.min(Kline.open_time),
+        func.max(Kline.open_time),
+    ).filter(*_kline_filters(Kline, symbols, interval, start, end)).group_by(Kline.symbol).order_by(Kline.symbol).all()
+
+    return [aggregate_row(row, interval) for row in rows]
+
+
+OHLCV_COLUMNS = ('open_time', 'open', 'high', 'low', 'close', 'volume')
+TIME_COLUMNS = ('open_time', 'close_time')
+
+
+def load_ohlcv(session, symbols=None, interval=None, start=None, end=None, columns=OHLCV_COLUMNS):
+    """
+    Загружает OHLCV-колонки напрямую в непрерывные массивы NumPy, минуя ORM-объекты.
+    Все символы читаются одним упорядоченным запросом и разрезаются по смене символа в его же строках:
+    отдельный подсчёт строк мог бы разойтись с выборкой при параллельной вставке.
+    Возвращает словарь {символ: {колонка: np.ndarray}}; время (open_time, close_time) - int64 (мс),
+    остальное - float64.
+    """
+    selected = [getattr(Kline, name) for name in columns]
+    rows = session.execute(select(Kline.symbol, *selected).where(*_kline_filters(Kline, symbols, interval, start, end))
+                           .order_by(Kline.symbol, Kline.open_time)).all()
+    counts = [(symbol, sum(1 for _ in group)) for symbol, group in groupby(row[0] for row in rows)]
+    flat = np.fromiter(chain.from_iterable(row[1:] for row in rows), dtype=np.float64,
+                       count=len(rows) * len(columns))
+    matrix = flat.reshape(len(rows), len(columns))
+
+    result = {}
+    offset = 0
+    for symbol, count in counts:
+        block = matrix[offset:offset + count]
+        data = {name: np.ascontiguousarray(block[:, i]) for i, name in enumerate(columns)}
+        for name in TIME_COLUMNS:
+            if name in data:
+                data[name] = data[name].astype(np.int64)
+        result[symbol] = data
+        offset += count
+    return result
+
+
+# Строк в одной порции потокового чтения (iter_ohlcv)
+STREAM_CHUNK_SIZE = 50_000
+
+
+def iter_ohlcv(session, symbol: str, interval: str, start=None, end=None, columns=OHLCV_COLUMNS,
+               chunk_size: int = STREAM_CHUNK_SIZE):
+    """
+    Потоковый вариант load_ohlcv для одного ряда: курсор читается порциями по chunk_size строк
+    (yield_per), каждая порция отдаётся словарём колонок NumPy. В памяти держится одна порция
+    независимо от длины диапазона.
+    """
+    selected = [getattr(Kline, name) for name in columns]
+    statement = select(*selected).where(*_kline_filters(Kline, [symbol], interval, start, end)) \
+        .order_by(Kline.open_time).execution_options(yield_per=chunk_size)
+    # выполнение через соединение (Core), а не session.execute: строки не проходят слой загрузки ORM,
+    # что в полтора раза ускоряет чтение длинных диапазонов
+    for rows in session.connection().execute(statement).partitions():
+        matrix = np.fromiter(chain.from_iterable(rows), dtype=np.float64,
+                             count=len(rows) * len(columns)).reshape(len(rows), len(columns))
+        yield {name: matrix[:, i].astype(np.int64 if name in TIME_COLUMNS else np.float64)
+               for i, name in enumerate(columns)}
+
+
+def kline_symbols(session, interval=None) -> list:
+    """Символы, для которых в таблице klines есть свечи (interval - только этого интервала)."""
+    return [symbol for (symbol,) in session.query(Kline.symbol).filter(*_kline_filters(Kline, interval=interval))
+            .distinct().order_by(Kline.symbol)]
+
+
+def delete_klines(session, symbol: str, interval: str, start=None, end=None) -> int:
+    """Удаляет свечи symbol/interval с open_time в [start, end). Коммит остаётся за вызывающим кодом."""
+    result = session.execute(delete(Kline).where(*_kline_filters(Kline, [symbol], interval, start, end)))
+    return result.rowcount
+
+
+def kline_intervals(session, symbol: str) -> list:
+    """Интервалы, для которых в таблице klines есть свечи символа."""
+    return [interval for (interval,) in session.query(Kline.interval).filter(Kline.symbol == symbol)
+            .distinct().order_by(Kline.interval)]
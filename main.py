@@ -1,17 +1,39 @@
 # main.py
 import csv
 import os
-from models import Session, Kline, Asset, Portfolio  # Обновленный импорт
-from schemas import KlineData
-from binance_api_client import BinanceClient
+import time
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload
+from models import Session, Asset, Portfolio, engine, init_db  # Обновленный импорт
+from cache import TTLCache, CachedBinanceClient
+from kline_backends import get_kline_backend
+from kline_archive import aggregate_history
+from resample import resample_klines, local_coverage, bucket_start
+from analytics import compute_indicators_batch, summarize_indicators
+from valuation import value_holdings, format_money
+from portfolio_bulk import value_all_portfolios, read_holdings, import_holdings, export_holdings
+from portfolio_history import record_holding, portfolio_history_cache
+from metrics import metrics
+from symbol_index import symbol_index, paginate
+from write_queue import write_queue
 from rich.console import Console
 from rich.table import Table
-from rich.progress import track
-from config import conversion_rates, currency_symbols
-from plot_visualization import plot_symbol_history
+from config import conversion_rates, API_CACHE_FILE, API_CACHE_MAX_ENTRIES, FIAT_RATES_TTL, \
+    LIVE_PRICE_MAX_AGE, BASE_INTERVAL, DERIVED_INTERVALS, INTERVAL_MS, METRICS_JSONL_FILE, METRICS_PROM_FILE
 
 console = Console(width=200)
 
+# Общий кэш и клиент Binance: пул keep-alive соединений и кэшированные ответы
+# переиспользуются всеми пунктами меню
+api_cache = TTLCache(max_entries=API_CACHE_MAX_ENTRIES, persist_path=API_CACHE_FILE)
+binance_client = CachedBinanceClient(cache=api_cache)
+# Фоновый ингестор WebSocket-потоков (включается из меню)
+stream_ingestor = None
+# Фоновый цикл с асинхронным клиентом Binance (курсы валют); создаётся при первом обновлении курсов
+async_runner = None
+# Пара для курса каждого фиата: {фиат: (символ, обратная ли) или None}; заполняет _fiat_pair
+fiat_pairs = {}
+
 # Глобальный словарь валютных курсов относительно 1 USD
 # Изначально можно задать примерные значения, они будут обновлены с Binance.
 
@@ -26,11 +48,39 @@ asset_names = {
 }
 
 
+def _create_portfolio(session, name: str):
+    session.add(Portfolio(name=name))
+
+
 class PortfolioManager:
+    """
+    Текущий портфель. Долгоживущая сессия не держится: портфель загружается короткой сессией
+    вместе с активами (selectinload) и отсоединяется от неё, поэтому проверки наличия актива
+    не ходят в базу; изменения идут через общую очередь записи, после них портфель перечитывается.
+    """
+
     def __init__(self):
-        self.session = Session()
         self.current_portfolio = None
 
+    @staticmethod
+    def _load_portfolio(name: str):
+        session = Session()
+        try:
+            portfolio = session.query(Portfolio).options(selectinload(Portfolio.assets)).filter_by(name=name).first()
+            if portfolio is not None:
+                session.expunge_all()
+            return portfolio
+        finally:
+            session.close()
+
+    def refresh(self):
+        """Перечитывает текущий портфель и его активы."""
+        self.current_portfolio = self._load_portfolio(self.current_portfolio.name)
+
+    def find_asset(self, symbol: str):
+        """Актив текущего портфеля по символу (из загруженных) или None."""
+        return next((asset for asset in self.current_portfolio.assets if asset.symbol == symbol), None)
+
     def select_portfolio(self):
         """Выбор или создание портфеля по названию."""
         while True:
@@ -39,7 +89,7 @@ class PortfolioManager:
                 console.print("[red]Название портфеля не может быть пустым.[/red]")
                 continue
 
-            portfolio = self.session.query(Portfolio).filter_by(name=portfolio_name).first()
+            portfolio = self._load_portfolio(portfolio_name)
             if portfolio:
                 self.current_portfolio = portfolio
                 console.print(f"[green]Выбран портфель: {portfolio_name}[/green]")
@@ -47,10 +97,13 @@ class PortfolioManager:
             else:
                 create_new = input(f"Портфель '{portfolio_name}' не найден. Создать новый? (y/n): ").strip().lower()
                 if create_new == 'y':
-                    new_portfolio = Portfolio(name=portfolio_name)
-                    self.session.add(new_portfolio)
-                    self.session.commit()
-                    self.current_portfolio = new_portfolio
+                    try:
+                        write_queue.call(_create_portfolio, portfolio_name)
+                    except IntegrityError:
+                        # портфель с таким названием успели создать в другом процессе (CLI, импорт)
+                        console.print(f"[yellow]Портфель '{portfolio_name}' уже существует.[/yellow]")
+                        continue
+                    self.current_portfolio = self._load_portfolio(portfolio_name)
                     console.print(f"[green]Создан и выбран новый портфель: {portfolio_name}[/green]")
                     break
                 else:
@@ -62,38 +115,73 @@ class PortfolioManager:
             raise ValueError("Портфель не выбран!")
         return self.current_portfolio.id
 
-    def close(self):
-        """Закрытие сессии."""
-        self.session.close()
 
+def _parse_fiat_rate(data: dict, inverse: bool):
+    """Курс 1 USDT в фиате по ответу для пары USDT<FIAT> (inverse=False) или <FIAT>USDT (inverse=True)."""
+    if not isinstance(data, dict) or "price" not in data:
+        return None
+    try:
+        rate = float(data["price"])
+    except Exception:
+        return None
+    if not inverse:
+        return rate  # 1 USDT = rate FIAT
+    return 1 / rate if rate != 0 else None
+
+
+def _fiat_pair(fiat: str):
+    """
+    Пара, по которой берётся курс фиата: (символ, обратная ли она). Определяется по индексу пар биржи
+    один раз и запоминается; None - у фиата нет пары к USDT.
+    """
+    if fiat not in fiat_pairs:
+        index = symbol_index.ensure(binance_client)
+        if not index.records:
+            # индекс недоступен (нет сети и сохранённой копии): пару не запоминаем
+            return ("USDT" + fiat, False)
+        if index.get("USDT" + fiat):
+            fiat_pairs[fiat] = ("USDT" + fiat, False)
+        elif index.get(fiat + "USDT"):
+            fiat_pairs[fiat] = (fiat + "USDT", True)
+        else:
+            fiat_pairs[fiat] = None
+    return fiat_pairs[fiat]
+
+
+def _async_client():
+    """Общий AsyncClientRunner процесса; aiohttp загружается только при первом обновлении курсов."""
+    global async_runner
+    if async_runner is None:
+        from async_binance_client import AsyncClientRunner
+        async_runner = AsyncClientRunner()
+    return async_runner
 
-def get_fiat_rate(fiat: str) -> float:
-    client = BinanceClient()
-    symbol1 = "USDT" + fiat
-    data1 = client._send_request("GET", "/api/v3/ticker/price", params={"symbol": symbol1})
-    if "price" in data1:
-        try:
-            rate = float(data1["price"])
-            return rate  # 1 USDT = rate FIAT
-        except Exception:
-            pass
-    symbol2 = fiat + "USDT"
-    data2 = client._send_request("GET", "/api/v3/ticker/price", params={"symbol": symbol2})
-    if "price" in data2:
-        try:
-            rate = float(data2["price"])
-            return 1 / rate if rate != 0 else None
-        except Exception:
-            pass
-    return None
 
+def close_async_client():
+    if async_runner is not None:
+        async_runner.close()
 
-def update_all_fiat_rates_from_binance():
+
+def _fetch_fiat_rates(fiats):
+    # По одной листингованной паре на валюту; все запрашиваются одновременно одним долгоживущим клиентом
+    pairs = {fiat: _fiat_pair(fiat) for fiat in fiats}
+    symbols = [pair[0] for pair in pairs.values() if pair is not None]
+    from async_binance_client import gather_ticker_prices
+    responses = _async_client().run(lambda client: gather_ticker_prices(symbols, client)) if symbols else {}
+    return {fiat: _parse_fiat_rate(responses[pair[0]], pair[1]) if pair is not None else None
+            for fiat, pair in pairs.items()}
+
+
+def update_all_fiat_rates_from_binance(force: bool = False):
+    """Обновляет conversion_rates; в пределах FIAT_RATES_TTL курсы берутся из кэша, если не force."""
     global conversion_rates
-    for fiat in conversion_rates:
-        if fiat == "USD":
-            continue
-        rate = get_fiat_rate(fiat)
+    fiats = [fiat for fiat in conversion_rates if fiat != "USD"]
+    # неудавшийся курс (None) не кэшируется: иначе он держался бы весь FIAT_RATES_TTL
+    rates = api_cache.get_or_load("fiat_rates:" + ",".join(fiats), FIAT_RATES_TTL,
+                                  lambda: _fetch_fiat_rates(fiats), namespace="fiat_rates", force=force,
+                                  cacheable=lambda fetched: None not in fetched.values())
+    for fiat in fiats:
+        rate = rates.get(fiat)
         if rate is not None:
             conversion_rates[fiat] = rate
         else:
@@ -101,6 +189,56 @@ def update_all_fiat_rates_from_binance():
     console.print("[green]Курсы обмена обновлены на основе данных с Binance.[/green]")
 
 
+def view_cache_stats():
+    table = Table(title=f"Кэш ответов Binance (записей: {len(api_cache)})")
+    table.add_column("Эндпоинт", style="cyan")
+    table.add_column("Попадания", style="green", justify="right")
+    table.add_column("Промахи", style="red", justify="right")
+    table.add_column("Доля попаданий", style="magenta", justify="right")
+    for namespace, counters in sorted(api_cache.stats.items()):
+        total = counters['hits'] + counters['misses']
+        ratio = counters['hits'] / total if total else 0.0
+        table.add_row(namespace, str(counters['hits']), str(counters['misses']), f"{ratio:.0%}")
+    console.print(table)
+
+
+def view_metrics():
+    """Сводка метрик: время запросов к Binance и SQLite, замеры операций (span), счётчики; выгрузка в файл."""
+    series = metrics.snapshot()
+    if not series:
+        console.print("[yellow]Метрики ещё не собраны.[/yellow]")
+        return
+    table = Table(title=f"Метрики за {time.time() - metrics.started_at:,.0f} с")
+    table.add_column("Метрика", style="cyan")
+    table.add_column("Метки", style="magenta")
+    table.add_column("Число", justify="right")
+    table.add_column("Всего, мс", justify="right")
+    table.add_column("p50, мс", justify="right")
+    table.add_column("p95, мс", justify="right")
+    table.add_column("p99, мс", justify="right")
+    table.add_column("Макс., мс", justify="right")
+    for item in series:
+        labels = ", ".join(f"{key}={value}" for key, value in item['labels'].items() if value != '')
+        if item['type'] == 'histogram':
+            table.add_row(item['name'], labels, str(item['count']),
+                          *[f"{item[field] * 1000:,.1f}" for field in ('sum', 'p50', 'p95', 'p99', 'max')])
+        else:
+            table.add_row(item['name'], labels, f"{item['value']:,.0f}", "", "", "", "", "")
+    console.print(table)
+
+    action = input(f"p - выгрузить в {METRICS_PROM_FILE} (Prometheus), j - дописать в {METRICS_JSONL_FILE}, "
+                   f"r - сбросить, Enter - назад: ").strip().lower()
+    if action == 'p':
+        metrics.write_prometheus(METRICS_PROM_FILE)
+        console.print(f"[green]Метрики записаны в {METRICS_PROM_FILE}.[/green]")
+    elif action == 'j':
+        count = metrics.export_jsonl(METRICS_JSONL_FILE)
+        console.print(f"[green]В {METRICS_JSONL_FILE} добавлено серий: {count}.[/green]")
+    elif action == 'r':
+        metrics.reset()
+        console.print("[green]Метрики сброшены.[/green]")
+
+
 def view_exchange_rates():
     update_all_fiat_rates_from_binance()
     table = Table(title="Курсы обмена (1 USD = ?)")
@@ -111,60 +249,58 @@ def view_exchange_rates():
     console.print(table)
 
 
-def fetch_and_store_klines(symbol: str, interval: str, limit: int = 500):
-    console.print(f"[bold blue]Запрос исторических данных для {symbol} с интервалом {interval}...[/bold blue]")
-    client = BinanceClient()
-    raw_data = client.get_klines(symbol, interval, limit=limit)
+def _store_klines(session, symbol: str, interval: str, raw_data) -> dict:
+    return get_kline_backend().upsert_klines(symbol, interval, raw_data, session=session)
 
-    session = Session()
-    new_count = 0
 
-    for entry in track(raw_data, description="Обработка записей..."):
+@metrics.timed()
+def fetch_and_store_klines(symbol: str, interval: str, limit: int = 500):
+    if interval in DERIVED_INTERVALS:
+        # старшие интервалы сначала строим из локальных базовых свечей и идём в API, только если их не хватает
+        resampled = write_queue.call(resample_klines, symbol, interval)
+        session = Session()
         try:
-            kline_data = KlineData.from_list(entry)
-            exists = session.query(Kline).filter_by(symbol=symbol, open_time=kline_data.open_time).first()
-            if not exists:
-                kline_entry = Kline(
-                    symbol=symbol,
-                    open_time=kline_data.open_time,
-                    open=kline_data.open,
-                    high=kline_data.high,
-                    low=kline_data.low,
-                    close=kline_data.close,
-                    volume=kline_data.volume,
-                    close_time=kline_data.close_time
-                )
-                session.add(kline_entry)
-                new_count += 1
-        except Exception as e:
-            console.print(f"[red]Ошибка обработки записи: {e}[/red]")
-    session.commit()
-    session.close()
-    console.print(f"[green]Сохранено {new_count} новых записей для {symbol}.[/green]")
+            covered = local_coverage(session, symbol, interval, limit, int(time.time() * 1000))
+        finally:
+            session.close()
+        if covered >= limit:
+            console.print(f"[green]Свечи {symbol} {interval} построены локально из {BASE_INTERVAL}: "
+                          f"новых {resampled['inserted']}, запрос к API не нужен.[/green]")
+            return
+
+    console.print(f"[bold blue]Запрос исторических данных для {symbol} с интервалом {interval}...[/bold blue]")
+    raw_data = binance_client.get_klines(symbol, interval, limit=limit)
 
+    result = write_queue.call(_store_klines, symbol, interval, raw_data)
+    for index, e in result['errors']:
+        console.print(f"[red]Ошибка обработки записи #{index}: {e}[/red]")
+    console.print(f"[green]Сохранено {result['inserted']} новых записей для {symbol}, "
+                  f"пропущено существующих: {result['skipped']}.[/green]")
 
-def analyze_klines(symbol: str):
+
+@metrics.timed()
+def analyze_klines(symbol: str, interval: str, start: int = None, end: int = None):
+    """
+    Статистика по свечам символа: хвост в SQLite агрегируется запросом, архив - в NumPy.
+    interval обязателен (средние и объёмы по смеси интервалов бессмысленны), start/end - окно времени в мс.
+    """
     session = Session()
-    klines = session.query(Kline).filter_by(symbol=symbol).all()
-    if not klines:
+    results = aggregate_history(session, symbols=[symbol], interval=interval, start=start, end=end)
+    session.close()
+    if not results:
         console.print("[red]Нет данных для анализа.[/red]")
-        session.close()
         return None
+    return results[0]
 
-    total_close = sum(k.close for k in klines)
-    avg_close = total_close / len(klines)
-    max_close = max(k.close for k in klines)
-    min_close = min(k.close for k in klines)
-    session.close()
 
-    analysis = {
-        'symbol': symbol,
-        'data_points': len(klines),
-        'avg_close': avg_close,
-        'max_close': max_close,
-        'min_close': min_close
-    }
-    return analysis
+def analyze_all_klines(interval: str, start: int = None, end: int = None):
+    """Статистика свечей interval по всем символам в базе одним сгруппированным запросом."""
+    session = Session()
+    results = aggregate_history(session, interval=interval, start=start, end=end)
+    session.close()
+    if not results:
+        console.print("[red]Нет данных для анализа.[/red]")
+    return results
 
 
 def display_analysis(analysis: dict):
@@ -176,160 +312,341 @@ def display_analysis(analysis: dict):
     console.print(table)
 
 
-def export_analysis(analysis: dict, filename: str):
+def export_analysis(analysis, filename: str) -> str:
+    """
+    Дописывает результаты анализа (словарь или список словарей) в CSV-файл.
+    Если у существующего файла другие колонки, результаты пишутся в новый файл рядом
+    (report-2.csv, report-3.csv, ...), чтобы колонки не разъезжались и не терялись.
+    Возвращает имя файла, в который записаны результаты.
+    """
+    rows = [analysis] if isinstance(analysis, dict) else list(analysis)
+    if not rows:
+        return None
+    fieldnames = list(rows[0].keys())
+    stem, ext = os.path.splitext(filename)
+    number = 1
+    while os.path.isfile(filename):
+        with open(filename, newline='', encoding='utf-8') as csvfile:
+            if next(csv.reader(csvfile), None) == fieldnames:
+                break
+        number += 1
+        filename = f"{stem}-{number}{ext}"
     file_exists = os.path.isfile(filename)
     with open(filename, mode='a', newline='', encoding='utf-8') as csvfile:
-        fieldnames = ['symbol', 'data_points', 'avg_close', 'max_close', 'min_close']
         writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
         if not file_exists:
             writer.writeheader()
-        writer.writerow(analysis)
+        writer.writerows(rows)
     console.print(f"[green]Аналитика экспортирована в файл {filename}.[/green]")
+    return filename
+
+
+def view_technical_analysis():
+    symbol = input("Введите символ для технического анализа (например, BTCUSDT): ").strip().upper()
+    # индикаторы считаются по ряду одного интервала: свечи разных интервалов вперемешку их искажают
+    interval = input("Интервал свечей (по умолчанию 1h): ").strip() or "1h"
+    if interval not in INTERVAL_MS:
+        console.print(f"[red]Неизвестный интервал {interval}.[/red]")
+        return
+    indicators = compute_indicators_batch(symbols=[symbol], interval=interval).get(symbol)
+    if indicators is None:
+        console.print("[red]Нет данных для анализа.[/red]")
+        return
+    summary = summarize_indicators(symbol, indicators)
+    display_analysis(summary)
+    if input("Экспортировать в CSV? (y/n): ").strip().lower() == 'y':
+        export_analysis(summary, 'indicators_report.csv')
 
 
 # ------------- Функции для управления портфелем -------------
 
+@metrics.timed()
 def view_portfolio(manager: PortfolioManager):
     update_all_fiat_rates_from_binance()
-    session = Session()
-    portfolio_id = manager.get_current_portfolio_id()
-    assets = session.query(Asset).filter_by(portfolio_id=portfolio_id).all()
+    manager.get_current_portfolio_id()
+    manager.refresh()  # активы могли измениться в другом процессе (CLI, импорт)
+    assets = manager.current_portfolio.assets
     if not assets:
         console.print(f"[yellow]Портфель '{manager.current_portfolio.name}' пуст.[/yellow]")
-        session.close()
         return
 
-    client = BinanceClient()
+    # Свежие цены берутся из потока (если он запущен), остальные - одним пакетным запросом
+    symbols = {asset.symbol for asset in assets}
+    with metrics.span('view_portfolio.prices'):
+        prices = stream_ingestor.prices.snapshot(symbols, max_age=LIVE_PRICE_MAX_AGE) if stream_ingestor else {}
+        if len(prices) < len(symbols):
+            prices.update(binance_client.get_prices(symbols - set(prices)))
+
+    valuation = value_holdings([asset.symbol for asset in assets], [asset.amount for asset in assets], prices)
+    currencies, missing = valuation['currencies'], set(valuation['missing'])
+
     table = Table(title=f"Портфель: {manager.current_portfolio.name}", expand=True)
     table.add_column("Символ", style="cyan", no_wrap=True)
     table.add_column("Название", style="magenta", no_wrap=False)
     table.add_column("Количество", style="green", justify="right", no_wrap=True)
     table.add_column("Цена (USD)", justify="right", no_wrap=True)
     table.add_column("Стоимость (USD)", justify="right", no_wrap=True)
-
-    additional_currency_columns = [curr for curr in conversion_rates if curr != "USD"]
-    for curr in additional_currency_columns:
+    for curr in currencies[1:]:
         table.add_column(f"Стоимость ({curr})", justify="right", no_wrap=False, overflow="fold")
 
-    totals = {curr: 0.0 for curr in conversion_rates}
-
-    for asset in assets:
-        data = client._send_request('GET', '/api/v3/ticker/price', params={'symbol': asset.symbol})
-        price_usd = float(data.get("price", 0)) if "price" in data else 0.0
-        value_usd = asset.amount * price_usd
-        totals["USD"] += value_usd
-
-        cost_values = []
-        for curr in additional_currency_columns:
-            rate = conversion_rates[curr]
-            cost = value_usd * rate
-            totals[curr] += cost
-            cost_values.append(f"{curr}: {cost:,.2f} {currency_symbols.get(curr, curr)}")
-
+    for asset, prices_row, values_row in zip(assets, valuation['prices'].tolist(), valuation['values'].tolist()):
+        if asset.symbol in missing:
+            console.print(f"[yellow]Нет цены для {asset.symbol} (символ не найден или снят с торгов).[/yellow]")
+            table.add_row(asset.symbol, asset.name or "N/A", str(asset.amount), "[red]нет данных[/red]",
+                          "[red]нет данных[/red]", *["" for _ in currencies[1:]])
+            continue
         table.add_row(
             asset.symbol,
             asset.name or "N/A",
             str(asset.amount),
-            f"USD: {price_usd:,.2f} {currency_symbols['USD']}",
-            f"USD: {value_usd:,.2f} {currency_symbols['USD']}",
-            *cost_values
+            format_money(prices_row[0], "USD"),
+            *[format_money(value, curr) for curr, value in zip(currencies, values_row)]
         )
 
-    total_row = ["[bold]Итого[/bold]", "", "", "", f"[bold]USD: {totals['USD']:,.2f} {currency_symbols['USD']}[/bold]"]
-    for curr in additional_currency_columns:
-        total_row.append(f"[bold]{curr}: {totals[curr]:,.2f} {currency_symbols.get(curr, curr)}[/bold]")
-    table.add_row(*total_row)
+    totals = valuation['totals']
+    table.add_row("[bold]Итого[/bold]", "", "", "",
+                  *[f"[bold]{format_money(totals[curr], curr)}[/bold]" for curr in currencies])
+
+    with metrics.span('view_portfolio.render'):
+        console.print(table)
+
+
+# Изменения активов выполняются в потоке очереди записи; каждое фиксируется вместе с записью истории количеств
+
+def _insert_asset(session, portfolio_id: int, symbol: str, name: str, amount: float):
+    session.add(Asset(symbol=symbol, name=name, amount=amount, portfolio_id=portfolio_id))
+    record_holding(session, portfolio_id, symbol, amount)
 
-    console.print(table)
-    session.close()
+
+def _update_asset_amount(session, portfolio_id: int, symbol: str, amount: float):
+    asset = session.query(Asset).filter_by(symbol=symbol, portfolio_id=portfolio_id).one()
+    previous, asset.amount = asset.amount, amount
+    record_holding(session, portfolio_id, symbol, amount, previous=previous)
+
+
+def _delete_asset(session, portfolio_id: int, symbol: str):
+    previous = session.query(Asset.amount).filter_by(symbol=symbol, portfolio_id=portfolio_id).scalar()
+    session.query(Asset).filter_by(symbol=symbol, portfolio_id=portfolio_id).delete()
+    record_holding(session, portfolio_id, symbol, 0.0, previous=previous)
 
 
 def add_asset(manager: PortfolioManager):
-    session = Session()
     symbol = input("Введите символ актива (например, BTCUSDT): ").strip().upper()
     name = input("Введите название актива: ").strip()
     try:
         amount = float(input("Введите количество актива: "))
     except ValueError:
         console.print("[red]Неверное значение количества.[/red]")
-        session.close()
         return
     portfolio_id = manager.get_current_portfolio_id()
-    asset = session.query(Asset).filter_by(symbol=symbol, portfolio_id=portfolio_id).first()
-    if asset:
+    if manager.find_asset(symbol) is not None:
         console.print(f"[yellow]Актив {symbol} уже существует в портфеле '{manager.current_portfolio.name}'.[/yellow]")
     else:
-        new_asset = Asset(symbol=symbol, name=name, amount=amount, portfolio_id=portfolio_id)
-        session.add(new_asset)
-        session.commit()
+        write_queue.call(_insert_asset, portfolio_id, symbol, name, amount)
+        manager.refresh()
         console.print(f"[green]Актив {symbol} добавлен в портфель '{manager.current_portfolio.name}'.[/green]")
-    session.close()
 
 
 def update_asset(manager: PortfolioManager):
-    session = Session()
     symbol = input("Введите символ актива для обновления: ").strip().upper()
     portfolio_id = manager.get_current_portfolio_id()
-    asset = session.query(Asset).filter_by(symbol=symbol, portfolio_id=portfolio_id).first()
-    if not asset:
+    if manager.find_asset(symbol) is None:
         console.print(f"[red]Актив {symbol} не найден в портфеле '{manager.current_portfolio.name}'.[/red]")
-        session.close()
         return
     try:
         new_amount = float(input("Введите новое количество актива: "))
     except ValueError:
         console.print("[red]Неверное значение количества.[/red]")
-        session.close()
         return
-    asset.amount = new_amount
-    session.commit()
+    write_queue.call(_update_asset_amount, portfolio_id, symbol, new_amount)
+    manager.refresh()
     console.print(f"[green]Актив {symbol} успешно обновлён в портфеле '{manager.current_portfolio.name}'.[/green]")
-    session.close()
 
 
 def remove_asset(manager: PortfolioManager):
-    session = Session()
     symbol = input("Введите символ актива для удаления: ").strip().upper()
     portfolio_id = manager.get_current_portfolio_id()
-    asset = session.query(Asset).filter_by(symbol=symbol, portfolio_id=portfolio_id).first()
-    if not asset:
+    if manager.find_asset(symbol) is None:
         console.print(f"[red]Актив {symbol} не найден в портфеле '{manager.current_portfolio.name}'.[/red]")
-        session.close()
         return
-    session.delete(asset)
-    session.commit()
+    write_queue.call(_delete_asset, portfolio_id, symbol)
+    manager.refresh()
     console.print(f"[green]Актив {symbol} удалён из портфеля '{manager.current_portfolio.name}'.[/green]")
+
+
+def view_all_portfolios_value():
+    """Стоимость всех портфелей: один запрос позиций и один снимок цен на все различные символы."""
+    update_all_fiat_rates_from_binance()
+    session = Session()
+    with metrics.span('value_all_portfolios'):
+        result = value_all_portfolios(session, binance_client.get_prices)
     session.close()
+    if not result['portfolios']:
+        console.print("[yellow]Портфелей пока нет.[/yellow]")
+        return
+    currencies = result['currencies']
+    table = Table(title=f"Стоимость портфелей: {len(result['portfolios'])}, различных символов: {result['symbols']}")
+    table.add_column("Портфель", style="cyan")
+    table.add_column("Активов", justify="right")
+    for curr in currencies:
+        table.add_column(curr, justify="right")
+    grand_total = dict.fromkeys(currencies, 0.0)
+    for portfolio in result['portfolios']:
+        table.add_row(portfolio['name'], str(portfolio['assets']),
+                      *[format_money(portfolio['totals'][curr], curr) for curr in currencies])
+        for curr in currencies:
+            grand_total[curr] += portfolio['totals'][curr]
+        if portfolio['missing']:
+            console.print(f"[yellow]{portfolio['name']}: нет цены для {', '.join(portfolio['missing'])}[/yellow]")
+    table.add_row("[bold]Итого[/bold]", "", *[f"[bold]{format_money(grand_total[curr], curr)}[/bold]"
+                                               for curr in currencies])
+    console.print(table)
 
 
-def view_all_exchange_assets():
-    console.print("[bold blue]Запрос информации о бирже...[/bold blue]")
-    client = BinanceClient()
-    exchange_info = client._send_request('GET', '/api/v3/exchangeInfo')
-    symbols = exchange_info.get("symbols", [])
+def import_all_holdings():
+    """Импорт позиций нескольких портфелей из CSV/JSON одной транзакцией."""
+    path = input("Файл позиций (CSV: portfolio,symbol,amount[,name] или JSON): ").strip()
+    if not os.path.exists(path):
+        console.print(f"[red]Файл {path} не найден.[/red]")
+        return
+    holdings, errors = read_holdings(path)
+    for number, error in errors:
+        console.print(f"[red]Запись #{number}: {error}[/red]")
+    if errors:
+        console.print("[red]Импорт отменён: исправьте ошибки в файле.[/red]")
+        return
+    replace = input("Удалить активы, которых нет в файле, из затронутых портфелей? (y/n): ").strip().lower() == 'y'
+    stats = write_queue.call(import_holdings, holdings, replace)
+    console.print(f"[green]Импортировано позиций: {len(holdings)}; создано портфелей {stats['portfolios_created']}, "
+                  f"добавлено {stats['inserted']}, обновлено {stats['updated']}, удалено {stats['removed']}, "
+                  f"без изменений {stats['unchanged']}.[/green]")
+
+
+def export_all_holdings():
+    path = input("Файл для экспорта (по умолчанию holdings.csv; .json - JSON): ").strip() or "holdings.csv"
+    session = Session()
+    count = export_holdings(session, path)
+    session.close()
+    console.print(f"[green]Позиций сохранено: {count} в {path}.[/green]")
+
+
+def manage_all_portfolios(manager: PortfolioManager):
+    console.print("[cyan]1.[/cyan] Стоимость всех портфелей")
+    console.print("[cyan]2.[/cyan] Импорт позиций из CSV/JSON")
+    console.print("[cyan]3.[/cyan] Экспорт позиций всех портфелей")
+    choice = input("Выберите опцию: ").strip()
+    if choice == "1":
+        view_all_portfolios_value()
+    elif choice == "2":
+        import_all_holdings()
+        manager.refresh()
+    elif choice == "3":
+        export_all_holdings()
+    else:
+        console.print("[red]Неверный выбор.[/red]")
+
+
+def view_portfolio_history(manager: PortfolioManager):
+    """Стоимость текущего портфеля во времени по сохранённым свечам (ряд кэшируется и досчитывается)."""
+    interval = input("Интервал свечей (по умолчанию 1h): ").strip() or "1h"
+    if interval not in INTERVAL_MS:
+        console.print(f"[red]Неизвестный интервал {interval}.[/red]")
+        return
+    try:
+        days = int(input("За сколько дней (по умолчанию 365): ").strip() or 365)
+    except ValueError:
+        console.print("[red]Неверное количество дней.[/red]")
+        return
+    start = bucket_start(int(time.time() * 1000) - days * 86_400_000, interval)
+    portfolio_id = manager.get_current_portfolio_id()
+    session = Session()
+    with metrics.span('view_portfolio_history.compute'):
+        history = portfolio_history_cache.get(session, [portfolio_id], interval, start)[portfolio_id]
+    session.close()
+    if not len(history['times']):
+        console.print("[yellow]Нет сохранённых свечей для активов портфеля.[/yellow]")
+        return
+    value = history['value']
+    console.print(f"[green]Точек: {len(value)}, стоимость сейчас: {format_money(value[-1], 'USD')}, "
+                  f"максимум: {format_money(value.max(), 'USD')}, минимум: {format_money(value.min(), 'USD')}[/green]")
+    from plot_visualization import plot_portfolio_value  # matplotlib загружается только для графиков
+    plot_portfolio_value(history['times'], value, manager.current_portfolio.name)
+
+
+def toggle_price_stream(manager: PortfolioManager):
+    """Запускает или останавливает потоковое получение цен и свечей для активов портфеля."""
+    global stream_ingestor
+    if stream_ingestor is not None:
+        stream_ingestor.stop()
+        stream_ingestor = None
+        console.print("[yellow]Потоковое обновление остановлено.[/yellow]")
+        return
+    session = Session()
+    symbols = [symbol for (symbol,) in session.query(Asset.symbol)
+               .filter_by(portfolio_id=manager.get_current_portfolio_id()).distinct()]
+    session.close()
     if not symbols:
-        console.print("[red]Не удалось получить данные о бирже.[/red]")
+        console.print("[yellow]В портфеле нет активов для подписки.[/yellow]")
         return
+    from backfill import KlineBackfill
+    from stream_ingest import KlineStreamIngestor
+    stream_ingestor = KlineStreamIngestor(symbols, interval='1m', backfill=KlineBackfill(client=binance_client))
+    stream_ingestor.start_in_thread()
+    console.print(f"[green]Потоковое обновление запущено для: {', '.join(symbols)}[/green]")
+
 
-    table = Table(title="Доступные активы (торговые пары)")
+def _symbols_table(records, title: str) -> Table:
+    table = Table(title=title)
     table.add_column("Символ", style="cyan", no_wrap=True)
     table.add_column("Базовый актив", style="magenta")
     table.add_column("Котируемый актив", style="green")
     table.add_column("Статус", style="yellow")
-    for sym in symbols:
-        table.add_row(
-            sym.get("symbol", "N/A"),
-            sym.get("baseAsset", "N/A"),
-            sym.get("quoteAsset", "N/A"),
-            sym.get("status", "N/A")
-        )
-    console.print(table)
+    for record in records:
+        table.add_row(record['symbol'], record['base_asset'], record['quote_asset'], record['status'])
+    return table
+
+
+def view_all_exchange_assets():
+    """Поиск и постраничный просмотр торговых пар по индексу exchangeInfo (обновляется не чаще SYMBOL_INDEX_TTL)."""
+    symbol_index.ensure(binance_client)
+    if not symbol_index.records:
+        console.print("[red]Не удалось получить данные о бирже.[/red]")
+        return
+    query = input("Поиск по символу или базовому активу (Enter - все пары): ").strip()
+    quote = input(f"Котируемый актив ({', '.join(symbol_index.quotes()[:8])}...; Enter - любой): ").strip()
+    status = input("Статус (TRADING, BREAK ...; Enter - любой): ").strip()
+    records = symbol_index.search(query, quote=quote or None, status=status or None)
+    if not records:
+        console.print("[yellow]Подходящих торговых пар не найдено.[/yellow]")
+        return
+
+    page = 0
+    while True:
+        rows, page, pages = paginate(records, page)
+        console.print(_symbols_table(rows, f"Торговые пары: {len(records)}, страница {page + 1} из {pages}"))
+        if pages == 1:
+            return
+        action = input("n - следующая, p - предыдущая, номер - страница, Enter - выход: ").strip().lower()
+        if action == 'n':
+            page += 1
+        elif action == 'p':
+            page -= 1
+        elif action.isdigit():
+            page = int(action) - 1
+        else:
+            return
 
 
 def view_asset_details():
     symbol = input("Введите символ актива для просмотра деталей (например, BTCUSDT): ").strip().upper()
-    client = BinanceClient()
-    data = client._send_request('GET', '/api/v3/ticker/price', params={'symbol': symbol})
+    pair = symbol_index.ensure(binance_client).split(symbol)
+    if pair is None:
+        suggestions = [record['symbol'] for record in symbol_index.search(symbol)[:5]]
+        hint = f" Возможно, вы имели в виду: {', '.join(suggestions)}" if suggestions else ""
+        console.print(f"[red]Торговая пара {symbol} не найдена на бирже.{hint}[/red]")
+        return
+    base_asset, quote_asset = pair
+    data = binance_client.get_ticker_price(symbol)
     if "price" not in data:
         console.print(f"[red]Не удалось получить данные для {symbol}.[/red]")
         return
@@ -339,21 +656,16 @@ def view_asset_details():
         console.print("[red]Некорректная цена, полученная от API.[/red]")
         return
 
-    if symbol.endswith("USDT"):
-        base_asset = symbol[:-4]
-    else:
-        base_asset = symbol
-
     full_name = asset_names.get(base_asset, base_asset)
-    price_in_rates = {}
-    for curr, rate in conversion_rates.items():
-        price_in_rates[curr] = price_usd * rate
+    valuation = value_holdings([symbol], [1.0], [price_usd])
+    price_in_rates = dict(zip(valuation['currencies'], valuation['prices'][0].tolist()))
 
     table = Table(title=f"Детали актива {symbol}")
     table.add_column("Параметр", style="cyan", justify="right")
     table.add_column("Значение", style="magenta")
     table.add_row("Символ", symbol)
     table.add_row("Название", full_name)
+    table.add_row("Базовый / котируемый актив", f"{base_asset} / {quote_asset}")
     table.add_row("Цена (USD)", f"${price_usd:,.2f}")
     for curr, price in price_in_rates.items():
         if curr != "USD":
@@ -403,8 +715,14 @@ def interactive_portfolio_management(manager: PortfolioManager):
             console.print("[cyan]8.[/cyan] Просмотр всех курсов обмена")
             console.print("[cyan]9.[/cyan] Редактировать список названий активов")
             console.print("[cyan]10.[/cyan] Визуализировать историю изменения цены для символа")
-            console.print("[cyan]11.[/cyan] Сменить портфель")
-            console.print("[cyan]12.[/cyan] Выход")
+            console.print("[cyan]11.[/cyan] Технический анализ символа (индикаторы)")
+            console.print("[cyan]12.[/cyan] Статистика кэша запросов")
+            console.print("[cyan]13.[/cyan] Включить/выключить потоковое обновление цен (WebSocket)")
+            console.print("[cyan]14.[/cyan] Сменить портфель")
+            console.print("[cyan]15.[/cyan] История стоимости портфеля")
+            console.print("[cyan]16.[/cyan] Метрики производительности")
+            console.print("[cyan]17.[/cyan] Все портфели: стоимость, импорт и экспорт позиций")
+            console.print("[cyan]18.[/cyan] Выход")
             choice = input("Выберите опцию: ").strip()
             if choice == "1":
                 view_portfolio(manager)
@@ -419,17 +737,34 @@ def interactive_portfolio_management(manager: PortfolioManager):
             elif choice == "6":
                 view_asset_details()
             elif choice == "7":
-                update_all_fiat_rates_from_binance()
+                update_all_fiat_rates_from_binance(force=True)
             elif choice == "8":
                 view_exchange_rates()
             elif choice == "9":
                 edit_asset_names()
             elif choice == "10":
                 symbol = input("Введите символ актива для визуализации: ").strip().upper()
-                plot_symbol_history(symbol)
+                interval = input(f"Интервал свечей (по умолчанию {BASE_INTERVAL}): ").strip() or BASE_INTERVAL
+                if interval not in INTERVAL_MS:
+                    console.print(f"[red]Неизвестный интервал {interval}.[/red]")
+                    continue
+                from plot_visualization import plot_symbol_history  # matplotlib загружается только для графиков
+                plot_symbol_history(symbol, interval)
             elif choice == "11":
-                manager.select_portfolio()
+                view_technical_analysis()
             elif choice == "12":
+                view_cache_stats()
+            elif choice == "13":
+                toggle_price_stream(manager)
+            elif choice == "14":
+                manager.select_portfolio()
+            elif choice == "15":
+                view_portfolio_history(manager)
+            elif choice == "16":
+                view_metrics()
+            elif choice == "17":
+                manage_all_portfolios(manager)
+            elif choice == "18":
                 console.print("[bold green]Выход из управления портфелем.[/bold green]")
                 break
             else:
@@ -440,20 +775,17 @@ def interactive_portfolio_management(manager: PortfolioManager):
 
 
 def main():
+    init_db(engine)
     manager = PortfolioManager()
     manager.select_portfolio()  # Выбор портфеля при запуске
-
-    symbol = 'BTCUSDT'
-    interval = '1h'
-    fetch_and_store_klines(symbol, interval, limit=100)
-    analysis = analyze_klines(symbol)
-    if analysis:
-        console.print("[bold blue]Результаты анализа:[/bold blue]")
-        display_analysis(analysis)
-        export_analysis(analysis, 'analysis_report.csv')
-
+    # Загрузка свечей больше не блокирует запуск меню: она выполняется через cli.py ingest / schedule
     interactive_portfolio_management(manager)
-    manager.close()
+    if stream_ingestor is not None:
+        stream_ingestor.stop()
+    write_queue.close()
+    binance_client.close()
+    close_async_client()
+    api_cache.close()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,212 @@
+# metrics.py
+import bisect
+import functools
+import json
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+from config import METRICS_ENABLED
+
+# Границы корзин гистограмм длительности, секунды
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами: число наблюдений, сумма, минимум/максимум, квантили по корзинам."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # последняя корзина - больше верхней границы
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """Оценка квантиля линейной интерполяцией внутри корзины (как histogram_quantile в Prometheus)."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                lower = self.buckets[index - 1] if index else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else self.max
+                value = lower + (upper - lower) * (rank - seen) / count
+                return min(max(value, self.min), self.max)
+            seen += count
+        return self.max
+
+
+class MetricsRegistry:
+    """
+    Потокобезопасный реестр метрик процесса: гистограммы длительностей, счётчики и текущие значения,
+    каждая серия - имя плюс набор меток. Выгружается в текстовом формате Prometheus или в JSONL.
+    """
+
+    def __init__(self, enabled: bool = METRICS_ENABLED):
+        self.enabled = enabled
+        self.started_at = time.time()
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name: str, labels: dict):
+        return name, tuple(sorted((labels or {}).items()))
+
+    def observe(self, name: str, value: float, **labels):
+        if not self.enabled:
+            return
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        if not self.enabled:
+            return
+        key = self._key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def set(self, name: str, value: float, **labels):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.gauges[self._key(name, labels)] = value
+
+    @contextmanager
+    def span(self, name: str, **labels):
+        """Замер длительности блока: гистограмма span_seconds{span=name}; исключение попадает в метку error."""
+        started = time.perf_counter()
+        error = ''
+        try:
+            yield
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            self.observe('span_seconds', time.perf_counter() - started, span=name, error=error, **labels)
+
+    def timed(self, name: str = None):
+        """Декоратор: каждый вызов функции - span с именем name (по умолчанию - имя функции)."""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(name or func.__name__):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def reset(self):
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+            self.gauges.clear()
+            self.started_at = time.time()
+
+    def snapshot(self) -> list:
+        """Все серии списком словарей {type, name, labels, ...}; гистограммы - со сводкой и корзинами."""
+        with self._lock:
+            series = [{'type': 'histogram', 'name': name, 'labels': dict(labels), 'count': histogram.count,
+                       'sum': histogram.sum, 'min': histogram.min if histogram.count else 0.0, 'max': histogram.max,
+                       'p50': histogram.quantile(0.5), 'p95': histogram.quantile(0.95),
+                       'p99': histogram.quantile(0.99), 'buckets': list(histogram.buckets),
+                       'bucket_counts': list(histogram.counts)}
+                      for (name, labels), histogram in self.histograms.items()]
+            series += [{'type': 'counter', 'name': name, 'labels': dict(labels), 'value': value}
+                       for (name, labels), value in self.counters.items()]
+            series += [{'type': 'gauge', 'name': name, 'labels': dict(labels), 'value': value}
+                       for (name, labels), value in self.gauges.items()]
+        return sorted(series, key=lambda item: (item['name'], sorted(item['labels'].items())))
+
+    def to_prometheus(self) -> str:
+        """Текстовый формат экспозиции Prometheus (text/plain; version=0.0.4)."""
+        def render_labels(labels: dict, extra: dict = None) -> str:
+            merged = dict(labels, **(extra or {}))
+            if not merged:
+                return ''
+            pairs = (f'{key}="{_escape_label(value)}"' for key, value in sorted(merged.items()))
+            return '{' + ','.join(pairs) + '}'
+
+        lines, typed = [], set()
+        for item in self.snapshot():
+            name = item['name'] + ('_total' if item['type'] == 'counter' else '')
+            if name not in typed:
+                lines.append(f"# TYPE {name} {item['type']}")
+                typed.add(name)
+            labels = item['labels']
+            if item['type'] != 'histogram':
+                lines.append(f"{name}{render_labels(labels)} {item['value']}")
+                continue
+            cumulative = 0
+            for bound, count in zip(item['buckets'] + ['+Inf'], item['bucket_counts']):
+                cumulative += count
+                lines.append(f"{name}_bucket{render_labels(labels, {'le': bound})} {cumulative}")
+            lines.append(f"{name}_sum{render_labels(labels)} {item['sum']}")
+            lines.append(f"{name}_count{render_labels(labels)} {item['count']}")
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path: str):
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(self.to_prometheus())
+
+    def export_jsonl(self, path: str) -> int:
+        """Дописывает в path по строке JSON на серию с отметкой времени снимка. Возвращает число строк."""
+        series = self.snapshot()
+        timestamp = time.time()
+        with open(path, 'a', encoding='utf-8') as f:
+            for item in series:
+                f.write(json.dumps(dict(item, ts=timestamp), ensure_ascii=False) + '\n')
+        return len(series)
+
+
+def _escape_label(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _operation(statement: str) -> str:
+    """Первое ключевое слово SQL (SELECT, INSERT ...) - метка запроса без высокой кардинальности."""
+    words = statement.lstrip().split(None, 1)
+    return words[0].upper() if words else ''
+
+
+def instrument_engine(engine, registry: 'MetricsRegistry' = None):
+    """Подключает к движку SQLAlchemy замер каждого запроса: гистограмма db_query_seconds{operation}."""
+    registry = registry or metrics
+    from sqlalchemy import event
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info['query_started'].pop()
+        registry.observe('db_query_seconds', time.perf_counter() - started, operation=_operation(statement))
+
+    @event.listens_for(engine, 'handle_error')
+    def _error(context):
+        stack = context.connection.info.get('query_started') if context.connection is not None else None
+        if stack:
+            stack.pop()
+        registry.inc('db_query_errors', operation=_operation(context.statement or ''))
+
+    return engine
+
+
+# Общий реестр метрик процесса
+metrics = MetricsRegistry()
@@ -1,7 +1,9 @@
 # models.py
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, ForeignKey
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import create_engine, event, text, Column, Integer, BigInteger, String, Float, DateTime, ForeignKey, UniqueConstraint, Index
+from sqlalchemy.orm import declarative_base, relationship, sessionmaker
+
+from config import INTERVAL_MS, DATABASE_URL, STORAGE_PROFILES, STORAGE_PROFILE, DB_POOL_SIZE
+from metrics import instrument_engine
 
 Base = declarative_base()
 
@@ -9,6 +11,8 @@ class Portfolio(Base):
     __tablename__ = 'portfolios'
     id = Column(Integer, primary_key=True)
     name = Column(String, unique=True, nullable=False)  # Название портфеля (логин)
+    # Активы портфеля; для нескольких портфелей загружаются одним запросом через selectinload(Portfolio.assets)
+    assets = relationship('Asset', back_populates='portfolio', order_by='Asset.id')
 
 class Asset(Base):
     __tablename__ = 'assets'
@@ -17,20 +21,150 @@ class Asset(Base):
     name = Column(String)
     amount = Column(Float, default=0.0)  # количество актива
     portfolio_id = Column(Integer, ForeignKey('portfolios.id'), nullable=False)  # Связь с портфелем
+    portfolio = relationship('Portfolio', back_populates='assets')
+    __table_args__ = (Index('ix_assets_portfolio_symbol', 'portfolio_id', 'symbol'),)
+
+class AssetHolding(Base):
+    """История количества актива в портфеле: одна запись на каждое изменение (удаление - количество 0)."""
+    __tablename__ = 'asset_holdings'
+    id = Column(Integer, primary_key=True)
+    portfolio_id = Column(Integer, ForeignKey('portfolios.id'), nullable=False)
+    symbol = Column(String, nullable=False)
+    amount = Column(Float, nullable=False)  # количество после изменения
+    changed_at = Column(BigInteger, nullable=False)  # момент изменения, мс с эпохи (UTC)
+    __table_args__ = (Index('ix_asset_holdings_portfolio_symbol_time', 'portfolio_id', 'symbol', 'changed_at'),)
 
 class Kline(Base):
     __tablename__ = 'klines'
     id = Column(Integer, primary_key=True)
     symbol = Column(String, nullable=False)
-    open_time = Column(DateTime, nullable=False)
+    interval = Column(String, nullable=False)  # интервал свечи Binance: 1m, 1h, 1d ...
+    open_time = Column(BigInteger, nullable=False)  # время открытия, мс с эпохи (UTC)
     open = Column(Float, nullable=False)
     high = Column(Float, nullable=False)
     low = Column(Float, nullable=False)
     close = Column(Float, nullable=False)
     volume = Column(Float, nullable=False)
-    close_time = Column(DateTime, nullable=False)
+    close_time = Column(BigInteger, nullable=False)  # время закрытия, мс с эпохи (UTC)
+    # Уникальный индекс покрывает выборки по символу, интервалу и диапазону времени
+    __table_args__ = (Index('ix_klines_symbol_interval_open_time', 'symbol', 'interval', 'open_time', unique=True),)
+
+class KlineSyncState(Base):
+    """Отметка загрузки (high-water mark) свечей для пары (символ, интервал)."""
+    __tablename__ = 'kline_sync_state'
+    id = Column(Integer, primary_key=True)
+    symbol = Column(String, nullable=False)
+    interval = Column(String, nullable=False)
+    high_water = Column(BigInteger, nullable=False)  # open_time (мс) первой ещё не загруженной свечи
+    updated_at = Column(DateTime, nullable=False)
+    __table_args__ = (UniqueConstraint('symbol', 'interval', name='uq_kline_sync_symbol_interval'),)
+
+class KlineCoverage(Base):
+    """Загруженный с биржи участок [start, end) свечей пары (символ, интервал); смежные участки сливаются."""
+    __tablename__ = 'kline_coverage'
+    id = Column(Integer, primary_key=True)
+    symbol = Column(String, nullable=False)
+    interval = Column(String, nullable=False)
+    start = Column(BigInteger, nullable=False)  # open_time (мс) первой свечи участка
+    end = Column(BigInteger, nullable=False)  # open_time (мс) первой свечи после участка
+    __table_args__ = (Index('ix_kline_coverage_symbol_interval_start', 'symbol', 'interval', 'start'),)
+
+class ResampleState(Base):
+    """Отметка локального построения свечей interval из базового интервала (resample.py), отдельно от загрузки."""
+    __tablename__ = 'kline_resample_state'
+    id = Column(Integer, primary_key=True)
+    symbol = Column(String, nullable=False)
+    interval = Column(String, nullable=False)
+    high_water = Column(BigInteger, nullable=False)  # open_time (мс) первой ещё не построенной корзины
+    updated_at = Column(DateTime, nullable=False)
+    __table_args__ = (UniqueConstraint('symbol', 'interval', name='uq_resample_symbol_interval'),)
+
+class ExchangeSymbol(Base):
+    """Торговая пара из exchangeInfo Binance (индекс symbol_index)."""
+    __tablename__ = 'exchange_symbols'
+    symbol = Column(String, primary_key=True)
+    base_asset = Column(String, nullable=False)
+    quote_asset = Column(String, nullable=False)
+    status = Column(String, nullable=False)
+    filters = Column(String, nullable=False)  # фильтры торговли (tickSize, stepSize ...) в JSON
+    fingerprint = Column(String, nullable=False)  # хэш описания пары: неизменившиеся пары не перезаписываются
+    updated_at = Column(BigInteger, nullable=False)  # последнее изменение описания, мс с эпохи
+    checked_at = Column(BigInteger, nullable=False)  # последняя сверка с exchangeInfo, мс с эпохи
+
+
+def _datetime_to_ms_sql(column: str) -> str:
+    """
+    SQL-выражение перевода DateTime-строки SQLAlchemy в мс с эпохи.
+    Старые записи создавались через datetime.fromtimestamp, то есть в локальном времени,
+    поэтому используется модификатор 'utc'.
+    """
+    return (f"(CAST(strftime('%s', {column}, 'utc') AS INTEGER) * 1000"
+            f" + CAST(substr(strftime('%f', {column}), 4, 3) AS INTEGER))")
+
+
+def migrate_klines_table(engine):
+    """
+    Переводит таблицу klines старого формата (DateTime-строки, без колонки interval)
+    на текущую схему одним INSERT ... SELECT внутри SQLite, без построчной обработки в Python.
+    Интервал старых свечей восстанавливается по разнице close_time - open_time.
+    """
+    with engine.begin() as conn:
+        columns = {row[1]: (row[2] or '').upper() for row in conn.execute(text("PRAGMA table_info(klines)"))}
+        if not columns or ('interval' in columns and columns['open_time'] in ('BIGINT', 'INTEGER')):
+            return False
+
+        open_ms = _datetime_to_ms_sql('open_time')
+        close_ms = _datetime_to_ms_sql('close_time')
+        cases = " ".join(f"WHEN {ms} THEN '{name}'" for name, ms in INTERVAL_MS.items())
+        inferred_interval = f"CASE ({close_ms} - {open_ms} + 1) {cases} ELSE 'unknown' END"
+        interval_sql = f"COALESCE(interval, {inferred_interval})" if 'interval' in columns else inferred_interval
+
+        conn.execute(text("ALTER TABLE klines RENAME TO klines_old"))
+        Kline.__table__.create(conn)
+        conn.execute(text(
+            "INSERT OR IGNORE INTO klines (symbol, interval, open_time, open, high, low, close, volume, close_time) "
+            f"SELECT symbol, {interval_sql}, {open_ms}, open, high, low, close, volume, {close_ms} "
+            "FROM klines_old ORDER BY id"
+        ))
+        conn.execute(text("DROP TABLE klines_old"))
+    return True
+
+
+def init_db(engine):
+    """Приводит схему базы данных к текущей версии моделей."""
+    migrate_klines_table(engine)
+    Base.metadata.create_all(engine)
+    # create_all не добавляет новые индексы в уже существующие таблицы
+    for index in Asset.__table__.indexes:
+        index.create(engine, checkfirst=True)
+
+
+def create_db_engine(url: str = DATABASE_URL, profile: str = STORAGE_PROFILE, pool_size: int = DB_POOL_SIZE):
+    """
+    Движок SQLite с пулом соединений и PRAGMA из профиля STORAGE_PROFILES, применяемыми к каждому соединению.
+    Транзакции открываются явным BEGIN: встроенное управление транзакциями модуля sqlite3
+    ломает SAVEPOINT, на которых построена пакетная запись WriteQueue.
+    """
+    pragmas = STORAGE_PROFILES[profile]
+    engine = create_engine(url, echo=False, pool_size=pool_size, max_overflow=pool_size,
+                           connect_args={'check_same_thread': False})
+
+    @event.listens_for(engine, 'connect')
+    def _on_connect(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+        cursor.close()
+
+    @event.listens_for(engine, 'begin')
+    def _on_begin(connection):
+        connection.exec_driver_sql("BEGIN")
+
+    # время каждого запроса попадает в гистограмму db_query_seconds
+    return instrument_engine(engine)
+
 
-# Инициализация SQLite базы данных
-engine = create_engine('sqlite:///portfolio.db', echo=False)
-Base.metadata.create_all(engine)
+# Подключение к SQLite базе данных; схема создаётся явно через init_db(engine) в точках входа
+engine = create_db_engine()
 Session = sessionmaker(bind=engine)
\ No newline at end of file
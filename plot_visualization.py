@@ -1,48 +1,96 @@
+from datetime import datetime
+import matplotlib.dates as mdates
 import matplotlib.pyplot as plt
 import mplcursors
-from models import Session, Kline
-from config import conversion_rates, currency_symbols
+from downsample import load_plot_series, lttb, DEFAULT_MAX_POINTS
+from config import currency_symbols, BASE_INTERVAL
+from metrics import metrics
+from valuation import format_in_currencies
 
 
-def plot_symbol_history(symbol: str):
+def _to_datetimes(times_ms):
+    return [datetime.fromtimestamp(ms / 1000) for ms in times_ms.tolist()]
+
+
+def _to_ms(axis_value: float) -> int:
+    # Ось времени хранит наивное локальное время, поэтому и обратно переводим как локальное
+    return int(mdates.num2date(axis_value).replace(tzinfo=None).timestamp() * 1000)
+
+
+def plot_symbol_history(symbol: str, interval: str = BASE_INTERVAL, max_points: int = DEFAULT_MAX_POINTS):
     """
-    Извлекает данные свечей из БД для указанного символа и строит график изменения цены закрытия.
+    Извлекает данные свечей interval из БД для указанного символа и строит график изменения цены закрытия.
+    Рисуется не больше max_points точек (старший интервал и LTTB-прореживание); при приближении
+    или сдвиге графика перечитывается только видимое окно с более подробным разрешением.
     При наведении на точку графика отображается стоимость в USD и других валютах,
     где для каждой валюты используется формат: "Код: <цена> <символ>".
     Окно графика получает заголовок с именем символа.
     """
-    session = Session()
-    klines = session.query(Kline).filter_by(symbol=symbol).order_by(Kline.open_time).all()
-    session.close()
-
-    if not klines:
-        print("Нет данных для указанного символа.")
+    with metrics.span('plot_symbol_history.load'):
+        times, closes = load_plot_series(symbol, interval, max_points=max_points)
+    if not len(closes):
+        print(f"Нет свечей {interval} для указанного символа.")
         return
 
-    times = [k.open_time for k in klines]
-    closes = [k.close for k in klines]
+    # Построение фигуры замеряется отдельно от plt.show(), который ждёт закрытия окна
+    with metrics.span('plot_symbol_history.render'):
+        # Создаём фигуру и устанавливаем заголовок окна
+        fig = plt.figure(figsize=(10, 6))
+        fig.canvas.manager.set_window_title(symbol)
 
-    # Создаём фигуру и устанавливаем заголовок окна
-    fig = plt.figure(figsize=(10, 6))
-    fig.canvas.manager.set_window_title(symbol)
+        # Маркеры только для коротких рядов: на тысячах точек они лишь замедляют отрисовку
+        marker = 'o' if len(closes) <= 200 else ''
+        line, = plt.plot(_to_datetimes(times), closes, label=f'{symbol} Цена закрытия', marker=marker,
+                         linestyle='-', color='b')
+        plt.title(f'История цены закрытия для {symbol}')
+        plt.xlabel('Время')
+        plt.ylabel(f'Цена закрытия ({currency_symbols["USD"]})')
+        plt.legend()
+        plt.grid(True)
+        plt.tight_layout()
+
+        ax = plt.gca()
+        visible = {'window': None}
+
+        def on_xlim_changed(axes):
+            xmin, xmax = axes.get_xlim()
+            window = (_to_ms(xmin), _to_ms(xmax))
+            if window == visible['window']:
+                return
+            visible['window'] = window
+            with metrics.span('plot_symbol_history.reload'):
+                new_times, new_closes = load_plot_series(symbol, interval, window[0], window[1] + 1, max_points)
+            if len(new_closes):
+                line.set_data(_to_datetimes(new_times), new_closes)
+                line.set_marker('o' if len(new_closes) <= 200 else '')
+                fig.canvas.draw_idle()
+
+        ax.callbacks.connect('xlim_changed', on_xlim_changed)
 
-    plt.plot(times, closes, label=f'{symbol} Цена закрытия', marker='o', linestyle='-', color='b')
-    plt.title(f'История цены закрытия для {symbol}')
+        # Цена берётся из координаты выбранной точки, поэтому подсказка верна и после перечитывания ряда
+        cursor = mplcursors.cursor(line, hover=True)
+        cursor.connect("add", lambda sel: sel.annotation.set_text(format_in_currencies(float(sel.target[1]))))
+
+    plt.show()
+
+
+def plot_portfolio_value(times_ms, values, title: str, max_points: int = DEFAULT_MAX_POINTS):
+    """
+    График стоимости портфеля (USD) во времени. Ряд сокращается LTTB до max_points точек,
+    при наведении показывается стоимость во всех валютах.
+    """
+    keep = lttb(times_ms, values, max_points)
+    fig = plt.figure(figsize=(10, 6))
+    fig.canvas.manager.set_window_title(title)
+    line, = plt.plot(_to_datetimes(times_ms[keep]), values[keep], label='Стоимость портфеля', linestyle='-', color='g')
+    plt.title(f'История стоимости портфеля {title}')
     plt.xlabel('Время')
-    plt.ylabel(f'Цена закрытия ({currency_symbols["USD"]})')
+    plt.ylabel(f'Стоимость ({currency_symbols["USD"]})')
     plt.legend()
     plt.grid(True)
     plt.tight_layout()
 
-    def get_price_in_other_currencies(price_usd):
-        price_info = f'USD: {price_usd:,.2f} {currency_symbols["USD"]}'
-        for curr, rate in conversion_rates.items():
-            if curr != "USD":
-                price_in_currency = price_usd * rate
-                price_info += f'\n{curr}: {price_in_currency:,.2f} {currency_symbols.get(curr, curr)}'
-        return price_info
-
-    cursor = mplcursors.cursor(hover=True)
-    cursor.connect("add", lambda sel: sel.annotation.set_text(get_price_in_other_currencies(closes[int(sel.index)])))
+    cursor = mplcursors.cursor(line, hover=True)
+    cursor.connect("add", lambda sel: sel.annotation.set_text(format_in_currencies(float(sel.target[1]))))
 
     plt.show()
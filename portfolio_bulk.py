@@ -0,0 +1,164 @@
+# portfolio_bulk.py
+import csv
+import json
+import time
+
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import selectinload
+
+from models import Portfolio, Asset
+from portfolio_history import record_holding
+from valuation import value_holdings
+
+HOLDING_FIELDS = ('portfolio', 'symbol', 'amount', 'name')
+
+
+def load_portfolios(session, names=None) -> list:
+    """Портфели (все или по списку названий) вместе с активами: два запроса при любом числе портфелей."""
+    query = session.query(Portfolio).options(selectinload(Portfolio.assets)).order_by(Portfolio.name)
+    if names:
+        query = query.filter(Portfolio.name.in_(list(names)))
+    return query.all()
+
+
+def _parse_holding(raw: dict) -> dict:
+    portfolio = str(raw.get('portfolio') or '').strip()
+    symbol = str(raw.get('symbol') or '').strip().upper()
+    if not portfolio or not symbol:
+        raise ValueError("нужны поля portfolio и symbol")
+    amount = float(raw.get('amount'))
+    if not np.isfinite(amount) or amount < 0:
+        raise ValueError(f"некорректное количество {raw.get('amount')!r}")
+    return {'portfolio': portfolio, 'symbol': symbol, 'amount': amount, 'name': (raw.get('name') or None)}
+
+
+def read_holdings(path: str):
+    """
+    Читает позиции из CSV (колонки portfolio, symbol, amount[, name]) или JSON: список таких объектов
+    либо словарь {портфель: {символ: количество}}. Возвращает (позиции, список (номер записи, ошибка)).
+    """
+    if path.lower().endswith('.json'):
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        if isinstance(data, dict):
+            data = [{'portfolio': portfolio, 'symbol': symbol, 'amount': amount}
+                    for portfolio, holdings in data.items() for symbol, amount in holdings.items()]
+        records, first = data, 1
+    else:
+        with open(path, newline='', encoding='utf-8') as f:
+            records, first = list(csv.DictReader(f)), 2  # номер строки файла с учётом заголовка
+    holdings, errors = [], []
+    for number, raw in enumerate(records, first):
+        try:
+            holdings.append(_parse_holding(raw))
+        except (TypeError, ValueError) as e:
+            errors.append((number, str(e)))
+    return holdings, errors
+
+
+def import_holdings(session, holdings, replace: bool = False, changed_at: int = None) -> dict:
+    """
+    Применяет позиции к портфелям одной транзакцией (коммит остаётся за вызывающим кодом):
+    отсутствующие портфели создаются, количество 0 удаляет актив, при replace удаляются и активы
+    затронутых портфелей, которых нет в списке. Каждое изменение попадает в историю количеств.
+    """
+    changed_at = int(time.time() * 1000) if changed_at is None else changed_at
+    wanted = {}
+    for holding in holdings:
+        wanted.setdefault(holding['portfolio'], {})[holding['symbol']] = holding
+    portfolios = {portfolio.name: portfolio for portfolio in load_portfolios(session, list(wanted))}
+    stats = {'portfolios_created': 0, 'inserted': 0, 'updated': 0, 'removed': 0, 'unchanged': 0}
+    for name in wanted:
+        if name not in portfolios:
+            portfolios[name] = Portfolio(name=name)
+            session.add(portfolios[name])
+            stats['portfolios_created'] += 1
+    session.flush()
+
+    for name, symbols in wanted.items():
+        portfolio = portfolios[name]
+        existing = {asset.symbol: asset for asset in portfolio.assets}
+        removed = [symbol for symbol, holding in symbols.items() if holding['amount'] == 0 and symbol in existing]
+        if replace:
+            removed += [symbol for symbol in existing if symbol not in symbols]
+        for symbol in removed:
+            session.delete(existing[symbol])
+            record_holding(session, portfolio.id, symbol, 0.0, changed_at, previous=existing[symbol].amount)
+        stats['removed'] += len(removed)
+        for symbol, holding in symbols.items():
+            asset = existing.get(symbol)
+            if holding['amount'] == 0:
+                continue
+            previous = asset.amount if asset is not None else None
+            if asset is None:
+                portfolio.assets.append(Asset(symbol=symbol, name=holding['name'], amount=holding['amount']))
+                stats['inserted'] += 1
+            elif asset.amount != holding['amount']:
+                asset.amount = holding['amount']
+                if holding['name']:
+                    asset.name = holding['name']
+                stats['updated'] += 1
+            else:
+                stats['unchanged'] += 1
+                continue
+            record_holding(session, portfolio.id, symbol, holding['amount'], changed_at, previous=previous)
+    return stats
+
+
+def export_holdings(session, path: str, names=None) -> int:
+    """Сохраняет позиции портфелей в CSV или JSON (по расширению path). Возвращает число позиций."""
+    holdings = [{'portfolio': portfolio.name, 'symbol': asset.symbol, 'amount': asset.amount, 'name': asset.name}
+                for portfolio in load_portfolios(session, names) for asset in portfolio.assets]
+    if path.lower().endswith('.json'):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(holdings, f, ensure_ascii=False, indent=2)
+    else:
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=HOLDING_FIELDS)
+            writer.writeheader()
+            writer.writerows(holdings)
+    return len(holdings)
+
+
+def value_all_portfolios(session, get_prices, names=None, rates: dict = None) -> dict:
+    """
+    Стоимость всех портфелей (или портфелей из names) во всех валютах.
+    Позиции читаются одним запросом с группировкой по портфелю и символу, цены - одним снимком
+    get_prices(множество символов) на все портфели, суммирование по портфелям - в NumPy.
+    Возвращает {currencies, symbols (число различных символов), portfolios: [{id, name, assets, totals, missing}]}.
+    """
+    query = session.query(Portfolio.id, Portfolio.name, Asset.symbol, func.sum(Asset.amount)) \
+        .outerjoin(Asset, Asset.portfolio_id == Portfolio.id) \
+        .group_by(Portfolio.id, Portfolio.name, Asset.symbol).order_by(Portfolio.name)
+    if names:
+        query = query.filter(Portfolio.name.in_(list(names)))
+    rows = query.all()
+
+    order = {}
+    for portfolio_id, name, _, _ in rows:
+        order.setdefault(portfolio_id, name)
+    positions = [(portfolio_id, symbol, amount or 0.0) for portfolio_id, _, symbol, amount in rows if symbol is not None]
+    symbols = {symbol for _, symbol, _ in positions}
+    prices = get_prices(symbols) if symbols else {}
+
+    valuation = value_holdings([symbol for _, symbol, _ in positions], [amount for _, _, amount in positions],
+                               prices, rates)
+    index = {portfolio_id: position for position, portfolio_id in enumerate(order)}
+    owners = np.fromiter((index[portfolio_id] for portfolio_id, _, _ in positions), np.int64, len(positions))
+    totals = np.zeros((len(order), len(valuation['currencies'])))
+    np.add.at(totals, owners, np.nan_to_num(valuation['values']))
+    counts = np.bincount(owners, minlength=len(order))
+
+    missing = {}
+    for (portfolio_id, symbol, _), price in zip(positions, valuation['prices'][:, 0].tolist()):
+        if price != price:  # NaN - нет цены
+            missing.setdefault(portfolio_id, []).append(symbol)
+    return {
+        'currencies': valuation['currencies'],
+        'symbols': len(symbols),
+        'portfolios': [{'id': portfolio_id, 'name': name, 'assets': int(counts[position]),
+                        'totals': dict(zip(valuation['currencies'], totals[position].tolist())),
+                        'missing': missing.get(portfolio_id, [])}
+                       for position, (portfolio_id, name) in enumerate(order.items())],
+    }
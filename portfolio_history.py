@@ -0,0 +1,193 @@
+# portfolio_history.py
+import threading
+import time
+
+import numpy as np
+from sqlalchemy import func
+
+from config import INTERVAL_MS
+from kline_archive import load_history
+from models import Asset, AssetHolding
+from resample import bucket_start
+
+
+def record_holding(session, portfolio_id: int, symbol: str, amount: float, changed_at: int = None,
+                   previous: float = None):
+    """
+    Записывает новое количество актива в историю. Коммит остаётся за вызывающим кодом.
+    previous - количество до изменения: если истории у актива ещё нет (добавлен до её появления),
+    оно записывается с начала времён, иначе до первой правки актив считался бы нулевым.
+    """
+    changed_at = int(time.time() * 1000) if changed_at is None else changed_at
+    if previous is not None and session.query(AssetHolding.id) \
+            .filter_by(portfolio_id=portfolio_id, symbol=symbol).first() is None:
+        session.add(AssetHolding(portfolio_id=portfolio_id, symbol=symbol, amount=previous, changed_at=0))
+    session.add(AssetHolding(portfolio_id=portfolio_id, symbol=symbol, amount=amount, changed_at=changed_at))
+
+
+def load_holdings(session, portfolio_ids) -> dict:
+    """
+    История количеств: {portfolio_id: {символ: (моменты изменений в мс, количества)}}.
+    Для активов без истории (добавленных до её появления) текущее количество действует с начала времён.
+    """
+    portfolio_ids = list(portfolio_ids)
+    grouped = {portfolio_id: {} for portfolio_id in portfolio_ids}
+    rows = session.query(AssetHolding.portfolio_id, AssetHolding.symbol, AssetHolding.changed_at, AssetHolding.amount) \
+        .filter(AssetHolding.portfolio_id.in_(portfolio_ids)) \
+        .order_by(AssetHolding.portfolio_id, AssetHolding.symbol, AssetHolding.changed_at, AssetHolding.id).all()
+    for portfolio_id, symbol, changed_at, amount in rows:
+        times, amounts = grouped[portfolio_id].setdefault(symbol, ([], []))
+        times.append(changed_at)
+        amounts.append(amount)
+    holdings = {portfolio_id: {symbol: (np.array(times, np.int64), np.array(amounts, np.float64))
+                               for symbol, (times, amounts) in symbols.items()}
+                for portfolio_id, symbols in grouped.items()}
+    assets = session.query(Asset.portfolio_id, Asset.symbol, Asset.amount).filter(Asset.portfolio_id.in_(portfolio_ids))
+    for portfolio_id, symbol, amount in assets:
+        if symbol not in holdings[portfolio_id]:
+            holdings[portfolio_id][symbol] = (np.zeros(1, np.int64), np.array([amount or 0.0]))
+    return holdings
+
+
+def holdings_version(session, portfolio_ids) -> dict:
+    """Версия истории количеств каждого портфеля: меняется при любом add/update/remove актива."""
+    versions = {portfolio_id: (0, 0) for portfolio_id in portfolio_ids}
+    for portfolio_id, last_id in session.query(AssetHolding.portfolio_id, func.max(AssetHolding.id)) \
+            .filter(AssetHolding.portfolio_id.in_(list(portfolio_ids))).group_by(AssetHolding.portfolio_id):
+        versions[portfolio_id] = (last_id, versions[portfolio_id][1])
+    for portfolio_id, count in session.query(Asset.portfolio_id, func.count(Asset.id)) \
+            .filter(Asset.portfolio_id.in_(list(portfolio_ids))).group_by(Asset.portfolio_id):
+        versions[portfolio_id] = (versions[portfolio_id][0], count)
+    return versions
+
+
+def asof(times: np.ndarray, event_times: np.ndarray, event_values: np.ndarray, default: float = np.nan) -> np.ndarray:
+    """Значение последнего события с event_time <= t для каждого t; до первого события - default."""
+    index = np.searchsorted(event_times, times, side='right') - 1
+    return np.where(index >= 0, event_values[np.maximum(index, 0)], default)
+
+
+def compute_portfolio_history(session, portfolio_ids, interval: str = '1h', start: int = None, end: int = None,
+                              seed_prices: dict = None, archive=None) -> dict:
+    """
+    Ряды стоимости (USD) портфелей на сетке свечей interval за [start, end).
+    Цены закрытия всех символов загружаются одним чтением истории, затем и цены, и количества
+    выравниваются по сетке as-of join'ом (searchsorted) без запросов на каждую точку.
+    Количество берётся на момент закрытия свечи. seed_prices - цены, действующие до start
+    (для досчёта хвоста). Возвращает {portfolio_id: {'times', 'value', 'symbols', 'values', 'prices'}},
+    где values и prices - матрицы (символы x точки сетки).
+    """
+    step = INTERVAL_MS[interval]
+    holdings = load_holdings(session, portfolio_ids)
+    symbols = sorted({symbol for portfolio in holdings.values() for symbol in portfolio})
+    closes = load_history(session, symbols, interval, start, end, columns=('open_time', 'close'), archive=archive)
+    seed_prices = seed_prices or {}
+
+    first = start if start is not None else min((int(data['open_time'][0]) for data in closes.values()), default=None)
+    last = end if end is not None else max((int(data['open_time'][-1]) + step for data in closes.values()), default=None)
+    if first is None or last is None or last <= first:
+        times = np.empty(0, np.int64)
+    else:
+        times = np.arange(bucket_start(first, interval), last, step, dtype=np.int64)
+
+    prices = {}
+    for symbol in symbols:
+        data = closes.get(symbol)
+        seed = seed_prices.get(symbol, np.nan)
+        if data is None:
+            prices[symbol] = np.full(len(times), seed)
+        else:
+            prices[symbol] = asof(times, data['open_time'], data['close'], seed)
+
+    result = {}
+    close_times = times + step - 1
+    for portfolio_id, portfolio in holdings.items():
+        portfolio_symbols = sorted(portfolio)
+        if portfolio_symbols:
+            amounts = np.vstack([asof(close_times, *portfolio[symbol], 0.0) for symbol in portfolio_symbols])
+            price_matrix = np.vstack([prices[symbol] for symbol in portfolio_symbols])
+        else:
+            amounts = price_matrix = np.empty((0, len(times)))
+        values = amounts * price_matrix
+        result[portfolio_id] = {
+            'times': times,
+            'value': np.nansum(values, axis=0),
+            'symbols': portfolio_symbols,
+            'values': values,
+            'prices': price_matrix,
+        }
+    return result
+
+
+class PortfolioHistoryCache:
+    """
+    Кэш рядов стоимости портфелей в памяти процесса по ключу (портфель, интервал, start).
+    При повторном запросе досчитывается только хвост, начиная с последней посчитанной свечи
+    (она могла быть ещё не закрыта); изменение количеств в портфеле сбрасывает его ряд целиком.
+    """
+
+    def __init__(self):
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def get(self, session, portfolio_ids, interval: str = '1h', start: int = None, end: int = None,
+            archive=None) -> dict:
+        """Ряды как у compute_portfolio_history, при необходимости обрезанные по end."""
+        portfolio_ids = list(portfolio_ids)
+        versions = holdings_version(session, portfolio_ids)
+        with self._lock:
+            cached = {portfolio_id: self._series.get((portfolio_id, interval, start)) for portfolio_id in portfolio_ids}
+        stale = [portfolio_id for portfolio_id, entry in cached.items()
+                 if entry is None or entry['version'] != versions[portfolio_id] or not len(entry['times'])]
+        fresh = [portfolio_id for portfolio_id in portfolio_ids if portfolio_id not in stale]
+
+        updated = {}
+        if stale:
+            updated.update(compute_portfolio_history(session, stale, interval, start, archive=archive))
+        if fresh:
+            tail_start = min(int(cached[portfolio_id]['times'][-1]) for portfolio_id in fresh)
+            seed = {}
+            for portfolio_id in fresh:
+                entry = cached[portfolio_id]
+                cut = int(np.searchsorted(entry['times'], tail_start))
+                if cut:
+                    seed.update(zip(entry['symbols'], entry['prices'][:, cut - 1].tolist()))
+            tails = compute_portfolio_history(session, fresh, interval, tail_start, seed_prices=seed, archive=archive)
+            for portfolio_id in fresh:
+                updated[portfolio_id] = self._splice(cached[portfolio_id], tails[portfolio_id])
+
+        with self._lock:
+            for portfolio_id, series in updated.items():
+                series['version'] = versions[portfolio_id]
+                self._series[(portfolio_id, interval, start)] = series
+        return {portfolio_id: self._slice(updated[portfolio_id], end) for portfolio_id in portfolio_ids}
+
+    @staticmethod
+    def _splice(entry: dict, tail: dict) -> dict:
+        cut = int(np.searchsorted(entry['times'], tail['times'][0])) if len(tail['times']) else len(entry['times'])
+        return {
+            'times': np.concatenate([entry['times'][:cut], tail['times']]),
+            'value': np.concatenate([entry['value'][:cut], tail['value']]),
+            'symbols': tail['symbols'],
+            'values': np.hstack([entry['values'][:, :cut], tail['values']]),
+            'prices': np.hstack([entry['prices'][:, :cut], tail['prices']]),
+        }
+
+    @staticmethod
+    def _slice(series: dict, end: int = None) -> dict:
+        if end is None:
+            return series
+        cut = int(np.searchsorted(series['times'], end))
+        return dict(series, times=series['times'][:cut], value=series['value'][:cut], values=series['values'][:, :cut],
+                    prices=series['prices'][:, :cut])
+
+    def invalidate(self, portfolio_id: int = None):
+        with self._lock:
+            if portfolio_id is None:
+                self._series.clear()
+            else:
+                self._series = {key: series for key, series in self._series.items() if key[0] != portfolio_id}
+
+
+# Общий кэш процесса: используется меню и планировщиком
+portfolio_history_cache = PortfolioHistoryCache()
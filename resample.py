@@ -0,0 +1,116 @@
+# resample.py
+import time
+from datetime import datetime
+
+import numpy as np
+
+from config import INTERVAL_MS, INTERVAL_OFFSET_MS, BASE_INTERVAL, DERIVED_INTERVALS
+from downsample import ohlc_buckets
+from kline_archive import load_history
+from kline_backends import get_kline_backend
+from kline_store import OHLCV_COLUMNS
+from models import ResampleState
+
+
+def bucket_start(open_time_ms: int, interval: str) -> int:
+    """Начало свечи interval, в которую попадает момент open_time_ms (с учётом сдвига недель)."""
+    bucket_ms = INTERVAL_MS[interval]
+    offset_ms = INTERVAL_OFFSET_MS.get(interval, 0)
+    return (open_time_ms - offset_ms) // bucket_ms * bucket_ms + offset_ms
+
+
+def get_resample_mark(session, symbol: str, interval: str):
+    state = session.query(ResampleState).filter_by(symbol=symbol, interval=interval).first()
+    return state.high_water if state else None
+
+
+def set_resample_mark(session, symbol: str, interval: str, high_water: int):
+    state = session.query(ResampleState).filter_by(symbol=symbol, interval=interval).first()
+    if state is None:
+        session.add(ResampleState(symbol=symbol, interval=interval, high_water=high_water, updated_at=datetime.now()))
+    else:
+        state.high_water = max(state.high_water, high_water)
+        state.updated_at = datetime.now()
+
+
+def rewind_resample_marks(session, symbol: str, base_interval: str, since_ms: int):
+    """
+    Возвращает отметки построения старших интервалов symbol к корзине с since_ms, если новые свечи
+    base_interval легли раньше отметки (догрузка пропуска): корзины, пропущенные как неполные,
+    будут построены при следующем resample_klines. Коммит остаётся за вызывающим кодом.
+    """
+    states = session.query(ResampleState).filter(ResampleState.symbol == symbol,
+                                                 ResampleState.high_water > since_ms).all()
+    for state in states:
+        if INTERVAL_MS.get(state.interval, 0) > INTERVAL_MS[base_interval]:
+            state.high_water = min(state.high_water, bucket_start(since_ms, state.interval))
+            state.updated_at = datetime.now()
+
+
+def resample_ohlcv(data: dict, interval: str, base_interval: str = BASE_INTERVAL) -> dict:
+    """
+    Строит свечи interval из упорядоченных свечей base_interval (колонки OHLCV_COLUMNS).
+    Возвращаются только полные свечи - корзины, в которых есть все bucket_ms / base_ms базовых свечей:
+    неполная корзина (начата раньше первой базовой свечи, не закрыта последней или с пропусками)
+    дала бы неверный объём и экстремумы. Результат - колонки в формате parse_klines_batch.
+    """
+    bucket_ms, base_ms = INTERVAL_MS[interval], INTERVAL_MS[base_interval]
+    offset_ms = INTERVAL_OFFSET_MS.get(interval, 0)
+    if bucket_ms <= base_ms or bucket_ms % base_ms or offset_ms % base_ms:
+        raise ValueError(f"Интервал {interval} нельзя построить из {base_interval}")
+    buckets = ohlc_buckets({column: data[column] for column in OHLCV_COLUMNS}, bucket_ms, offset_ms)
+    open_time = buckets['open_time']
+    if not len(open_time):
+        return dict(buckets, close_time=open_time.copy())
+    _, counts = np.unique((data['open_time'] - offset_ms) // bucket_ms, return_counts=True)
+    complete = counts == bucket_ms // base_ms
+    buckets = {column: values[complete] for column, values in buckets.items()}
+    buckets['close_time'] = buckets['open_time'] + bucket_ms - 1
+    return buckets
+
+
+def resample_klines(session, symbol: str, interval: str, base_interval: str = BASE_INTERVAL, archive=None) -> dict:
+    """
+    Инкрементально строит свечи symbol/interval из сохранённых свечей base_interval и пишет их
+    в таблицу klines с тегом interval. Пересчитываются только корзины после собственной отметки
+    построения (ResampleState, не отметка загрузки KlineBackfill); после записи она сдвигается
+    на конец последней полной корзины, а догрузка пропущенных базовых свечей возвращает её назад
+    (rewind_resample_marks), и неполные из-за пропуска корзины строятся заново. Уже сохранённые свечи (в том числе полученные с биржи)
+    не перезаписываются. Коммит остаётся за вызывающим кодом.
+    """
+    high_water = get_resample_mark(session, symbol, interval)
+    start = bucket_start(high_water, interval) if high_water is not None else None
+    base = load_history(session, [symbol], base_interval, start=start, archive=archive).get(symbol)
+    if base is None:
+        return {'buckets': 0, 'inserted': 0, 'high_water': high_water}
+    # ещё не закрытая базовая свеча (например, загруженная через REST) не должна закрывать корзину
+    closed = base['open_time'] + INTERVAL_MS[base_interval] <= int(time.time() * 1000)
+    base = {column: values[closed] for column, values in base.items()}
+    if not len(base['open_time']):
+        return {'buckets': 0, 'inserted': 0, 'high_water': high_water}
+    batch = resample_ohlcv(base, interval, base_interval)
+    if not len(batch['open_time']):
+        return {'buckets': 0, 'inserted': 0, 'high_water': high_water}
+    result = get_kline_backend().upsert_batch(symbol, interval, batch, session=session)
+    high_water = int(batch['close_time'][-1]) + 1
+    set_resample_mark(session, symbol, interval, high_water)
+    return {'buckets': len(batch['open_time']), 'inserted': result['inserted'], 'high_water': high_water}
+
+
+def resample_all(session, symbols, intervals=DERIVED_INTERVALS, base_interval: str = BASE_INTERVAL,
+                 archive=None) -> dict:
+    """Строит все производные интервалы для списка символов. Возвращает {(символ, интервал): статистика}."""
+    stats = {}
+    for symbol in symbols:
+        for interval in intervals:
+            if interval != base_interval:
+                stats[(symbol, interval)] = resample_klines(session, symbol, interval, base_interval, archive)
+    return stats
+
+
+def local_coverage(session, symbol: str, interval: str, limit: int, now_ms: int) -> int:
+    """Сколько из последних limit закрытых свечей symbol/interval уже есть в базе (включая архив)."""
+    end = bucket_start(now_ms, interval)
+    start = end - limit * INTERVAL_MS[interval]
+    data = load_history(session, [symbol], interval, start=start, end=end, columns=('open_time',)).get(symbol)
+    return 0 if data is None else len(data['open_time'])
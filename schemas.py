@@ -1,38 +1,180 @@
 # schemas.py
-from pydantic import BaseModel
 from datetime import datetime
+from functools import lru_cache
+import numpy as np
 
-class KlineData(BaseModel):
-    open_time: datetime
-    open: float
-    high: float
-    low: float
-    close: float
-    volume: float
-    close_time: datetime
-
-    @classmethod
-    def from_list(cls, data: list):
-        """
-        Преобразует список, полученный от Binance API, в объект KlineData.
-        Ожидается, что data имеет вид:
-        [
-          Open time,
-          Open,
-          High,
-          Low,
-          Close,
-          Volume,
-          Close time,
-          ...
-        ]
-        """
-        return cls(
-            open_time=datetime.fromtimestamp(data[0] / 1000),
-            open=float(data[1]),
-            high=float(data[2]),
-            low=float(data[3]),
-            close=float(data[4]),
-            volume=float(data[5]),
-            close_time=datetime.fromtimestamp(data[6] / 1000)
-        )
+
+@lru_cache(maxsize=None)
+def _kline_data_model():
+    """
+    Модель pydantic для построчной проверки свечи. pydantic импортируется при первом обращении
+    к schemas.KlineData: пакетный разбор (parse_klines_batch) на пути записи свечей в нём не нуждается.
+    """
+    from pydantic import BaseModel
+
+    class KlineData(BaseModel):
+        open_time: datetime
+        open: float
+        high: float
+        low: float
+        close: float
+        volume: float
+        close_time: datetime
+
+        @classmethod
+        def from_list(cls, data: list):
+            """
+            Преобразует список, полученный от Binance API, в объект KlineData.
+            Ожидается, что data имеет вид:
+            [
+              Open time,
+              Open,
+              High,
+              Low,
+              Close,
+              Volume,
+              Close time,
+              ...
+            ]
+            """
+            return cls(
+                open_time=datetime.fromtimestamp(data[0] / 1000),
+                open=float(data[1]),
+                high=float(data[2]),
+                low=float(data[3]),
+                close=float(data[4]),
+                volume=float(data[5]),
+                close_time=datetime.fromtimestamp(data[6] / 1000)
+            )
+
+    return KlineData
+
+
+def __getattr__(name: str):
+    if name == 'KlineData':
+        return _kline_data_model()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# Число полей свечи Binance, которые мы сохраняем: open_time, O, H, L, C, V, close_time
+KLINE_FIELDS = 7
+KLINE_PRICE_COLUMNS = ('open', 'high', 'low', 'close', 'volume')
+
+
+class KlineBatchError(ValueError):
+    """Ошибки пакетного разбора свечей: errors - список пар (индекс строки, описание)."""
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__(f"Некорректных свечей: {len(errors)}; первая: #{errors[0][0]} {errors[0][1]}")
+
+
+_COLUMN_SPECS = (
+    (0, 'open_time', np.int64),
+    (1, 'open', np.float64),
+    (2, 'high', np.float64),
+    (3, 'low', np.float64),
+    (4, 'close', np.float64),
+    (5, 'volume', np.float64),
+    (6, 'close_time', np.int64),
+)
+
+
+def _to_int64(value):
+    """
+    int с проверкой диапазона int64 (int() принимает и числа, не помещающиеся в колонку)
+    и без отбрасывания дробной части: 1.5 - ошибка, а не 1.
+    """
+    if isinstance(value, float) and not value.is_integer():
+        raise ValueError(f"не целое {value!r}")
+    return np.int64(int(value))
+
+
+def _int64_array(values) -> np.ndarray:
+    """Пакетное преобразование в int64; дробные значения - ошибка, как и в _to_int64."""
+    raw = np.asarray(values)
+    if raw.dtype.kind == 'i':
+        return raw.astype(np.int64, copy=False)
+    if raw.dtype.kind == 'f':
+        if not np.all(np.isfinite(raw) & (raw == np.floor(raw))):
+            raise ValueError("дробное значение")
+        if np.any(np.abs(raw) >= 2.0 ** 63):
+            raise OverflowError("вне диапазона int64")
+        return raw.astype(np.int64)
+    return np.array(values, dtype=np.int64)
+
+
+def _convert_rows(values, column: str, dtype):
+    """Построчное преобразование колонки - только когда пакетное уже не удалось. Возвращает (массив, ошибки)."""
+    convert = _to_int64 if dtype is np.int64 else float
+    converted = np.zeros(len(values), dtype=dtype)
+    errors = []
+    for index, value in enumerate(values):
+        try:
+            converted[index] = convert(value)
+        except OverflowError:
+            errors.append((index, f"{column}: вне диапазона {value!r}"))
+        except (TypeError, ValueError):
+            kind = "не целое число" if isinstance(value, float) else "не число"
+            errors.append((index, f"{column}: {kind} {value!r}"))
+    return converted, errors
+
+
+def _empty_batch() -> dict:
+    empty = {'open_time': np.empty(0, np.int64), 'close_time': np.empty(0, np.int64)}
+    empty.update({column: np.empty(0, np.float64) for column in KLINE_PRICE_COLUMNS})
+    return empty
+
+
+def parse_klines_rows(rows):
+    """
+    Разбирает свечи Binance API в колонки parse_klines_batch, отбрасывая некорректные строки:
+    каждая строка проверяется один раз (длина и числа в полях), порядок open_time не проверяется.
+    Возвращает (колонки, список (индекс строки, описание), индексы исходных строк, попавших в колонки).
+    """
+    rows = list(rows)
+    errors = [(index, f"ожидалось не меньше {KLINE_FIELDS} полей, получено {len(row)}")
+              for index, row in enumerate(rows) if len(row) < KLINE_FIELDS]
+    positions = np.arange(len(rows))
+    if errors:
+        positions = np.array([index for index, row in enumerate(rows) if len(row) >= KLINE_FIELDS], dtype=np.intp)
+        rows = [rows[index] for index in positions]
+    if not rows:
+        return _empty_batch(), errors, positions
+
+    columns = list(zip(*rows))
+    valid = np.ones(len(rows), dtype=bool)
+    batch = {}
+    for position, column, dtype in _COLUMN_SPECS:
+        try:
+            if dtype is np.int64:
+                batch[column] = _int64_array(columns[position])
+            else:
+                batch[column] = np.array(columns[position], dtype=dtype)
+        except (TypeError, ValueError, OverflowError):
+            batch[column], column_errors = _convert_rows(columns[position], column, dtype)
+            for index, message in column_errors:
+                valid[index] = False
+                errors.append((int(positions[index]), message))
+    if not valid.all():
+        batch = {column: values[valid] for column, values in batch.items()}
+        positions = positions[valid]
+    return batch, sorted(errors), positions
+
+
+def parse_klines_batch(rows) -> dict:
+    """
+    Разбирает страницу свечей Binance API целиком в колонки NumPy без моделей pydantic на каждую строку:
+    open_time/close_time - int64 (мс), open/high/low/close/volume - float64.
+    Проверки выполняются для пакета целиком: длина строк, числа в полях (время - целые),
+    строгий рост open_time. При ошибках бросает KlineBatchError со списком (индекс, описание)
+    всех некорректных строк.
+    """
+    batch, errors, _ = parse_klines_rows(rows)
+    if errors:
+        raise KlineBatchError(errors)
+
+    not_increasing = np.flatnonzero(np.diff(batch['open_time']) <= 0) + 1
+    if len(not_increasing):
+        raise KlineBatchError([(int(index), "open_time не больше предыдущего") for index in not_increasing])
+    return batch
@@ -0,0 +1,216 @@
+# stream_ingest.py
+import asyncio
+import json
+import logging
+import threading
+import time
+
+import requests
+import websockets
+from sqlalchemy.exc import SQLAlchemyError
+
+from backfill import KlineBackfill, get_high_water, set_high_water, add_coverage
+from config import INTERVAL_MS
+from kline_backends import get_kline_backend
+from models import Session
+from write_queue import WriteQueue, write_queue
+
+STREAM_URL = "wss://stream.binance.com:9443/stream"
+
+logger = logging.getLogger(__name__)
+
+
+class LivePriceTable:
+    """Потокобезопасная таблица последних цен из потока: символ -> (цена, время события в мс)."""
+
+    def __init__(self):
+        self._prices = {}
+        self._lock = threading.Lock()
+
+    def update(self, symbol: str, price: float, event_time: int):
+        with self._lock:
+            current = self._prices.get(symbol)
+            if current is None or event_time >= current[1]:
+                self._prices[symbol] = (price, event_time)
+
+    def get(self, symbol: str, max_age: float = None):
+        """Последняя цена символа или None, если её нет или она старше max_age секунд."""
+        with self._lock:
+            entry = self._prices.get(symbol)
+        if entry is None:
+            return None
+        if max_age is not None and time.time() * 1000 - entry[1] > max_age * 1000:
+            return None
+        return entry[0]
+
+    def snapshot(self, symbols=None, max_age: float = None) -> dict:
+        with self._lock:
+            symbols = list(self._prices) if symbols is None else list(symbols)
+        prices = {symbol: self.get(symbol, max_age) for symbol in symbols}
+        return {symbol: price for symbol, price in prices.items() if price is not None}
+
+
+# Общая таблица цен процесса: её заполняет ингестор, а читает view_portfolio
+live_prices = LivePriceTable()
+
+
+class KlineStreamIngestor:
+    """
+    Подписывается на комбинированные потоки Binance <symbol>@kline_<interval> и <symbol>@miniTicker.
+    Последние цены пишутся в LivePriceTable, закрытые свечи копятся в буфере и сохраняются
+    пачками (по batch_size свечей или раз в flush_interval секунд) через очередь записи WriteQueue.
+    При каждом (пере)подключении пропущенный интервал догружается через REST (KlineBackfill)
+    от high-water mark символа (без отметки - за последние backfill_lookback секунд);
+    после обрыва соединение восстанавливается с растущей задержкой.
+    Ошибки разбора сообщения, догрузки и записи пишутся в журнал и не останавливают поток:
+    несохранённые свечи остаются в буфере до следующей записи.
+    """
+
+    def __init__(self, symbols, interval: str = '1m', url: str = STREAM_URL, prices: LivePriceTable = None,
+                 backfill: KlineBackfill = None, batch_size: int = 500, flush_interval: float = 2.0,
+                 reconnect_delay: float = 1.0, max_reconnect_delay: float = 60.0, writer: WriteQueue = None,
+                 backfill_lookback: float = 24 * 3600):
+        self.symbols = [symbol.upper() for symbol in symbols]
+        self.interval = interval
+        self.url = url
+        self.prices = prices if prices is not None else live_prices
+        self.backfill = backfill
+        self.writer = writer or write_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.backfill_lookback = backfill_lookback
+        self._buffer = {}  # символ -> список закрытых свечей в формате Binance REST
+        self._buffered = 0
+        self._stop = None
+        self._loop = None
+        self._thread = None
+        self.stats = {'messages': 0, 'closed_klines': 0, 'stored': 0, 'reconnects': 0, 'backfilled': 0,
+                      'bad_messages': 0, 'errors': 0}
+
+    def stream_url(self) -> str:
+        streams = []
+        for symbol in self.symbols:
+            streams.append(f"{symbol.lower()}@kline_{self.interval}")
+            streams.append(f"{symbol.lower()}@miniTicker")
+        return f"{self.url}?streams={'/'.join(streams)}"
+
+    def handle_message(self, raw: str):
+        """Разбирает сообщение комбинированного потока ({'stream': ..., 'data': {...}})."""
+        message = json.loads(raw)
+        data = message.get('data', message) if isinstance(message, dict) else None
+        if not isinstance(data, dict):
+            raise ValueError(f"ожидался объект события, получено {type(data).__name__}")
+        event = data.get('e')
+        self.stats['messages'] += 1
+        if event == 'kline':
+            kline = data['k']
+            self.prices.update(data['s'], float(kline['c']), data['E'])
+            if kline['x']:
+                row = [kline['t'], kline['o'], kline['h'], kline['l'], kline['c'], kline['v'], kline['T']]
+                self._buffer.setdefault(data['s'], []).append(row)
+                self._buffered += 1
+                self.stats['closed_klines'] += 1
+        elif event == '24hrMiniTicker':
+            self.prices.update(data['s'], float(data['c']), data['E'])
+
+    def _store(self, session, buffer: dict) -> int:
+        stored = 0
+        step = INTERVAL_MS[self.interval]
+        for symbol, rows in buffer.items():
+            result = get_kline_backend().upsert_klines(symbol, self.interval, rows, update=True, session=session)
+            stored += result['inserted']
+            # закрытые свечи потока отмечаются покрытыми непрерывными участками, как страницы KlineBackfill
+            open_times = sorted({int(row[0]) for row in rows})
+            run_start = open_times[0]
+            for previous, current in zip(open_times, open_times[1:] + [None]):
+                if current != previous + step:
+                    add_coverage(session, symbol, self.interval, run_start, previous + step)
+                    run_start = current
+            set_high_water(session, symbol, self.interval, open_times[-1] + step)
+        return stored
+
+    async def flush(self):
+        if not self._buffered:
+            return
+        buffer, self._buffer, self._buffered = self._buffer, {}, 0
+        try:
+            # запись идёт через общую очередь: коммит делится с остальными писателями процесса
+            self.stats['stored'] += await asyncio.wrap_future(self.writer.submit(self._store, buffer))
+        except SQLAlchemyError as e:
+            # свечи возвращаются в буфер перед пришедшими за время записи и будут записаны следующим flush
+            for symbol, rows in buffer.items():
+                self._buffer[symbol] = rows + self._buffer.get(symbol, [])
+                self._buffered += len(rows)
+            self.stats['errors'] += 1
+            logger.warning("Не удалось сохранить %d свечей потока, повтор при следующей записи: %s",
+                           sum(len(rows) for rows in buffer.values()), e)
+
+    def _backfill_gaps(self) -> int:
+        """
+        Догружает через REST свечи каждого символа с его high-water mark (без отметки - за последние
+        backfill_lookback секунд) до текущего момента. Ошибка по символу не мешает остальным.
+        """
+        if self.backfill is None:
+            return 0
+        default_start = int((time.time() - self.backfill_lookback) * 1000)
+        session = Session()
+        try:
+            starts = {symbol: get_high_water(session, symbol, self.interval) for symbol in self.symbols}
+        finally:
+            session.close()
+        loaded = 0
+        for symbol, start in starts.items():
+            try:
+                loaded += self.backfill.run(symbol, self.interval, default_start if start is None else start)['new']
+            except (RuntimeError, requests.RequestException, SQLAlchemyError) as e:
+                self.stats['errors'] += 1
+                logger.warning("Не удалось догрузить пропуск %s %s: %s", symbol, self.interval, e)
+        return loaded
+
+    async def run(self):
+        """Основной цикл: подключение, чтение, периодическая запись, переподключение при обрыве."""
+        self._stop = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        delay = self.reconnect_delay
+        while not self._stop.is_set():
+            try:
+                async with websockets.connect(self.stream_url()) as ws:
+                    delay = self.reconnect_delay
+                    self.stats['backfilled'] += await asyncio.to_thread(self._backfill_gaps)
+                    last_flush = time.monotonic()
+                    while not self._stop.is_set():
+                        try:
+                            raw = await asyncio.wait_for(ws.recv(), timeout=self.flush_interval)
+                        except asyncio.TimeoutError:
+                            raw = None
+                        if raw is not None:
+                            try:
+                                self.handle_message(raw)
+                            except (ValueError, KeyError, TypeError) as e:
+                                self.stats['bad_messages'] += 1
+                                logger.warning("Пропущено сообщение потока %.200r: %r", raw, e)
+                        if self._buffered >= self.batch_size or time.monotonic() - last_flush >= self.flush_interval:
+                            await self.flush()
+                            last_flush = time.monotonic()
+            except (OSError, websockets.WebSocketException):
+                self.stats['reconnects'] += 1
+                await self.flush()
+                if self._stop.is_set():
+                    break
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_reconnect_delay)
+        await self.flush()
+
+    def start_in_thread(self):
+        """Запускает ингестор в фоновом потоке со своим циклом событий."""
+        self._thread = threading.Thread(target=lambda: asyncio.run(self.run()), daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self, timeout: float = 10.0):
+        if self._loop is not None and self._stop is not None:
+            self._loop.call_soon_threadsafe(self._stop.set)
+        if self._thread is not None:
+            self._thread.join(timeout)
@@ -0,0 +1,184 @@
+# symbol_index.py
+import bisect
+import difflib
+import hashlib
+import json
+import logging
+import threading
+import time
+
+import requests
+from sqlalchemy import delete, func, update
+from sqlalchemy.dialects.sqlite import insert
+
+from config import SYMBOL_INDEX_TTL, SYMBOL_PAGE_SIZE
+from models import Session, ExchangeSymbol
+from write_queue import write_queue
+
+logger = logging.getLogger(__name__)
+
+# Поля описания пары, сохраняемые в индексе
+_RECORD_FIELDS = ('symbol', 'base_asset', 'quote_asset', 'status', 'filters')
+
+
+def _record(entry: dict) -> dict:
+    """Описание пары из exchangeInfo в формате строки индекса (с хэшем для сверки)."""
+    record = {
+        'symbol': entry['symbol'],
+        'base_asset': entry.get('baseAsset', ''),
+        'quote_asset': entry.get('quoteAsset', ''),
+        'status': entry.get('status', ''),
+        'filters': json.dumps(entry.get('filters', []), sort_keys=True, separators=(',', ':')),
+    }
+    record['fingerprint'] = hashlib.sha1(
+        '\x1f'.join(record[name] for name in _RECORD_FIELDS).encode()).hexdigest()
+    return record
+
+
+def sync_symbols(session, exchange_info: dict, now_ms: int = None) -> dict:
+    """
+    Сверяет таблицу exchange_symbols с ответом exchangeInfo: перезаписываются только новые
+    и изменившиеся пары (по хэшу описания), исчезнувшие с биржи удаляются, у остальных
+    обновляется только отметка сверки. Коммит остаётся за вызывающим кодом.
+    """
+    now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+    records = {entry['symbol']: _record(entry) for entry in exchange_info.get('symbols', []) if 'symbol' in entry}
+    stored = dict(session.query(ExchangeSymbol.symbol, ExchangeSymbol.fingerprint).all())
+
+    changed = [dict(record, updated_at=now_ms, checked_at=now_ms) for symbol, record in records.items()
+               if stored.get(symbol) != record['fingerprint']]
+    removed = [symbol for symbol in stored if symbol not in records]
+    if changed:
+        statement = insert(ExchangeSymbol)
+        session.execute(statement.on_conflict_do_update(
+            index_elements=['symbol'],
+            set_={name: statement.excluded[name] for name in _RECORD_FIELDS[1:] + ('fingerprint', 'updated_at')}),
+            changed)
+    if removed:
+        session.execute(delete(ExchangeSymbol).where(ExchangeSymbol.symbol.in_(removed)))
+    session.execute(update(ExchangeSymbol).values(checked_at=now_ms))
+    added = sum(1 for record in changed if record['symbol'] not in stored)
+    return {'added': added, 'updated': len(changed) - added, 'removed': len(removed),
+            'unchanged': len(records) - len(changed)}
+
+
+class SymbolIndex:
+    """
+    Индекс торговых пар биржи: символ -> базовый и котируемый актив, статус, фильтры.
+    Хранится в таблице exchange_symbols и держится в памяти отсортированным списком символов,
+    поэтому поиск по префиксу - бинарный (bisect), а exchangeInfo запрашивается не чаще
+    раза в ttl секунд, в том числе между запусками программы.
+    """
+
+    def __init__(self, session_factory=None, writer=None, ttl: float = SYMBOL_INDEX_TTL):
+        self.session_factory = session_factory or Session
+        self.writer = writer or write_queue
+        self.ttl = ttl
+        self.records = {}
+        self.checked_at = None
+        self._symbols = []  # отсортированные символы
+        self._bases = []  # отсортированные пары (базовый актив, символ)
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def load(self):
+        """Читает индекс из базы в память."""
+        session = self.session_factory()
+        try:
+            rows = session.query(ExchangeSymbol).all()
+            checked_at = session.query(func.max(ExchangeSymbol.checked_at)).scalar()
+        finally:
+            session.close()
+        records = {row.symbol: {'symbol': row.symbol, 'base_asset': row.base_asset, 'quote_asset': row.quote_asset,
+                                'status': row.status, 'filters': row.filters} for row in rows}
+        with self._lock:
+            self.records = records
+            self.checked_at = checked_at
+            self._symbols = sorted(records)
+            self._bases = sorted((record['base_asset'], symbol) for symbol, record in records.items())
+            self._loaded = True
+
+    def is_stale(self, now_ms: int = None) -> bool:
+        now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+        return self.checked_at is None or now_ms - self.checked_at >= self.ttl * 1000
+
+    def refresh(self, client, force: bool = False) -> dict:
+        """
+        Сверяет индекс с exchangeInfo, если он устарел (или force). Возвращает статистику sync_symbols
+        или None, если запрос к бирже не понадобился либо не удался (индекс остаётся прежним).
+        """
+        if not self._loaded:
+            self.load()
+        if not force and not self.is_stale():
+            return None
+        exchange_info = client.get_exchange_info()
+        if not isinstance(exchange_info, dict) or not exchange_info.get('symbols'):
+            return None
+        stats = self.writer.call(sync_symbols, exchange_info)
+        self.load()
+        return stats
+
+    def ensure(self, client) -> 'SymbolIndex':
+        """
+        Загружает индекс и при необходимости обновляет его; ошибки сети и разбора ответа биржи
+        пишутся в журнал и не мешают работе с сохранённым.
+        """
+        try:
+            self.refresh(client)
+        except (requests.RequestException, KeyError, TypeError, ValueError) as e:
+            logger.warning("Не удалось обновить список пар биржи, используется сохранённый: %r", e)
+            if not self._loaded:
+                self.load()
+        return self
+
+    def get(self, symbol: str) -> dict:
+        return self.records.get(symbol.upper())
+
+    def split(self, symbol: str):
+        """(базовый актив, котируемый актив) пары или None, если пары нет в индексе."""
+        record = self.get(symbol)
+        return (record['base_asset'], record['quote_asset']) if record else None
+
+    def quotes(self) -> list:
+        return sorted({record['quote_asset'] for record in self.records.values()})
+
+    def _prefix(self, keys: list, prefix: str) -> list:
+        lo = bisect.bisect_left(keys, prefix)
+        hi = bisect.bisect_left(keys, prefix + '\uffff')
+        return keys[lo:hi]
+
+    def search(self, query: str = '', quote: str = None, status: str = None, fuzzy: bool = True) -> list:
+        """
+        Пары, подходящие под запрос: сначала символы с префиксом query, затем пары с базовым активом
+        на query, а если точных совпадений нет - похожие символы (difflib). quote и status фильтруют
+        по котируемому активу и статусу. Пустой запрос - все пары по алфавиту.
+        """
+        query = (query or '').strip().upper()
+        with self._lock:
+            if not query:
+                symbols = list(self._symbols)
+            else:
+                symbols = self._prefix(self._symbols, query)
+                seen = set(symbols)
+                lo = bisect.bisect_left(self._bases, (query,))
+                hi = bisect.bisect_left(self._bases, (query + '\uffff',))
+                symbols += [symbol for _, symbol in self._bases[lo:hi] if symbol not in seen]
+                if not symbols and fuzzy:
+                    symbols = difflib.get_close_matches(query, self._symbols, n=20, cutoff=0.6)
+            records = [self.records[symbol] for symbol in symbols]
+        if quote:
+            records = [record for record in records if record['quote_asset'] == quote.upper()]
+        if status:
+            records = [record for record in records if record['status'] == status.upper()]
+        return records
+
+
+def paginate(items: list, page: int, page_size: int = SYMBOL_PAGE_SIZE):
+    """Срез страницы page (с 0) и общее число страниц."""
+    pages = max((len(items) + page_size - 1) // page_size, 1)
+    page = min(max(page, 0), pages - 1)
+    return items[page * page_size:(page + 1) * page_size], page, pages
+
+
+# Общий индекс процесса
+symbol_index = SymbolIndex()
@@ -0,0 +1,9 @@
+# tests/conftest.py
+import os
+import sys
+import tempfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+# portfolio.db и кэши создаются по относительным путям: тесты работают во временном каталоге
+os.chdir(tempfile.mkdtemp(prefix='portfolio-tests-'))
@@ -0,0 +1,51 @@
+# tests/test_analytics.py
+import json
+
+import numpy as np
+import pytest
+
+from analytics import ema, compute_indicators, IndicatorStream
+
+
+def reference_ema(values, alpha, initial=None):
+    result, previous = [], values[0] if initial is None else initial
+    for value in values:
+        previous = alpha * value + (1 - alpha) * previous
+        result.append(previous)
+    return np.array(result)
+
+
+def make_ohlcv(count: int, seed: int = 7) -> dict:
+    rng = np.random.default_rng(seed)
+    close = 30_000 * np.exp(np.cumsum(rng.normal(0, 0.002, count)))
+    spread = close * rng.uniform(0, 0.003, count)
+    return {'open_time': np.arange(count, dtype=np.int64) * 60_000, 'open': close, 'high': close + spread,
+            'low': close - spread, 'close': close, 'volume': rng.uniform(0, 5, count)}
+
+
+@pytest.mark.parametrize('alpha', [0.5, 2 / 21, 1 / 14, 0.001])
+def test_block_ema_matches_recursive_reference(alpha):
+    values = make_ohlcv(5_000)['close']
+    # при alpha = 0.5 блок - около 26 значений, так что проверяются и переносы между блоками
+    np.testing.assert_allclose(ema(values, alpha), reference_ema(values, alpha), rtol=1e-9)
+    np.testing.assert_allclose(ema(values[:100], alpha, initial=29_000.0),
+                               reference_ema(values[:100], alpha, initial=29_000.0), rtol=1e-9)
+
+
+def test_ema_edge_cases():
+    assert len(ema(np.array([]), 0.1)) == 0
+    assert ema(np.array([1.0, 2.0, 3.0]), 1.0).tolist() == [1.0, 2.0, 3.0]
+
+
+def test_indicator_stream_matches_whole_series():
+    ohlcv = make_ohlcv(1_000)
+    expected = compute_indicators(ohlcv)
+    stream, parts = IndicatorStream(), []
+    for lo, hi in ((0, 7), (7, 7), (7, 300), (300, 301), (301, 1_000)):
+        if lo == 301:
+            # продолжение в «другом запуске» по сохранённому в JSON состоянию
+            stream = IndicatorStream(state=json.loads(json.dumps(stream.state)))
+        parts.append(stream.update({name: values[lo:hi] for name, values in ohlcv.items()}))
+    for name, values in expected.items():
+        np.testing.assert_allclose(np.concatenate([part[name] for part in parts]), values, rtol=1e-9,
+                                   equal_nan=True, err_msg=name)
@@ -0,0 +1,116 @@
+# tests/test_binance_client.py
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+import binance_api_client
+from binance_api_client import BinanceClient
+
+
+class StubServer:
+    """HTTP-заглушка Binance: отвечает по очереди заданными (статус, заголовки, тело) и запоминает запросы."""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _reply(self):
+                stub.requests.append((self.command, self.path))
+                status, headers, body = stub.responses.pop(0)
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_GET = do_POST = do_DELETE = _reply
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Задержки клиента записываются вместо настоящего ожидания."""
+    recorded = []
+    monkeypatch.setattr(binance_api_client.time, 'sleep', lambda seconds: seconds and recorded.append(seconds))
+    return recorded
+
+
+def serve(responses):
+    server = StubServer(responses)
+    client = BinanceClient(api_key='key', api_secret='secret', base_url=server.url, backoff=0.5, max_backoff=30.0)
+    return server, client
+
+
+def test_get_is_retried_with_backoff_and_retry_after(sleeps):
+    server, client = serve([(500, {}, {'code': -1000}),
+                            (429, {'Retry-After': '7'}, {'code': -1003}),
+                            (200, {'X-MBX-USED-WEIGHT-1M': '12'}, {'symbol': 'BTCUSDT', 'price': '1.0'})])
+    try:
+        assert client.get_ticker_price('BTCUSDT') == {'symbol': 'BTCUSDT', 'price': '1.0'}
+    finally:
+        server.close()
+    assert len(server.requests) == 3
+    # первая задержка - экспоненциальная с джиттером, вторая - не меньше Retry-After
+    assert 0.25 <= sleeps[0] <= 0.75
+    assert sleeps[1] >= 7
+    assert client.used_weight == 12
+
+
+def test_get_gives_up_after_max_retries(sleeps):
+    server, client = serve([(503, {}, {'code': -1001})] * 4)
+    try:
+        assert client.get_ticker_price('BTCUSDT') == {'code': -1001}
+    finally:
+        server.close()
+    assert len(server.requests) == client.max_retries + 1
+    assert len(sleeps) == client.max_retries
+
+
+def test_long_ban_is_returned_without_retry(sleeps):
+    server, client = serve([(418, {'Retry-After': '600'}, {'code': -1003, 'msg': 'banned'})])
+    try:
+        assert client.get_ticker_price('BTCUSDT')['code'] == -1003
+    finally:
+        server.close()
+    assert len(server.requests) == 1
+    assert not sleeps
+    # следующий запрос сначала дождётся окончания бана
+    assert client._throttle_delay() > 590
+
+
+def test_signed_post_is_not_retried(sleeps):
+    server, client = serve([(503, {}, {'code': -1001}), (200, {}, {'orderId': 1})])
+    try:
+        assert client._send_request('POST', '/api/v3/order', {'symbol': 'BTCUSDT'}, signed=True) == {'code': -1001}
+    finally:
+        server.close()
+    assert len(server.requests) == 1
+    assert 'signature=' in server.requests[0][1]
+
+
+def test_post_is_retried_only_when_not_sent(sleeps):
+    server = StubServer([])
+    url = server.url
+    server.close()
+    client = BinanceClient(base_url=url, max_retries=2)
+    with pytest.raises(requests.ConnectionError):
+        client._send_request('DELETE', '/api/v3/order', {'symbol': 'BTCUSDT'})
+    # соединение не установилось - запрос не ушёл, повтор безопасен
+    assert len(sleeps) == 2
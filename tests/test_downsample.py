@@ -0,0 +1,56 @@
+# tests/test_downsample.py
+import numpy as np
+
+from downsample import lttb, load_plot_series, plot_resolutions
+from kline_backends import get_kline_backend
+from models import engine, init_db, Session
+from resample import resample_all
+
+
+def test_lttb_keeps_endpoints_and_point_count():
+    x = np.arange(10_000, dtype=np.int64)
+    y = np.sin(x / 50.0)
+    y[4321] = 10.0  # одиночный пик должен пережить прореживание
+    keep = lttb(x, y, 500)
+    assert len(keep) == 500
+    assert keep[0] == 0 and keep[-1] == len(x) - 1
+    assert np.all(np.diff(keep) > 0)
+    assert 4321 in keep
+
+
+def test_lttb_returns_short_series_unchanged():
+    x = np.arange(5)
+    assert lttb(x, x * 2.0, 10).tolist() == [0, 1, 2, 3, 4]
+    assert lttb(x, x * 2.0, 2).tolist() == [0, 1, 2, 3, 4]
+
+
+def test_plot_resolutions_pick_coarsest_interval_with_enough_candles():
+    day = 86_400_000
+    assert plot_resolutions('1m', 3 * day, 500) == ['5m', '1m']
+    assert plot_resolutions('1m', 3 * day, 2000) == ['1m']
+    assert plot_resolutions('1m', 400 * day, 300) == ['1d', '4h', '1h', '15m', '5m', '1m']
+    assert plot_resolutions('1h', 10 * 60_000, 100) == ['1h']
+
+
+def test_plot_series_uses_derived_interval_and_one_interval_only():
+    init_db(engine)
+    count = 3 * 1440
+    get_kline_backend().upsert_klines('PLOTUSDT', '1m', [[i * 60_000, '1', '2', '0.5', str(1 + i % 7), '1',
+                                                          i * 60_000 + 59_999] for i in range(count)])
+    # пока 5m не построены, окно рисуется по 1m
+    times, closes = load_plot_series('PLOTUSDT', '1m', max_points=500)
+    assert len(times) == 500 and times[0] == 0 and times[-1] == (count - 1) * 60_000
+
+    session = Session()
+    try:
+        resample_all(session, ['PLOTUSDT'])
+        session.commit()
+    finally:
+        session.close()
+    times, closes = load_plot_series('PLOTUSDT', '1m', max_points=500)
+    # окно читается свечами 5m: шаг ряда кратен 5 минутам, и 1m не примешиваются
+    assert len(times) == 500
+    assert np.all(times % 300_000 == 0)
+    # узкое окно - исходные 1m без прореживания
+    times, closes = load_plot_series('PLOTUSDT', '1m', 0, 300 * 60_000, max_points=500)
+    assert times.tolist() == [i * 60_000 for i in range(300)]
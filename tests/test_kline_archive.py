@@ -0,0 +1,77 @@
+# tests/test_kline_archive.py
+import numpy as np
+
+from kline_archive import KlineArchive, ARCHIVE_COLUMNS, compact_klines, load_history, iter_history, aggregate_history
+from kline_backends import get_kline_backend
+from models import engine, init_db, Session
+
+# 2024-01-31 00:00 UTC: трое суток минутных свечей переходят через границу месяца
+START_MS = 1_706_659_200_000
+
+
+def make_columns(count: int, start: int = START_MS) -> dict:
+    open_time = start + np.arange(count, dtype=np.int64) * 60_000
+    close = 100 + np.sin(np.arange(count) / 30.0)
+    return {'open_time': open_time, 'open': close, 'high': close + 1, 'low': close - 1, 'close': close,
+            'volume': np.full(count, 2.0), 'close_time': open_time + 59_999}
+
+
+def test_archive_round_trip_across_segments():
+    archive = KlineArchive('archive-round-trip')
+    data = make_columns(3 * 1440)
+    assert archive.append('RTUSDT', '1m', {name: values[:2000] for name, values in data.items()}) == 2000
+    # уже заархивированные свечи повторно не добавляются
+    assert archive.append('RTUSDT', '1m', {name: values[1000:] for name, values in data.items()}) == 3 * 1440 - 2000
+
+    index = archive.load_index('RTUSDT', '1m')
+    assert [segment['name'] for segment in index['segments']] == ['2024-01', '2024-02']
+    assert index['archived_until'] == int(data['open_time'][-1]) + 1
+    restored = archive.read_range('RTUSDT', '1m')
+    for name in ARCHIVE_COLUMNS:
+        np.testing.assert_array_equal(restored[name], data[name])
+
+    start, end = int(data['open_time'][10]), int(data['open_time'][500])
+    window = archive.read_range('RTUSDT', '1m', start, end, ('open_time', 'close'))
+    np.testing.assert_array_equal(window['open_time'], data['open_time'][10:500])
+    # внутри одного сегмента - срез отображённого в память файла, без копирования
+    assert isinstance(window['close'], np.memmap)
+
+    chunks = list(archive.iter_range('RTUSDT', '1m', start, None, ('open_time',), chunk_size=700))
+    assert max(len(chunk['open_time']) for chunk in chunks) <= 700
+    np.testing.assert_array_equal(np.concatenate([chunk['open_time'] for chunk in chunks]), data['open_time'][10:])
+
+
+def test_compaction_keeps_history_reads_unchanged():
+    init_db(engine)
+    archive = KlineArchive('archive-compaction')
+    data = make_columns(3 * 1440)
+    rows = [[int(t), o, h, l, c, v, int(ct)] for t, o, h, l, c, v, ct in
+            zip(*(data[name].tolist() for name in ARCHIVE_COLUMNS))]
+    backend = get_kline_backend()
+    backend.upsert_klines('COMPACTUSDT', '1m', rows)
+    session = Session()
+    try:
+        expected_aggregate = aggregate_history(session, ['COMPACTUSDT'], '1m', archive=archive)
+        before = START_MS + 2 * 1440 * 60_000
+        assert compact_klines(session, 'COMPACTUSDT', '1m', before=before, archive=archive) == 2 * 1440
+
+        hot = backend.load_ohlcv(['COMPACTUSDT'], '1m', session=session)['COMPACTUSDT']
+        assert hot['open_time'][0] == before and len(hot['open_time']) == 1440
+        # свечи, повторно загруженные после архивации, не дублируются при чтении
+        backend.upsert_klines('COMPACTUSDT', '1m', rows[:100], session=session)
+        session.commit()
+
+        history = load_history(session, ['COMPACTUSDT'], '1m', archive=archive)['COMPACTUSDT']
+        streamed = list(iter_history(session, 'COMPACTUSDT', '1m', chunk_size=1000, archive=archive))
+        aggregate = aggregate_history(session, ['COMPACTUSDT'], '1m', archive=archive)
+    finally:
+        session.close()
+    np.testing.assert_array_equal(history['open_time'], data['open_time'])
+    np.testing.assert_allclose(history['close'], data['close'])
+    np.testing.assert_array_equal(np.concatenate([chunk['open_time'] for chunk in streamed]), data['open_time'])
+    assert aggregate[0].keys() == expected_aggregate[0].keys()
+    for key, value in expected_aggregate[0].items():
+        if isinstance(value, float):
+            assert np.isclose(aggregate[0][key], value), key
+        else:
+            assert aggregate[0][key] == value, key
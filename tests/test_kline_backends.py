@@ -0,0 +1,29 @@
+# tests/test_kline_backends.py
+import pytest
+
+from kline_backends import SQLiteKlineBackend, DuckDBKlineBackend
+from kline_store import AGGREGATE_KEYS
+from models import engine, init_db
+
+
+def seed(backend, symbol: str):
+    backend.upsert_klines(symbol, '1m', [[i * 60_000, '1', '2', '0.5', str(1 + i), '1', i * 60_000 + 59_999]
+                                         for i in range(5)])
+
+
+def test_aggregate_rows_share_one_key_order():
+    pytest.importorskip('duckdb')
+    init_db(engine)
+    sqlite, duckdb = SQLiteKlineBackend(), DuckDBKlineBackend('aggregate-order.duckdb')
+    try:
+        rows = []
+        for backend in (sqlite, duckdb):
+            seed(backend, 'ORDERUSDT')
+            rows.append(backend.aggregate(['ORDERUSDT'], '1m')[0])
+            rows.append(backend.aggregate(['ORDERUSDT'])[0])
+    finally:
+        duckdb.close()
+    for row in rows:
+        assert tuple(row) == AGGREGATE_KEYS
+    assert rows[0] == rows[2] and rows[0]['interval'] == '1m' and rows[1]['interval'] == 'all'
+    assert rows[0]['first_close'] == 1.0 and rows[0]['last_close'] == 5.0
@@ -0,0 +1,87 @@
+# tests/test_kline_export.py
+import csv
+import gzip
+import os
+
+import numpy as np
+
+from analytics import compute_indicators
+from kline_archive import KlineArchive, compact_klines
+from kline_backends import get_kline_backend
+from kline_export import export_klines, ExportWatermarks, ARCHIVE_COLUMNS, INDICATOR_COLUMNS
+from models import engine, init_db, Session
+
+START_MS = 1_706_659_200_000  # 2024-01-31 00:00 UTC
+
+
+def store_minutes(symbol: str, first: int, last: int):
+    get_kline_backend().upsert_klines(symbol, '1m', [
+        [START_MS + i * 60_000, '1', str(2 + i % 5), '0.5', str(100 + np.sin(i / 9.0)), str(1 + i % 3),
+         START_MS + i * 60_000 + 59_999] for i in range(first, last)])
+
+
+def read_csv(path: str):
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', newline='', encoding='utf-8') as f:
+        rows = list(csv.reader(f))
+    return rows[0], rows[1:]
+
+
+def test_streamed_export_resumes_with_a_stable_header(tmp_path):
+    init_db(engine)
+    archive = KlineArchive(str(tmp_path / 'archive'))
+    store_minutes('EXPAUSDT', 0, 3000)
+    store_minutes('EXPBUSDT', 0, 500)
+    session = Session()
+    try:
+        # часть истории EXPAUSDT уже в архиве: выгрузка читает архив и «горячий» хвост одним потоком
+        compact_klines(session, 'EXPAUSDT', '1m', before=START_MS + 1800 * 60_000, archive=archive)
+    finally:
+        session.close()
+    directory = str(tmp_path / 'export')
+    first = export_klines(['EXPAUSDT', 'EXPBUSDT'], '1m', directory, workers=1, chunk_size=256, archive=archive)
+    assert [result['rows'] for result in first] == [3000, 500]
+
+    header, rows = read_csv(first[0]['file'])
+    assert header == ['symbol', *ARCHIVE_COLUMNS]
+    assert [int(row[1]) for row in rows] == [START_MS + i * 60_000 for i in range(3000)]
+    assert {row[0] for row in rows} == {'EXPAUSDT'}
+    assert os.path.basename(first[0]['file']) == 'EXPAUSDT_1m_20240131T0000_20240202T0159.csv'
+
+    # инкрементальная выгрузка: только новые свечи, тот же заголовок, отметка копит число строк
+    store_minutes('EXPAUSDT', 3000, 3100)
+    second = export_klines(['EXPAUSDT', 'EXPBUSDT'], '1m', directory, workers=1, chunk_size=256, archive=archive)
+    assert [result['rows'] for result in second] == [100, 0] and second[1]['file'] is None
+    next_header, rows = read_csv(second[0]['file'])
+    assert next_header == header
+    assert int(rows[0][1]) == START_MS + 3000 * 60_000
+    mark = ExportWatermarks(directory).get('EXPAUSDT/1m/klines/csv')
+    assert mark['rows'] == 3100 and mark['until'] == START_MS + 3099 * 60_000 + 1
+    assert not [name for name in os.listdir(directory) if name.endswith('.part')]
+
+
+def test_incremental_indicator_export_matches_whole_series(tmp_path):
+    init_db(engine)
+    archive = KlineArchive(str(tmp_path / 'archive'))
+    store_minutes('EXPIUSDT', 0, 1000)
+    directory = str(tmp_path / 'export')
+    first = export_klines(['EXPIUSDT'], '1m', directory, fmt='csv.gz', indicators=True, workers=1, chunk_size=128,
+                          archive=archive)[0]
+    store_minutes('EXPIUSDT', 1000, 1400)
+    second = export_klines(['EXPIUSDT'], '1m', directory, fmt='csv.gz', indicators=True, workers=1, chunk_size=128,
+                           archive=archive)[0]
+    header, rows = read_csv(first['file'])
+    next_header, next_rows = read_csv(second['file'])
+    assert header == next_header == ['symbol', *ARCHIVE_COLUMNS, *INDICATOR_COLUMNS]
+    assert len(rows) == 1000 and len(next_rows) == 400
+
+    session = Session()
+    try:
+        data = get_kline_backend().load_ohlcv(['EXPIUSDT'], '1m', session=session)['EXPIUSDT']
+    finally:
+        session.close()
+    expected = compute_indicators(data)
+    for name in INDICATOR_COLUMNS:
+        position = header.index(name)
+        exported = np.array([float(row[position]) if row[position] else np.nan for row in rows + next_rows])
+        np.testing.assert_allclose(exported, expected[name], rtol=1e-9, equal_nan=True, err_msg=name)
@@ -0,0 +1,56 @@
+# tests/test_kline_store.py
+import numpy as np
+
+from kline_store import parse_valid_klines, upsert_batch, load_ohlcv
+from models import engine, init_db, Session
+from schemas import parse_klines_batch
+
+
+def row(minute: int, close='1') -> list:
+    return [minute * 60_000, '1', '2', '0.5', close, '1', minute * 60_000 + 59_999]
+
+
+def test_out_of_order_row_does_not_drop_the_rows_after_it():
+    rows = [row(0), row(1), row(100), row(2), row(3), row(4)]
+    batch, errors = parse_valid_klines(rows)
+    assert batch['open_time'].tolist() == [0, 60_000, 120_000, 180_000, 240_000]
+    assert [index for index, _ in errors] == [2]
+
+
+def test_each_bad_row_is_reported_once_and_valid_rows_kept():
+    rows = [row(0), row(1)[:5], row(2), [120_000.5] + row(3)[1:], row(4, close='x'), row(5), row(5)]
+    batch, errors = parse_valid_klines(rows)
+    assert batch['open_time'].tolist() == [0, 120_000, 300_000]
+    assert [index for index, _ in errors] == [1, 3, 4, 6]
+    assert 'не целое' in dict(errors)[3]
+
+
+def test_fractional_times_are_rejected_not_truncated():
+    integral = [[float(minute * 60_000)] + row(minute)[1:] for minute in range(3)]
+    assert parse_klines_batch(integral)['open_time'].tolist() == [0, 60_000, 120_000]
+    batch, errors = parse_valid_klines(integral[:2] + [[120_000.25] + row(2)[1:]])
+    assert batch['open_time'].tolist() == [0, 60_000]
+    assert [index for index, _ in errors] == [2]
+
+
+def test_upsert_batch_counts_inserted_rows():
+    init_db(engine)
+    session = Session()
+    try:
+        batch, _ = parse_valid_klines([row(minute) for minute in range(10)])
+        assert upsert_batch(session, 'STOREUSDT', '1m', batch) == {'inserted': 10, 'skipped': 0}
+        batch, _ = parse_valid_klines([row(minute, close='3') for minute in range(5, 15)])
+        assert upsert_batch(session, 'STOREUSDT', '1m', batch, chunk_size=4) == {'inserted': 5, 'skipped': 5}
+        closes = load_ohlcv(session, ['STOREUSDT'], '1m')['STOREUSDT']['close']
+        assert closes.tolist() == [1.0] * 10 + [3.0] * 5
+
+        batch, _ = parse_valid_klines([row(minute, close='7') for minute in range(12, 18)])
+        assert upsert_batch(session, 'STOREUSDT', '1m', batch, update=True, chunk_size=4) == \
+            {'inserted': 3, 'skipped': 3}
+        data = load_ohlcv(session, ['STOREUSDT'], '1m')['STOREUSDT']
+        session.commit()
+    finally:
+        session.close()
+    assert len(data['open_time']) == 18
+    assert np.array_equal(data['close'][:10], [1.0] * 10)
+    assert data['close'][10:].tolist() == [3.0, 3.0, 7.0, 7.0, 7.0, 7.0, 7.0, 7.0]
@@ -0,0 +1,51 @@
+# tests/test_migration.py
+from datetime import datetime
+
+from sqlalchemy import text
+
+from models import create_db_engine, init_db, migrate_klines_table
+
+# Таблица klines исходной схемы: DateTime-строки в локальном времени, без interval
+BASELINE_KLINES_SQL = (
+    "CREATE TABLE klines (id INTEGER NOT NULL PRIMARY KEY, symbol VARCHAR NOT NULL, open_time DATETIME NOT NULL, "
+    "open FLOAT NOT NULL, high FLOAT NOT NULL, low FLOAT NOT NULL, close FLOAT NOT NULL, volume FLOAT NOT NULL, "
+    "close_time DATETIME NOT NULL)"
+)
+
+
+def as_stored(ms: int) -> str:
+    """DateTime так, как его записывал исходный код: datetime.fromtimestamp и формат SQLAlchemy."""
+    return datetime.fromtimestamp(ms / 1000).strftime('%Y-%m-%d %H:%M:%S.%f')
+
+
+def test_baseline_klines_table_is_migrated_to_ms_with_intervals():
+    engine = create_db_engine('sqlite:///baseline.db')
+    start = 1_700_000_040_000
+    old = [('BTCUSDT', start + i * 60_000, start + i * 60_000 + 59_999) for i in range(3)]
+    old += [('ETHUSDT', start, start + 3_600_000 - 1), ('ETHUSDT', start, start + 3_600_000 - 1)]
+    with engine.begin() as conn:
+        conn.execute(text(BASELINE_KLINES_SQL))
+        for index, (symbol, open_ms, close_ms) in enumerate(old):
+            conn.execute(text("INSERT INTO klines (symbol, open_time, open, high, low, close, volume, close_time) "
+                              "VALUES (:symbol, :open_time, 1, 2, 0.5, :close, 10, :close_time)"),
+                         {'symbol': symbol, 'open_time': as_stored(open_ms), 'close': 1.0 + index,
+                          'close_time': as_stored(close_ms)})
+
+    init_db(engine)
+    with engine.connect() as conn:
+        columns = {row[1]: row[2].upper() for row in conn.execute(text("PRAGMA table_info(klines)"))}
+        rows = conn.execute(text("SELECT symbol, interval, open_time, close_time, close FROM klines "
+                                 "ORDER BY symbol, open_time")).all()
+        tables = {row[0] for row in conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'table'"))}
+    assert columns['open_time'] == 'BIGINT' and 'interval' in columns
+    assert 'klines_old' not in tables
+    # дубликат свечи из старой таблицы отбрасывается, первая запись сохраняется
+    assert [tuple(row) for row in rows] == [
+        ('BTCUSDT', '1m', start, start + 59_999, 1.0),
+        ('BTCUSDT', '1m', start + 60_000, start + 119_999, 2.0),
+        ('BTCUSDT', '1m', start + 120_000, start + 179_999, 3.0),
+        ('ETHUSDT', '1h', start, start + 3_599_999, 4.0),
+    ]
+    # повторный запуск ничего не меняет
+    assert migrate_klines_table(engine) is False
+    engine.dispose()
@@ -0,0 +1,105 @@
+# tests/test_portfolio_bulk.py
+import json
+
+from models import engine, init_db, Session, Portfolio, Asset, AssetHolding
+from portfolio_bulk import read_holdings, import_holdings, export_holdings, value_all_portfolios
+
+
+def assets_of(session, name: str) -> dict:
+    portfolio = session.query(Portfolio).filter_by(name=name).one()
+    return {asset.symbol: asset.amount for asset in portfolio.assets}
+
+
+def test_read_holdings_reports_bad_rows_with_file_line_numbers(tmp_path):
+    path = tmp_path / 'holdings.csv'
+    path.write_text("portfolio,symbol,amount,name\n"
+                    "alice,btcusdt,1.5,Bitcoin\n"
+                    ",ETHUSDT,1,\n"
+                    "alice,ETHUSDT,-2,\n"
+                    "alice,ETHUSDT,abc,\n"
+                    "bob,ETHUSDT,nan,\n"
+                    "bob,ETHUSDT,3,\n", encoding='utf-8')
+    holdings, errors = read_holdings(str(path))
+    assert [(h['portfolio'], h['symbol'], h['amount']) for h in holdings] == [('alice', 'BTCUSDT', 1.5),
+                                                                            ('bob', 'ETHUSDT', 3.0)]
+    assert [number for number, _ in errors] == [3, 4, 5, 6]
+
+    path = tmp_path / 'holdings.json'
+    path.write_text(json.dumps({'carol': {'BNBUSDT': 4, 'ADAUSDT': 'x'}}), encoding='utf-8')
+    holdings, errors = read_holdings(str(path))
+    assert [(h['portfolio'], h['symbol'], h['amount']) for h in holdings] == [('carol', 'BNBUSDT', 4.0)]
+    assert [number for number, _ in errors] == [2]
+
+
+def test_import_resolves_conflicts_with_existing_portfolios():
+    init_db(engine)
+    session = Session()
+    try:
+        existing = Portfolio(name='bulk-existing')
+        session.add(existing)
+        session.flush()
+        session.add_all([Asset(portfolio_id=existing.id, symbol='BTCUSDT', name='Bitcoin', amount=1.0),
+                         Asset(portfolio_id=existing.id, symbol='ETHUSDT', name='Ether', amount=2.0),
+                         Asset(portfolio_id=existing.id, symbol='XRPUSDT', name='XRP', amount=3.0)])
+        session.commit()
+
+        holdings = [
+            {'portfolio': 'bulk-existing', 'symbol': 'BTCUSDT', 'amount': 1.0, 'name': None},  # без изменений
+            {'portfolio': 'bulk-existing', 'symbol': 'ETHUSDT', 'amount': 5.0, 'name': None},
+            {'portfolio': 'bulk-existing', 'symbol': 'ETHUSDT', 'amount': 6.0, 'name': None},  # последняя запись
+            {'portfolio': 'bulk-existing', 'symbol': 'XRPUSDT', 'amount': 0.0, 'name': None},  # удаление
+            {'portfolio': 'bulk-new', 'symbol': 'BNBUSDT', 'amount': 7.0, 'name': 'BNB'},
+        ]
+        stats = import_holdings(session, holdings, changed_at=1_000)
+        session.commit()
+        assert stats == {'portfolios_created': 1, 'inserted': 1, 'updated': 1, 'removed': 1, 'unchanged': 1}
+        assert assets_of(session, 'bulk-existing') == {'BTCUSDT': 1.0, 'ETHUSDT': 6.0}
+        assert assets_of(session, 'bulk-new') == {'BNBUSDT': 7.0}
+        assert session.query(Portfolio).filter_by(name='bulk-existing').count() == 1
+        # история: прежнее количество с начала времён и новое с момента импорта
+        history = session.query(AssetHolding.changed_at, AssetHolding.amount) \
+            .filter_by(portfolio_id=existing.id, symbol='ETHUSDT').order_by(AssetHolding.changed_at).all()
+        assert [tuple(row) for row in history] == [(0, 2.0), (1_000, 6.0)]
+
+        # replace убирает активы затронутых портфелей, которых нет в списке; другие портфели не трогаются
+        stats = import_holdings(session, [{'portfolio': 'bulk-existing', 'symbol': 'ETHUSDT', 'amount': 6.0,
+                                           'name': None}], replace=True, changed_at=2_000)
+        session.commit()
+        assert stats['removed'] == 1 and stats['unchanged'] == 1
+        assert assets_of(session, 'bulk-existing') == {'ETHUSDT': 6.0}
+        assert assets_of(session, 'bulk-new') == {'BNBUSDT': 7.0}
+    finally:
+        session.close()
+
+
+def test_export_import_round_trip_and_valuation(tmp_path):
+    init_db(engine)
+    session = Session()
+    try:
+        import_holdings(session, [{'portfolio': 'bulk-trip', 'symbol': 'BTCUSDT', 'amount': 0.5, 'name': 'Bitcoin'},
+                                  {'portfolio': 'bulk-trip', 'symbol': 'NOPRICEUSDT', 'amount': 1.0, 'name': None},
+                                  {'portfolio': 'bulk-empty', 'symbol': 'ETHUSDT', 'amount': 0.0, 'name': None}])
+        session.commit()
+        for suffix in ('csv', 'json'):
+            path = str(tmp_path / f'export.{suffix}')
+            assert export_holdings(session, path, names=['bulk-trip']) == 2
+            holdings, errors = read_holdings(path)
+            assert errors == []
+            assert import_holdings(session, holdings)['unchanged'] == 2
+
+        requested = []
+
+        def get_prices(symbols):
+            requested.append(set(symbols))
+            return {'BTCUSDT': 60_000.0}
+
+        result = value_all_portfolios(session, get_prices, names=['bulk-trip', 'bulk-empty'],
+                                      rates={'USD': 1.0, 'EUR': 0.5})
+    finally:
+        session.close()
+    assert requested == [{'BTCUSDT', 'NOPRICEUSDT'}]
+    assert [p['name'] for p in result['portfolios']] == ['bulk-empty', 'bulk-trip']
+    empty, trip = result['portfolios']
+    assert empty['assets'] == 0 and empty['totals'] == {'USD': 0.0, 'EUR': 0.0}
+    assert trip['assets'] == 2 and trip['totals'] == {'USD': 30_000.0, 'EUR': 15_000.0}
+    assert trip['missing'] == ['NOPRICEUSDT']
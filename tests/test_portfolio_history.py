@@ -0,0 +1,95 @@
+# tests/test_portfolio_history.py
+import numpy as np
+
+from kline_backends import get_kline_backend
+from models import engine, init_db, Session, Portfolio, Asset
+from portfolio_history import record_holding, compute_portfolio_history, PortfolioHistoryCache
+
+HOUR = 3_600_000
+T0 = 1_699_999_200_000  # начало часа
+
+
+def store_hours(symbol: str, first: int, last: int, price):
+    get_kline_backend().upsert_klines(symbol, '1h', [[T0 + hour * HOUR, '1', '1', '1', str(price(hour)), '1',
+                                                      T0 + (hour + 1) * HOUR - 1] for hour in range(first, last)])
+
+
+def reference_value(times, holdings, closes):
+    """Стоимость в каждой точке сетки перебором: количество на закрытие свечи, последняя известная цена."""
+    values = []
+    for t in times:
+        total = 0.0
+        for symbol, events in holdings.items():
+            amount = ([a for changed_at, a in events if changed_at <= t + HOUR - 1] or [0.0])[-1]
+            price = ([c for open_time, c in closes[symbol] if open_time <= t] or [np.nan])[-1]
+            if price == price:
+                total += amount * price
+        values.append(total)
+    return np.array(values)
+
+
+def make_portfolio(session, name: str) -> int:
+    portfolio = Portfolio(name=name)
+    session.add(portfolio)
+    session.flush()
+    # актив, добавленный до появления истории количеств, и актив с историей правок
+    session.add(Asset(portfolio_id=portfolio.id, symbol='HISTAUSDT', name='A', amount=2.0))
+    session.add(Asset(portfolio_id=portfolio.id, symbol='HISTBUSDT', name='B', amount=5.0))
+    record_holding(session, portfolio.id, 'HISTBUSDT', 1.0, changed_at=T0 + 3 * HOUR + 10)
+    record_holding(session, portfolio.id, 'HISTBUSDT', 5.0, changed_at=T0 + 7 * HOUR)
+    session.commit()
+    return portfolio.id
+
+
+def test_history_matches_per_point_reference():
+    init_db(engine)
+    store_hours('HISTAUSDT', 0, 12, lambda hour: 100 + hour)
+    store_hours('HISTBUSDT', 2, 12, lambda hour: 10 + hour % 3)  # первые два часа цены ещё нет
+    session = Session()
+    try:
+        portfolio_id = make_portfolio(session, 'history-reference')
+        series = compute_portfolio_history(session, [portfolio_id], '1h')[portfolio_id]
+    finally:
+        session.close()
+    times = series['times']
+    assert times.tolist() == [T0 + hour * HOUR for hour in range(12)]
+    holdings = {'HISTAUSDT': [(0, 2.0)],
+                'HISTBUSDT': [(T0 + 3 * HOUR + 10, 1.0), (T0 + 7 * HOUR, 5.0)]}
+    closes = {'HISTAUSDT': [(T0 + hour * HOUR, 100.0 + hour) for hour in range(12)],
+              'HISTBUSDT': [(T0 + hour * HOUR, 10.0 + hour % 3) for hour in range(2, 12)]}
+    np.testing.assert_allclose(series['value'], reference_value(times, holdings, closes))
+
+
+def test_cache_extends_tail_and_resets_on_holding_change():
+    init_db(engine)
+    store_hours('HISTAUSDT', 0, 12, lambda hour: 100 + hour)
+    store_hours('HISTBUSDT', 2, 12, lambda hour: 10 + hour % 3)
+    cache = PortfolioHistoryCache()
+    session = Session()
+    try:
+        portfolio_id = make_portfolio(session, 'history-cache')
+        first = cache.get(session, [portfolio_id], '1h', start=T0)[portfolio_id]
+        assert len(first['times']) == 12
+        session.commit()  # чтение не должно держать снимок базы, пока свечи пишутся другим соединением
+
+        # новые свечи: досчитывается только хвост, результат как у полного пересчёта
+        store_hours('HISTAUSDT', 12, 15, lambda hour: 200 + hour)
+        store_hours('HISTBUSDT', 12, 14, lambda hour: 20 + hour)
+        extended = cache.get(session, [portfolio_id], '1h', start=T0)[portfolio_id]
+        full = compute_portfolio_history(session, [portfolio_id], '1h', T0)[portfolio_id]
+        np.testing.assert_array_equal(extended['times'], full['times'])
+        np.testing.assert_allclose(extended['value'], full['value'])
+        session.commit()
+
+        # правка количества меняет версию портфеля - ряд пересчитывается целиком
+        record_holding(session, portfolio_id, 'HISTAUSDT', 0.0, changed_at=T0 + HOUR, previous=2.0)
+        session.commit()
+        changed = cache.get(session, [portfolio_id], '1h', start=T0)[portfolio_id]
+        full = compute_portfolio_history(session, [portfolio_id], '1h', T0)[portfolio_id]
+        np.testing.assert_allclose(changed['value'], full['value'])
+        assert changed['value'][0] == first['value'][0] and changed['value'][5] != first['value'][5]
+
+        sliced = cache.get(session, [portfolio_id], '1h', start=T0, end=T0 + 4 * HOUR)[portfolio_id]
+        assert len(sliced['times']) == 4 and sliced['values'].shape == (2, 4)
+    finally:
+        session.close()
@@ -0,0 +1,75 @@
+# tests/test_resample.py
+import numpy as np
+
+from backfill import KlineBackfill
+from kline_archive import load_history
+from models import engine, init_db, Session
+from resample import resample_klines, resample_ohlcv, get_resample_mark
+
+
+def kline_row(i: int) -> list:
+    return [i * 60_000, '1', str(2 + i % 3), '0.5', str(1 + i % 7), '1', i * 60_000 + 59_999]
+
+
+class FakeClient:
+    """get_klines по заданному набору минут; missing - минуты, которых у «биржи» пока нет."""
+
+    def __init__(self, count: int, missing=()):
+        self.count = count
+        self.missing = set(missing)
+
+    def get_klines(self, symbol, interval, startTime, endTime, limit):
+        first, last = startTime // 60_000, min(endTime // 60_000, self.count - 1)
+        return [kline_row(i) for i in range(first, last + 1) if i not in self.missing][:limit]
+
+
+def resample(symbol: str, interval: str) -> dict:
+    session = Session()
+    try:
+        stats = resample_klines(session, symbol, interval)
+        session.commit()
+        return stats
+    finally:
+        session.close()
+
+
+def test_resample_ohlcv_drops_incomplete_buckets():
+    rows = [kline_row(i) for i in range(20) if i not in (7, 8)]
+    data = {
+        'open_time': np.array([row[0] for row in rows], dtype=np.int64),
+        'open': np.ones(len(rows)), 'high': np.array([float(row[2]) for row in rows]),
+        'low': np.full(len(rows), 0.5), 'close': np.array([float(row[4]) for row in rows]),
+        'volume': np.ones(len(rows)),
+    }
+    batch = resample_ohlcv(data, '5m')
+    assert batch['open_time'].tolist() == [0, 10 * 60_000, 15 * 60_000]
+    assert batch['close_time'].tolist() == [5 * 60_000 - 1, 15 * 60_000 - 1, 20 * 60_000 - 1]
+    assert batch['volume'].tolist() == [5.0, 5.0, 5.0]
+
+
+def test_backfilled_gap_is_resampled():
+    init_db(engine)
+    count, gap = 60, range(12, 14)
+    KlineBackfill(client=FakeClient(count, gap), concurrency=2, page_limit=25).run('GAPUSDT', '1m', 0, count * 60_000)
+    stats = resample('GAPUSDT', '5m')
+    assert stats['buckets'] == 11
+    assert stats['high_water'] == count * 60_000
+
+    # пропуск догружен - корзина 10-14 минут должна появиться, отметка построения вернулась назад
+    KlineBackfill(client=FakeClient(count), concurrency=2, page_limit=25).run('GAPUSDT', '1m', 0, count * 60_000,
+                                                                             resume=False)
+    session = Session()
+    try:
+        assert get_resample_mark(session, 'GAPUSDT', '5m') == 0
+    finally:
+        session.close()
+    stats = resample('GAPUSDT', '5m')
+    assert stats['inserted'] == 1
+
+    session = Session()
+    try:
+        data = load_history(session, ['GAPUSDT'], '5m')['GAPUSDT']
+    finally:
+        session.close()
+    assert data['open_time'].tolist() == [i * 300_000 for i in range(12)]
+    assert data['volume'].tolist() == [5.0] * 12
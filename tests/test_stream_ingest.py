@@ -0,0 +1,124 @@
+# tests/test_stream_ingest.py
+import asyncio
+import json
+import time
+from concurrent.futures import Future
+
+from sqlalchemy.exc import OperationalError
+
+import stream_ingest
+from stream_ingest import KlineStreamIngestor, LivePriceTable
+
+
+def kline_message(symbol: str, open_time: int) -> str:
+    kline = {'t': open_time, 'T': open_time + 59_999, 'o': '1', 'h': '2', 'l': '0.5', 'c': '1.5', 'v': '10', 'x': True}
+    return json.dumps({'stream': f"{symbol.lower()}@kline_1m",
+                       'data': {'e': 'kline', 'E': open_time + 60_000, 's': symbol, 'k': kline}})
+
+
+class FakeSocket:
+    """Отдаёт сообщения по очереди, затем обрывает соединение (OSError) или останавливает ингестор."""
+
+    def __init__(self, ingestor, messages, drop: bool):
+        self.ingestor = ingestor
+        self.messages = list(messages)
+        self.drop = drop
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def recv(self):
+        if self.messages:
+            return self.messages.pop(0)
+        if self.drop:
+            raise OSError("connection reset")
+        self.ingestor._stop.set()
+        await asyncio.sleep(1)
+
+
+class FakeBackfill:
+    def __init__(self, failing):
+        self.failing = set(failing)
+        self.calls = []
+
+    def run(self, symbol, interval, start):
+        self.calls.append((symbol, interval, start))
+        if symbol in self.failing:
+            self.failing.discard(symbol)
+            raise RuntimeError("Ошибка Binance API")
+        return {'new': 3}
+
+
+class FakeWriter:
+    """Очередь записи, которая первые failures раз отвечает ошибкой базы, а потом запоминает свечи."""
+
+    def __init__(self, failures: int):
+        self.failures = failures
+        self.stored = []
+
+    def submit(self, func, buffer):
+        future = Future()
+        if self.failures:
+            self.failures -= 1
+            future.set_exception(OperationalError('INSERT', {}, Exception('database is locked')))
+        else:
+            rows = [(symbol, row[0]) for symbol, symbol_rows in buffer.items() for row in symbol_rows]
+            self.stored.extend(rows)
+            future.set_result(len(rows))
+        return future
+
+
+def test_reconnect_survives_bad_messages_and_failed_writes(monkeypatch):
+    backfill = FakeBackfill(failing={'ETHUSDT'})
+    writer = FakeWriter(failures=1)
+    ingestor = KlineStreamIngestor(['BTCUSDT', 'ETHUSDT'], prices=LivePriceTable(), backfill=backfill,
+                                   batch_size=1000, flush_interval=0.05, reconnect_delay=0.01, writer=writer)
+    connections = [
+        ['not json', json.dumps({'data': {'e': 'kline', 's': 'BTCUSDT'}}), kline_message('BTCUSDT', 0)],
+        [kline_message('BTCUSDT', 60_000)],
+    ]
+
+    def connect(url):
+        assert url == ingestor.stream_url()
+        messages = connections.pop(0)
+        return FakeSocket(ingestor, messages, drop=bool(connections))
+
+    monkeypatch.setattr(stream_ingest.websockets, 'connect', connect)
+    monkeypatch.setattr(stream_ingest, 'get_high_water',
+                        lambda session, symbol, interval: 120_000 if symbol == 'BTCUSDT' else None)
+
+    started_ms = time.time() * 1000
+    asyncio.run(ingestor.run())
+
+    assert ingestor.stats['bad_messages'] == 2
+    assert ingestor.stats['reconnects'] == 1
+    # ошибка догрузки ETHUSDT и неудачная запись буфера
+    assert ingestor.stats['errors'] == 2
+    # свеча из неудачной записи не потерялась и сохранена раньше пришедшей после переподключения
+    assert writer.stored == [('BTCUSDT', 0), ('BTCUSDT', 60_000)]
+    assert ingestor.stats['stored'] == 2
+
+    # пропуск догружается при каждом подключении; символ без отметки - за backfill_lookback
+    assert [call[0] for call in backfill.calls] == ['BTCUSDT', 'ETHUSDT'] * 2
+    assert backfill.calls[0][2] == 120_000
+    eth_start = backfill.calls[1][2]
+    assert abs(eth_start - (started_ms - ingestor.backfill_lookback * 1000)) < 60_000
+    assert ingestor.stats['backfilled'] == 3 + 6
+
+
+def test_non_object_frames_are_skipped(monkeypatch):
+    ingestor = KlineStreamIngestor(['BTCUSDT'], prices=LivePriceTable(), batch_size=1000, flush_interval=0.05,
+                                   writer=FakeWriter(failures=0))
+    frames = ['[]', 'null', '1', '"text"', json.dumps({'data': [1, 2]}), kline_message('BTCUSDT', 0)]
+    connections = [frames]
+
+    def connect(url):
+        return FakeSocket(ingestor, connections.pop(0), drop=False)
+
+    monkeypatch.setattr(stream_ingest.websockets, 'connect', connect)
+    asyncio.run(ingestor.run())
+    assert ingestor.stats['bad_messages'] == 5
+    assert ingestor.writer.stored == [('BTCUSDT', 0)]
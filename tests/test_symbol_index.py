@@ -0,0 +1,72 @@
+# tests/test_symbol_index.py
+import requests
+
+from models import engine, init_db
+from symbol_index import SymbolIndex, paginate
+
+
+def entry(symbol: str, base: str, quote: str, status: str = 'TRADING', tick: str = '0.01') -> dict:
+    return {'symbol': symbol, 'baseAsset': base, 'quoteAsset': quote, 'status': status,
+            'filters': [{'filterType': 'PRICE_FILTER', 'tickSize': tick}]}
+
+
+class FakeClient:
+    def __init__(self, symbols):
+        self.symbols = symbols
+        self.calls = 0
+
+    def get_exchange_info(self):
+        self.calls += 1
+        if isinstance(self.symbols, Exception):
+            raise self.symbols
+        return {'symbols': self.symbols}
+
+
+SYMBOLS = [entry('BTCUSDT', 'BTC', 'USDT'), entry('BTCEUR', 'BTC', 'EUR'), entry('ETHBTC', 'ETH', 'BTC'),
+           entry('ETHUSDT', 'ETH', 'USDT'), entry('BNBUSDT', 'BNB', 'USDT', status='BREAK'),
+           entry('USDTTRY', 'USDT', 'TRY')]
+
+
+def test_refresh_syncs_only_changes_and_respects_ttl():
+    init_db(engine)
+    index, client = SymbolIndex(ttl=3600), FakeClient(SYMBOLS)
+    assert index.refresh(client, force=True)['added'] == len(SYMBOLS)
+    # свежий индекс не запрашивает exchangeInfo повторно, в том числе новый экземпляр (отметка в базе)
+    assert index.refresh(client) is None and SymbolIndex(ttl=3600).ensure(client).get('btcusdt')
+    assert client.calls == 1
+
+    client.symbols = SYMBOLS[:4] + [entry('BNBUSDT', 'BNB', 'USDT'), entry('SOLUSDT', 'SOL', 'USDT')]
+    stats = index.refresh(client, force=True)
+    assert stats == {'added': 1, 'updated': 1, 'removed': 1, 'unchanged': 4}
+    assert index.get('USDTTRY') is None and index.get('SOLUSDT')['status'] == 'TRADING'
+    assert index.get('BNBUSDT')['status'] == 'TRADING'
+
+    # ошибка сети не мешает работать с сохранённым индексом
+    client.symbols = requests.ConnectionError('offline')
+    stale = SymbolIndex(ttl=0).ensure(client)
+    assert stale.split('ethbtc') == ('ETH', 'BTC')
+
+
+def test_lookup_and_search():
+    init_db(engine)
+    index = SymbolIndex(ttl=3600)
+    index.refresh(FakeClient(SYMBOLS), force=True)
+    assert index.split('BTCEUR') == ('BTC', 'EUR') and index.split('NOPE') is None
+    assert [r['symbol'] for r in index.search('btc')] == ['BTCEUR', 'BTCUSDT']
+    # символы с префиксом, затем пары с таким базовым активом
+    assert [r['symbol'] for r in index.search('eth')] == ['ETHBTC', 'ETHUSDT']
+    assert [r['symbol'] for r in index.search('usdt')] == ['USDTTRY']
+    assert [r['symbol'] for r in index.search('BTC', quote='usdt')] == ['BTCUSDT']
+    assert [r['symbol'] for r in index.search('', status='break')] == ['BNBUSDT']
+    assert [r['symbol'] for r in index.search('')] == sorted(entry['symbol'] for entry in SYMBOLS)
+    # опечатка - похожие символы, а без fuzzy пусто
+    assert index.search('BTCUSTD')[0]['symbol'] == 'BTCUSDT'
+    assert index.search('BTCUSTD', fuzzy=False) == []
+    assert index.quotes() == ['BTC', 'EUR', 'TRY', 'USDT']
+
+
+def test_paginate_clamps_page():
+    items = list(range(25))
+    assert paginate(items, 0, 10) == (list(range(10)), 0, 3)
+    assert paginate(items, 7, 10) == ([20, 21, 22, 23, 24], 2, 3)
+    assert paginate([], 3, 10) == ([], 0, 1)
@@ -0,0 +1,47 @@
+# tests/test_valuation.py
+import numpy as np
+
+from valuation import fx_vector, value_holdings, format_money, format_in_currencies
+
+RATES = {"USD": 1.0, "EUR": 0.9, "RUB": 90.0}
+
+
+def test_value_holdings_matches_per_position_loop():
+    symbols = ["BTCUSDT", "ETHUSDT", "NOPRICE", "BTCUSDT"]
+    amounts = [0.5, 2.0, 10.0, 0.25]
+    prices = {"BTCUSDT": 60_000.0, "ETHUSDT": 3_000.0}
+    result = value_holdings(symbols, amounts, prices, RATES)
+
+    assert result['currencies'] == ("USD", "EUR", "RUB")
+    assert result['missing'] == ["NOPRICE"]
+    for row, (symbol, amount) in enumerate(zip(symbols, amounts)):
+        for column, currency in enumerate(result['currencies']):
+            expected = amount * prices.get(symbol, np.nan) * RATES[currency]
+            np.testing.assert_equal(result['values'][row, column], expected)
+    # позиция без цены в итог не входит
+    for currency, rate in RATES.items():
+        assert np.isclose(result['totals'][currency], (0.75 * 60_000 + 2 * 3_000) * rate)
+
+
+def test_price_array_and_empty_portfolio():
+    result = value_holdings(["A", "B"], [1.0, 3.0], [2.0, np.nan], RATES)
+    assert result['missing'] == ["B"]
+    assert result['totals'] == {"USD": 2.0, "EUR": 1.8, "RUB": 180.0}
+    empty = value_holdings([], [], {}, RATES)
+    assert empty['values'].shape == (0, 3)
+    assert empty['totals'] == {"USD": 0.0, "EUR": 0.0, "RUB": 0.0}
+
+
+def test_fx_vector_is_reused_until_rates_change():
+    rates = dict(RATES)
+    first = fx_vector(rates)
+    assert fx_vector(dict(RATES)) is first
+    rates["EUR"] = 0.8
+    currencies, fx = fx_vector(rates)
+    assert currencies == ("USD", "EUR", "RUB") and fx.tolist() == [1.0, 0.8, 90.0]
+
+
+def test_formatting():
+    assert format_money(1234.5, "EUR") == "EUR: 1,234.50 €"
+    assert format_money(1.0, "XYZ") == "XYZ: 1.00 XYZ"
+    assert format_in_currencies(10.0, {"USD": 1.0, "RUB": 90.0}) == "USD: 10.00 $\nRUB: 900.00 ₽"
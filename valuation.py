@@ -0,0 +1,62 @@
+# valuation.py
+import numpy as np
+
+from config import conversion_rates, currency_symbols
+
+_fx_cache = {}
+
+
+def fx_vector(rates: dict = None):
+    """
+    Курсы валют относительно USD в виде (кортеж валют, np.ndarray курсов); USD всегда первый.
+    Вектор строится один раз на набор курсов и переиспользуется, пока курсы не изменятся.
+    """
+    rates = conversion_rates if rates is None else rates
+    key = tuple(rates.items())
+    fx = _fx_cache.get(key)
+    if fx is None:
+        currencies = ("USD",) + tuple(curr for curr in rates if curr != "USD")
+        fx = (currencies, np.array([rates.get(curr, 1.0) for curr in currencies], dtype=np.float64))
+        _fx_cache.clear()
+        _fx_cache[key] = fx
+    return fx
+
+
+def value_holdings(symbols, amounts, prices, rates: dict = None) -> dict:
+    """
+    Оценивает позиции во всех валютах одним векторным шагом.
+    symbols/amounts - позиции портфеля, prices - словарь символ -> цена в USD
+    (или массив цен в порядке symbols). Символы без цены дают NaN и попадают в missing.
+    Возвращает словарь: currencies, symbols, amounts, prices (n x валюты), values (n x валюты),
+    totals - {валюта: сумма}, missing - символы без цены.
+    """
+    symbols = list(symbols)
+    currencies, fx = fx_vector(rates)
+    amounts = np.asarray(amounts, dtype=np.float64)
+    if isinstance(prices, dict):
+        prices_usd = np.fromiter((prices.get(symbol, np.nan) for symbol in symbols), np.float64, len(symbols))
+    else:
+        prices_usd = np.asarray(prices, dtype=np.float64)
+    values = np.outer(amounts * prices_usd, fx)
+    # сумма по позициям с ценой: пропуски (NaN) в итог не входят
+    totals = np.nansum(amounts * prices_usd) * fx
+    return {
+        'currencies': currencies,
+        'symbols': symbols,
+        'amounts': amounts,
+        'prices': np.outer(prices_usd, fx),
+        'values': values,
+        'totals': dict(zip(currencies, totals.tolist())),
+        'missing': [symbols[index] for index in np.flatnonzero(np.isnan(prices_usd)).tolist()],
+    }
+
+
+def format_money(amount: float, currency: str) -> str:
+    """Строка вида "Код: <сумма> <символ валюты>"."""
+    return f"{currency}: {amount:,.2f} {currency_symbols.get(currency, currency)}"
+
+
+def format_in_currencies(price_usd: float, rates: dict = None) -> str:
+    """Цена в USD и во всех остальных валютах, по строке на валюту."""
+    result = value_holdings([None], [1.0], [price_usd], rates)
+    return "\n".join(format_money(price, curr) for curr, price in zip(result['currencies'], result['prices'][0].tolist()))
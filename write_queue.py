@@ -0,0 +1,100 @@
+# write_queue.py
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from models import Session
+
+_STOP = object()
+
+
+class WriteQueue:
+    """
+    Единственный писатель в базу: задания от нескольких производителей (ингесторы, правки портфеля)
+    выполняются в одном фоновом потоке и фиксируются общим коммитом пачками до max_batch заданий,
+    собранных за max_delay секунд. Каждое задание выполняется в своём SAVEPOINT, поэтому ошибка
+    одного не откатывает остальные. submit возвращает Future с результатом задания.
+    """
+
+    def __init__(self, session_factory=None, max_batch: int = 256, max_delay: float = 0.02):
+        self.session_factory = session_factory or Session
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.stats = {'tasks': 0, 'commits': 0, 'errors': 0}
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='write-queue', daemon=True)
+                self._thread.start()
+
+    def submit(self, func, *args, **kwargs) -> Future:
+        """Ставит в очередь func(session, *args, **kwargs); коммит выполняет очередь."""
+        future = Future()
+        self._ensure_started()
+        self._queue.put((future, func, args, kwargs))
+        return future
+
+    def call(self, func, *args, **kwargs):
+        """Синхронный вариант submit: ждёт коммита и возвращает результат задания."""
+        return self.submit(func, *args, **kwargs).result()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._execute(batch)
+
+    def _execute(self, batch):
+        session = self.session_factory()
+        outcomes = []
+        try:
+            for future, func, args, kwargs in batch:
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    with session.begin_nested():
+                        outcomes.append((future, func(session, *args, **kwargs), None))
+                except Exception as e:
+                    outcomes.append((future, None, e))
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            outcomes = [(future, None, e) for future, _, _ in outcomes]
+        finally:
+            session.close()
+        self.stats['commits'] += 1
+        for future, result, error in outcomes:
+            self.stats['tasks'] += 1
+            if error is None:
+                future.set_result(result)
+            else:
+                self.stats['errors'] += 1
+                future.set_exception(error)
+
+    def close(self, timeout: float = 10.0):
+        """Дописывает уже поставленные задания и останавливает поток записи."""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+
+
+# Общая очередь записи процесса
+write_queue = WriteQueue()